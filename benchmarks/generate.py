@@ -0,0 +1,123 @@
+import random
+from datetime import date, timedelta
+from typing import Dict, List
+
+from tap_quickbooks_report.utils import first_of_month
+
+DETAIL_COLUMNS = [
+    ("Date", "tx_date"),
+    ("Transaction Type", "txn_type"),
+    ("Num", "doc_num"),
+    ("Name", "name"),
+    ("Memo/Description", "memo"),
+    ("Split", "split_acc"),
+    ("Amount", "subt_nat_amount"),
+    ("Balance", "rbal_nat_amount")
+]
+
+TRANSACTION_TYPES = ["Invoice", "Sales Receipt", "Bill", "Expense", "Journal Entry", "Deposit"]
+NAMES = ["Acme Grocers", "Bay Farms", "Landlord LLC", "Valley Produce", "Coastal Dairy", ""]
+SPLITS = ["Accounts Receivable", "Accounts Payable", "Undeposited Funds", "Checking", "-Split-"]
+
+
+def _money(value: float) -> str:
+    return f"{value:.2f}"
+
+
+def _section_paths(sections: int, depth: int) -> List[List[str]]:
+    '''Returns the category path of every leaf section, nesting
+    each top-level section `depth` levels deep.
+    '''
+    return [[f"Category {section}"] + [f"Category {section}.{level}" for level in range(1, depth)]
+            for section in range(sections)]
+
+
+def _nest(path: List[str], rows: List[Dict], summary: List[Dict]) -> Dict:
+    '''Wraps rows in one Section per entry of path, outermost first.'''
+    row = {"Header": {"ColData": [{"value": path[-1]}] + [{"value": ""}] * (len(summary) - 1)},
+           "Rows": {"Row": rows},
+           "Summary": {"ColData": summary},
+           "type": "Section"}
+    for title in reversed(path[:-1]):
+        row = {"Header": {"ColData": [{"value": title}] + [{"value": ""}] * (len(summary) - 1)},
+               "Rows": {"Row": [row]},
+               "Summary": {"ColData": summary},
+               "type": "Section"}
+    return row
+
+
+def generate_profit_and_loss(rows: int = 100, depth: int = 2, months: int = 12, sections: int = 4,
+                             start_date: date = date(2019, 1, 1), seed: int = 0) -> Dict:
+    '''Generates a ProfitAndLoss report summarized by month, with `rows`
+    accounts spread over `sections` sections nested `depth` levels deep.
+    '''
+    rng = random.Random(seed)
+    columns = [{"ColTitle": "", "ColType": "Account", "MetaData": [{"Name": "ColKey", "Value": "account"}]}]
+    for month in range(months):
+        month_start = first_of_month(start_date, month)
+        month_end = first_of_month(start_date, month + 1) - timedelta(days=1)
+        title = month_start.strftime("%b %Y")
+        columns.append({"ColTitle": title, "ColType": "Money", "MetaData": [
+            {"Name": "StartDate", "Value": month_start.isoformat()},
+            {"Name": "EndDate", "Value": month_end.isoformat()},
+            {"Name": "ColKey", "Value": title}
+        ]})
+    columns.append({"ColTitle": "Total", "ColType": "Money", "MetaData": [{"Name": "ColKey", "Value": "total"}]})
+
+    paths = _section_paths(max(sections, 1), max(depth, 1))
+    row_array = []
+    for index, path in enumerate(paths):
+        data_rows = []
+        totals = [0.0] * months
+        for row in range(index, rows, len(paths)):
+            values = [round(rng.uniform(0, 1000), 2) for _ in range(months)]
+            totals = [total + value for total, value in zip(totals, values)]
+            col_data = [{"value": f"Account {row}", "id": str(row)}]
+            col_data.extend({"value": _money(value)} for value in values)
+            col_data.append({"value": _money(sum(values))})
+            data_rows.append({"ColData": col_data, "type": "Data"})
+        summary = [{"value": f"Total {path[0]}"}]
+        summary.extend({"value": _money(total)} for total in totals)
+        summary.append({"value": _money(sum(totals))})
+        row_array.append(_nest(path, data_rows, summary))
+
+    return {
+        "Header": {"ReportName": "ProfitAndLoss", "SummarizeColumnsBy": "Month",
+                   "StartPeriod": start_date.isoformat(), "Currency": "USD"},
+        "Columns": {"Column": columns},
+        "Rows": {"Row": row_array}
+    }
+
+
+def generate_profit_and_loss_detail(rows: int = 1000, depth: int = 2, sections: int = 4,
+                                    start_date: date = date(2019, 1, 1), days: int = 365, seed: int = 0) -> Dict:
+    '''Generates a ProfitAndLossDetail report with `rows` transaction lines
+    spread over `sections` sections nested `depth` levels deep.
+    '''
+    rng = random.Random(seed)
+    paths = _section_paths(max(sections, 1), max(depth, 1))
+    row_array = []
+    for index, path in enumerate(paths):
+        data_rows = []
+        balance = 0.0
+        for row in range(index, rows, len(paths)):
+            amount = round(rng.uniform(-500, 1500), 2)
+            balance += amount
+            data_rows.append({"ColData": [
+                {"value": (start_date + timedelta(days=rng.randrange(days))).isoformat()},
+                {"value": rng.choice(TRANSACTION_TYPES), "id": str(row)},
+                {"value": str(1000 + row) if rng.random() < 0.7 else ""},
+                {"value": rng.choice(NAMES)},
+                {"value": f"Memo {row}" if rng.random() < 0.5 else ""},
+                {"value": rng.choice(SPLITS)},
+                {"value": _money(amount)},
+                {"value": _money(balance)}
+            ], "type": "Data"})
+        summary = [{"value": f"Total for {path[-1]}"}] + [{"value": ""}] * 5 + [{"value": _money(balance)}, {"value": ""}]
+        row_array.append(_nest(path, data_rows, summary))
+
+    return {
+        "Header": {"ReportName": "ProfitAndLossDetail", "StartPeriod": start_date.isoformat(), "Currency": "USD"},
+        "Columns": {"Column": [{"ColTitle": title, "ColType": col_type} for title, col_type in DETAIL_COLUMNS]},
+        "Rows": {"Row": row_array}
+    }
@@ -0,0 +1,198 @@
+'''Benchmarks the tap's report streams against synthetic reports served
+from a local stand-in for the Quickbooks API.
+
+    python -m benchmarks.run --detail-rows 50000 --baseline benchmarks/baseline.json
+
+Prints throughput, peak memory and per-stage timings for every scenario as
+JSON. With --baseline, exits non-zero if the baseline is missing or if any
+scenario's throughput or peak memory regressed past it by more than
+--tolerance. With
+--save-baseline, writes the results as the new baseline instead.
+'''
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+import tracemalloc
+from datetime import date
+from typing import Any, Callable, Dict, List, Optional
+
+import singer
+
+from tap_quickbooks_report.auth import CachedAuthClient
+from tap_quickbooks_report.parsing import ijson
+from tap_quickbooks_report.streams import (ProfitAndLossDetailStream,
+                                           ProfitAndLossStream)
+from tap_quickbooks_report.writer import MessageWriter
+
+from .generate import generate_profit_and_loss, generate_profit_and_loss_detail
+from .server import ReportServer
+
+REALM_ID = "123456"
+REPORT_WINDOW = (date(2019, 1, 1), date(2019, 12, 31))
+DEFAULT_TOLERANCE = 0.2
+
+SCENARIOS = {
+    "profit_and_loss": (ProfitAndLossStream, {}),
+    "profit_and_loss_detail": (ProfitAndLossDetailStream, {}),
+    "profit_and_loss_detail_streaming": (ProfitAndLossDetailStream, {"stream_responses": True})
+}
+
+
+def _build_stream(stream_class, base_url: str, config: Dict, output) -> Any:
+    config = {"environment": "production", "realm_id": REALM_ID, **config}
+    stream = stream_class(config=config, args=argparse.Namespace(config_path=None, state={}),
+                          writer=MessageWriter(output=output))
+    stream.base_url = base_url
+    stream._get_auth_client = lambda: CachedAuthClient(realm_id=REALM_ID, access_token="token")
+    stream._get_report_period = lambda: REPORT_WINDOW
+    return stream
+
+
+def _flatten(stream: Any, report) -> List:
+    if isinstance(stream, ProfitAndLossDetailStream):
+        return list(stream._get_detail_rows(*report))
+    return stream._get_records(report)
+
+
+def _emit(stream: Any, rows: List, counter):
+    if isinstance(stream, ProfitAndLossDetailStream):
+        rows = [row.to_dict() for row in rows]
+    stream._write_records(rows, counter)
+
+
+def _time(function: Callable):
+    started_at = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - started_at
+
+
+def run_scenario(stream_class, base_url: str, config: Dict, repeat: int) -> Dict:
+    '''Runs a stream's sync `repeat` times and once more under tracemalloc,
+    then times the fetch, flatten and emit stages of a single report.
+    '''
+    with open(os.devnull, "w") as output:
+        timings = []
+        for _ in range(repeat):
+            stream = _build_stream(stream_class, base_url, config, output)
+            _, seconds = _time(stream.sync)
+            timings.append(seconds)
+        records = stream.writer.record_count
+
+        tracemalloc.start()
+        try:
+            _build_stream(stream_class, base_url, config, output).sync()
+            peak_memory = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        stream = _build_stream(stream_class, base_url, config, output)
+        auth_client = stream._get_auth_client()
+        report, fetch_seconds = _time(lambda: stream._get_window(auth_client, REPORT_WINDOW))
+        rows, flatten_seconds = _time(lambda: _flatten(stream, report))
+        with singer.metrics.record_counter(endpoint=stream.tap_stream_id) as counter:
+            _, emit_seconds = _time(lambda: _emit(stream, rows, counter))
+
+    seconds = min(timings)
+    return {
+        "records": records,
+        "seconds": round(seconds, 4),
+        "records_per_second": round(records / seconds, 1) if seconds else None,
+        "peak_memory_mb": round(peak_memory / 1024 ** 2, 2),
+        "stages": {
+            "fetch": round(fetch_seconds, 4),
+            "flatten": round(flatten_seconds, 4),
+            "emit": round(emit_seconds, 4)
+        }
+    }
+
+
+def run(detail_rows: int = 20000, rows: int = 500, depth: int = 3, months: int = 12, sections: int = 8,
+        repeat: int = 3, scenarios: Optional[List[str]] = None) -> Dict:
+    '''Generates synthetic reports, serves them locally
+    and benchmarks every requested scenario.
+    '''
+    parameters = {"detail_rows": detail_rows, "rows": rows, "depth": depth, "months": months,
+                  "sections": sections, "repeat": repeat}
+    reports = {
+        "ProfitAndLoss": generate_profit_and_loss(rows=rows, depth=depth, months=months, sections=sections),
+        "ProfitAndLossDetail": generate_profit_and_loss_detail(rows=detail_rows, depth=depth, sections=sections)
+    }
+    results: Dict = {"parameters": parameters, "scenarios": {}}
+    with ReportServer(reports) as server:
+        for name in scenarios or list(SCENARIOS):
+            stream_class, config = SCENARIOS[name]
+            if config.get("stream_responses") and ijson is None:
+                continue
+            results["scenarios"][name] = run_scenario(stream_class, server.base_url, config, repeat)
+    return results
+
+
+def check_regressions(results: Dict, baseline: Dict, tolerance: float = DEFAULT_TOLERANCE) -> List[str]:
+    '''Returns a message for every scenario whose throughput dropped, or whose
+    peak memory grew, by more than `tolerance` relative to the baseline.
+    '''
+    if results.get("parameters") != baseline.get("parameters"):
+        return ["Benchmark parameters differ from the baseline's, so their results are not comparable."]
+
+    regressions = []
+    for name, expected in baseline.get("scenarios", {}).items():
+        actual = results["scenarios"].get(name)
+        if actual is None:
+            continue
+        # A run too fast to time has no throughput to compare.
+        if actual["records_per_second"] is not None and expected["records_per_second"] is not None \
+                and actual["records_per_second"] < expected["records_per_second"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput fell from {expected['records_per_second']} "
+                               f"to {actual['records_per_second']} records/second.")
+        if actual["peak_memory_mb"] > expected["peak_memory_mb"] * (1 + tolerance):
+            regressions.append(f"{name}: peak memory grew from {expected['peak_memory_mb']} "
+                               f"to {actual['peak_memory_mb']} MB.")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the tap against synthetic reports.")
+    parser.add_argument("--detail-rows", type=int, default=20000, help="Transaction lines in the detail report")
+    parser.add_argument("--rows", type=int, default=500, help="Accounts in the summary report")
+    parser.add_argument("--depth", type=int, default=3, help="Section nesting depth")
+    parser.add_argument("--months", type=int, default=12, help="Month columns in the summary report")
+    parser.add_argument("--sections", type=int, default=8, help="Top-level sections per report")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per scenario; the fastest is reported")
+    parser.add_argument("--scenario", action="append", choices=list(SCENARIOS), help="Scenario to run; repeatable")
+    parser.add_argument("--baseline", help="Baseline results file to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="Write the results to --baseline")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="Fraction by which results may regress before the run fails")
+    args = parser.parse_args(argv)
+
+    # Keep the tap's own logging from drowning out the results.
+    logging.disable(logging.INFO)
+
+    results = run(detail_rows=args.detail_rows, rows=args.rows, depth=args.depth, months=args.months,
+                  sections=args.sections, repeat=args.repeat, scenarios=args.scenario)
+    json.dump(results, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+    if not args.baseline:
+        return 0
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+        return 0
+    if not os.path.exists(args.baseline):
+        sys.stderr.write(f"No baseline at {args.baseline}; run with --save-baseline to record one.\n")
+        return 1
+
+    with open(args.baseline) as f:
+        regressions = check_regressions(results, json.load(f), tolerance=args.tolerance)
+    for regression in regressions:
+        sys.stderr.write(f"REGRESSION {regression}\n")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
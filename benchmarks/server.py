@@ -0,0 +1,118 @@
+import gzip
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from typing import Dict, List, Optional
+
+HOST = "127.0.0.1"
+TOKEN_PATH = "/oauth2/v1/tokens/bearer"
+DISCOVERY_PATH = "/.well-known/openid_configuration/"
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class ReportServer:
+    '''A local stand-in for the Quickbooks reports endpoint. Serves a fixed
+    JSON body per report entity from
+    `/v3/company/<realm_id>/reports/<entity>`, gzip compressed when the
+    client accepts it, on a background thread. Each response is held back
+    for `delay` seconds, and the status codes queued in `failures` for an
+    entity are returned before its body. Token refreshes POSTed to
+    TOKEN_PATH are answered with `token`, and DISCOVERY_PATH serves an
+    OAuth2.0 discovery document naming TOKEN_PATH as the token endpoint.
+    '''
+
+    def __init__(self, reports: Dict[str, Dict], delay: float = 0, token: Optional[Dict] = None):
+        self.bodies = {entity: json.dumps(report).encode() for entity, report in reports.items()}
+        self.compressed_bodies = {entity: gzip.compress(body) for entity, body in self.bodies.items()}
+        self.delay = delay
+        self.token = token or {"access_token": "access-token", "refresh_token": "refresh-token",
+                               "expires_in": 3600, "x_refresh_token_expires_in": 8726400}
+        self.failures: Dict[str, List[int]] = {}
+        self.request_count = 0
+        self.token_requests: List[str] = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        self._server = _ThreadingHTTPServer((HOST, 0), self._make_handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{HOST}:{self._server.server_port}"
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def send_empty(self, status: int):
+                self.send_response(status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def send_json(self, content: bytes):
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def do_GET(self):
+                if self.path == DISCOVERY_PATH:
+                    self.send_json(json.dumps({"token_endpoint": server.base_url + TOKEN_PATH}).encode())
+                    return
+                entity = self.path.split("?", 1)[0].rstrip("/").rsplit("/", 1)[-1]
+                with server._lock:
+                    server.request_count += 1
+                    server.in_flight += 1
+                    server.max_in_flight = max(server.max_in_flight, server.in_flight)
+                    failures = server.failures.get(entity)
+                    status = failures.pop(0) if failures else None
+                try:
+                    time.sleep(server.delay)
+                    if status is not None or entity not in server.bodies:
+                        self.send_empty(status or 404)
+                    else:
+                        self.send_body(entity)
+                finally:
+                    with server._lock:
+                        server.in_flight -= 1
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode()
+                if self.path != TOKEN_PATH:
+                    self.send_empty(404)
+                    return
+                with server._lock:
+                    server.token_requests.append(body)
+                self.send_json(json.dumps(server.token).encode())
+
+            def send_body(self, entity: str):
+                compress = "gzip" in self.headers.get("Accept-Encoding", "")
+                body = server.compressed_bodies[entity] if compress else server.bodies[entity]
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                if compress:
+                    self.send_header("Content-Encoding", "gzip")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self) -> "ReportServer":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
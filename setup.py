@@ -29,13 +29,12 @@ setup(
         'Intended Audience :: Developers',
         'Operating System :: OS Independent',
         'Programming Language :: Python :: 3 :: Only',
-        'Programming Language :: Python :: 3.6',
         'Programming Language :: Python :: 3.7',
         'Programming Language :: Python :: 3.8'
     ],
     keywords="singer tap python quickbooks report",
     license='GPLv3',
-    packages=find_packages(exclude=['tests']),
+    packages=find_packages(exclude=['tests', 'benchmarks']),
     package_data={
         'tap_quickbooks_report': ['schemas/*.json']
     },
@@ -47,7 +46,13 @@ setup(
         'rollbar==0.14.7',
         'backoff==1.8.0'
     ],
-    python_requires='>=3.6',
+    extras_require={
+        'streaming': ['ijson>=3.0'],
+        'speedups': ['orjson>=3.0'],
+        'parquet': ['pyarrow>=1.0'],
+        'async': ['aiohttp>=3.0']
+    },
+    python_requires='>=3.7',
     entry_points={
         'console_scripts': ['tap-quickbooks-report = tap_quickbooks_report:main']
     }
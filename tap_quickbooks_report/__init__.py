@@ -1,26 +1,23 @@
+import json
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 
-import rollbar
 import singer
 
-from .streams import (ProfitAndLossDetailStream, ProfitAndLossStream,
-                      QuickbooksStream)
-from .utils import parse_args
+from .catalog import discover, get_selected_streams
+from .profiling import Profiler
+from .ratelimit import get_throttle_stats
+from .state import State
+from .streams import (QuickbooksStream, build_session, build_transform_pool,
+                      build_transport, get_report_streams)
+from .utils import get_realm_configs, parse_args
+from .writer import MessageWriter
 
 LOGGER = singer.get_logger()
 
 
-try:
-    ROLLBAR_ACCESS_TOKEN = os.environ["ROLLBAR_ACCESS_TOKEN"]
-    ROLLBAR_ENVIRONMENT = os.environ["ROLLBAR_ENVIRONMENT"]
-except KeyError:
-    LOGGER.info("No Rollbar environment variables found. Rollbar logging disabled..")
-    log_to_rollbar = False
-else:
-    rollbar.init(ROLLBAR_ACCESS_TOKEN, ROLLBAR_ENVIRONMENT)
-    log_to_rollbar = True
-
 AUTH_REQUIRED_CONFIG_KEYS = [
     "client_id",
     "client_secret",
@@ -32,12 +29,12 @@ SYNC_REQUIRED_CONFIG_KEYS = [
     "client_id",
     "client_secret",
     "environment",
-    "redirect_uri",
-    "realm_id",
-    "refresh_token",
-    "refresh_token_expires_at"
+    "redirect_uri"
 ]
 
+DEFAULT_MAX_CONCURRENT_REALMS = 4
+DEFAULT_MAX_CONCURRENT_STREAMS = 4
+
 
 def user_consent(config, args):
     LOGGER.info('Starting User Consent process..')
@@ -45,32 +42,112 @@ def user_consent(config, args):
     stream.user_consent()
 
 
+def log_throttle_stats():
+    for realm_id, stats in get_throttle_stats().items():
+        for metric, value in stats.items():
+            singer.metrics.log(LOGGER, singer.metrics.Point("counter", metric, value, {"realm_id": realm_id}))
+
+
+def sync_realm(streams):
+    # Streams share one writer, which serialises their messages.
+    config = streams[0].config
+    LOGGER.info(f"Syncing realm {config.get('realm_id')}..")
+    max_concurrent_streams = max(int(config.get("max_concurrent_streams", DEFAULT_MAX_CONCURRENT_STREAMS)), 1)
+    with ThreadPoolExecutor(max_workers=min(max_concurrent_streams, len(streams))) as executor:
+        futures = [executor.submit(stream.sync) for stream in streams]
+        for future in futures:
+            future.result()
+
+
 def sync(config, args):
     LOGGER.info('Starting sync..')
-    stream = ProfitAndLossStream(config=config, args=args)
-    stream.write_schema_message()
-    stream.sync()
-    stream = ProfitAndLossDetailStream(config=config, args=args)
-    stream.write_schema_message()
-    stream.sync()
+    realm_configs = get_realm_configs(config)
+    catalog = getattr(args, "catalog", None) or getattr(args, "properties", None)
+    if catalog:
+        selected_streams = get_selected_streams(catalog)
+    else:
+        selected_streams = [(stream_class, None) for stream_class in get_report_streams(config)]
+    if not selected_streams:
+        LOGGER.info("No streams selected..")
+        return
+    max_concurrent_realms = max(int(config.get("max_concurrent_realms", DEFAULT_MAX_CONCURRENT_REALMS)), 1)
+    writer = MessageWriter.from_config(config)
+    session = build_session(config)
+    transport = build_transport(config)
+    transform_pool = build_transform_pool(config)
+    state = State(args.state, writer=writer)
+    profiler = Profiler.from_config(config)
+    try:
+        # Every realm shares one table version, so activating it after
+        # all realms finish keeps each realm's rows in the target.
+        version = int(datetime.utcnow().timestamp())
+        realm_streams = [[stream_class(config=realm_config, args=args, writer=writer, session=session,
+                                       state=state, version=version, selected_properties=selected_properties,
+                                       profiler=profiler, transport=transport, transform_pool=transform_pool)
+                          for stream_class, selected_properties in selected_streams]
+                         for realm_config in realm_configs]
+
+        for stream in realm_streams[0]:
+            stream.write_schema_message()
+
+        if transport is not None:
+            # Requests wait on the transport's event loop rather than on threads,
+            # so every realm's reports are requested at once, and the realm and
+            # stream threads below only decode, transform and write them.
+            for streams in realm_streams:
+                for stream in streams:
+                    stream.prefetch()
+
+        with ThreadPoolExecutor(max_workers=max_concurrent_realms) as executor:
+            list(executor.map(sync_realm, realm_streams))
+
+        for stream in realm_streams[0]:
+            stream.write_version_message()
+
+        log_throttle_stats()
+        profiler.log_metrics()
+        if config.get("profile_path"):
+            profiler.write_profile(config["profile_path"])
+    finally:
+        session.close()
+        if transport is not None:
+            transport.close()
+        if transform_pool is not None:
+            transform_pool.close()
+        writer.close()
 
 
 def _main():
     args = parse_args(required_config_keys=AUTH_REQUIRED_CONFIG_KEYS)
     if args.auth is True:
         user_consent(config=args.config, args=args)
+    elif args.discover is True:
+        json.dump(discover(args.config), sys.stdout, indent=2)
     else:
         args = parse_args(required_config_keys=SYNC_REQUIRED_CONFIG_KEYS)
         sync(config=args.config, args=args)
 
 
+def report_to_rollbar():
+    '''Reports the exception being handled to Rollbar. Rollbar is only
+    imported and initialised here, so runs that succeed never load it.
+    '''
+    import rollbar
+
+    LOGGER.info("Reporting exception info to Rollbar..")
+    rollbar.init(os.environ["ROLLBAR_ACCESS_TOKEN"], os.environ["ROLLBAR_ENVIRONMENT"])
+    rollbar.report_exc_info()
+
+
 def main():
+    log_to_rollbar = "ROLLBAR_ACCESS_TOKEN" in os.environ and "ROLLBAR_ENVIRONMENT" in os.environ
+    if not log_to_rollbar:
+        LOGGER.info("No Rollbar environment variables found. Rollbar logging disabled..")
     try:
         _main()
     except Exception:
         if log_to_rollbar is True:
-            LOGGER.info("Reporting exception info to Rollbar..")
-            rollbar.report_exc_info()
+            report_to_rollbar()
         LOGGER.exception(msg="Uncaught Exception..")
         sys.exit(1)
 
@@ -0,0 +1,93 @@
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+import attr
+import singer
+
+from .utils import load_json, write_json_atomic
+
+LOGGER = singer.get_logger()
+
+# Access Tokens are treated as expired this many seconds early, so a
+# token is never handed to a request that could outlive it.
+EXPIRY_MARGIN_SECONDS = 300
+
+
+@attr.s(frozen=True)
+class CachedAuthClient:
+    '''Stands in for an AuthClient when a cached Access Token is reused.
+    Building a real AuthClient fetches the OAuth discovery document, so
+    reusing a token this way avoids every OAuth round trip.
+    '''
+    realm_id: str = attr.ib()
+    access_token: str = attr.ib()
+
+
+@attr.s(frozen=True)
+class RefreshedAuthClient:
+    '''Holds the tokens issued by a refresh made without intuitlib,
+    with the same attributes as an AuthClient after a refresh.
+    '''
+    realm_id: str = attr.ib()
+    access_token: str = attr.ib()
+    refresh_token: str = attr.ib()
+    expires_in: int = attr.ib()
+    x_refresh_token_expires_in: int = attr.ib()
+
+
+class TokenCache:
+    '''Caches OAuth2.0 Access Tokens by Realm ID so that every stream
+    in a process, and optionally consecutive runs sharing a cache file,
+    reuse a token until it expires instead of refreshing it again.
+    '''
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._tokens: Dict[str, Dict] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        if path is not None and os.path.exists(path):
+            try:
+                self._tokens = load_json(path)
+            except ValueError:
+                LOGGER.warning(f"Ignoring unreadable token cache file {path}.")
+
+    def lock(self, realm_id: str) -> threading.Lock:
+        '''Returns the lock serialising token refreshes for a realm.'''
+        with self._lock:
+            return self._locks.setdefault(realm_id, threading.Lock())
+
+    def get_access_token(self, realm_id: str) -> Optional[str]:
+        '''Returns the cached Access Token for a realm,
+        or None if there is none or it has expired.
+        '''
+        token = self._tokens.get(realm_id)
+        if token is None or token.get("expires_at", 0) - EXPIRY_MARGIN_SECONDS <= time.time():
+            return None
+        return token.get("access_token")
+
+    def set_access_token(self, realm_id: str, access_token: str, expires_in: int):
+        '''Caches a freshly issued Access Token for a realm.'''
+        with self._lock:
+            self._tokens[realm_id] = {
+                "access_token": access_token,
+                "expires_at": time.time() + expires_in
+            }
+            if self.path is not None:
+                write_json_atomic(self.path, self._tokens, mode=0o600)
+
+
+_TOKEN_CACHES: Dict[Optional[str], TokenCache] = {}
+_TOKEN_CACHES_LOCK = threading.Lock()
+
+
+def get_token_cache(path: Optional[str] = None) -> TokenCache:
+    '''Returns the process-wide token cache backed by the given file,
+    or held only in memory when no path is given.
+    '''
+    with _TOKEN_CACHES_LOCK:
+        if path not in _TOKEN_CACHES:
+            _TOKEN_CACHES[path] = TokenCache(path)
+        return _TOKEN_CACHES[path]
@@ -0,0 +1,156 @@
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import IO, Dict, List, NamedTuple, Optional, Tuple
+
+import singer
+
+from .utils import load_json, write_json_atomic
+
+LOGGER = singer.get_logger()
+
+DEFAULT_CACHE_TTL = 3600
+DEFAULT_CACHE_MAX_BYTES = 1024 ** 3
+CHUNK_SIZE = 1024 * 1024
+
+
+class CacheEntry(NamedTuple):
+    '''A cached report response body.'''
+    key: str
+    path: str
+    content_hash: str
+    fetched_at: float
+
+
+class ResponseCache:
+    '''Caches gzip-compressed report response bodies on disk, keyed by
+    realm, report entity and request parameters. Entries younger than
+    `ttl` seconds are served instead of fetching the report again, and
+    once the cache holds more than `max_bytes` the least recently used
+    entries are evicted. Every entry records a SHA-256 hash of its
+    uncompressed body, so a re-fetched report can be compared with the
+    copy it replaces. Bodies are stored under their hash and only become
+    visible once the entry's metadata points at them, so an interrupted
+    write never pairs a body with another body's hash.
+    '''
+
+    def __init__(self, path: str, ttl: float = DEFAULT_CACHE_TTL, max_bytes: int = DEFAULT_CACHE_MAX_BYTES):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    @classmethod
+    def from_config(cls, config: Dict) -> Optional["ResponseCache"]:
+        '''Builds a cache from the `cache_path`, `cache_ttl` and
+        `cache_max_bytes` config values, or returns None when
+        no cache_path is configured.
+        '''
+        if not config.get("cache_path"):
+            return None
+        return cls(path=config["cache_path"],
+                   ttl=float(config.get("cache_ttl", DEFAULT_CACHE_TTL)),
+                   max_bytes=int(config.get("cache_max_bytes", DEFAULT_CACHE_MAX_BYTES)))
+
+    def make_key(self, realm_id: str, report_entity: str, params: Optional[Dict] = None) -> str:
+        '''Returns the cache key for a report request.'''
+        request = {"realm_id": str(realm_id), "report_entity": report_entity,
+                   "params": {str(k): str(v) for k, v in (params or {}).items()}}
+        return hashlib.sha256(json.dumps(request, sort_keys=True).encode()).hexdigest()
+
+    def _data_path(self, key: str, content_hash: str) -> str:
+        return os.path.join(self.path, f"{key}.{content_hash}.json.gz")
+
+    def _meta_path(self, key: str) -> str:
+        return os.path.join(self.path, f"{key}.meta.json")
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        '''Returns the entry cached under key, fresh or not,
+        or None if nothing is cached under it.
+        '''
+        try:
+            meta = load_json(self._meta_path(key))
+        except (OSError, ValueError):
+            return None
+        path = self._data_path(key, meta["content_hash"])
+        if not os.path.exists(path):
+            return None
+        return CacheEntry(key=key, path=path, content_hash=meta["content_hash"], fetched_at=meta["fetched_at"])
+
+    def is_fresh(self, entry: CacheEntry) -> bool:
+        '''Returns whether an entry is young enough to be served.'''
+        return time.time() - entry.fetched_at < self.ttl
+
+    def open(self, entry: CacheEntry) -> gzip.GzipFile:
+        '''Opens an entry's uncompressed body for reading,
+        marking the entry as recently used.
+        '''
+        try:
+            os.utime(entry.path)
+        except OSError:
+            pass
+        return gzip.GzipFile(entry.path, "rb")
+
+    def put(self, key: str, body: IO[bytes]) -> CacheEntry:
+        '''Copies a response body into the cache in chunks,
+        hashing it on the way, and returns the new entry.
+        '''
+        previous = self.get(key)
+        content_hash = hashlib.sha256()
+        fd, temp_path = tempfile.mkstemp(dir=self.path, prefix=".tmp-", suffix=".json.gz")
+        try:
+            with os.fdopen(fd, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb") as compressed:
+                for chunk in iter(lambda: body.read(CHUNK_SIZE), b""):
+                    content_hash.update(chunk)
+                    compressed.write(chunk)
+            path = self._data_path(key, content_hash.hexdigest())
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        entry = CacheEntry(key=key, path=path, content_hash=content_hash.hexdigest(), fetched_at=time.time())
+        write_json_atomic(self._meta_path(key), {"content_hash": entry.content_hash, "fetched_at": entry.fetched_at})
+        if previous is not None and previous.path != entry.path:
+            try:
+                os.remove(previous.path)
+            except OSError:
+                pass
+        self.evict(keep=key)
+        return entry
+
+    def evict(self, keep: Optional[str] = None):
+        '''Removes least recently used entries until the cache
+        fits within max_bytes, never removing the entry under keep.
+        '''
+        with self._lock:
+            entries: List[Tuple[float, int, str, str]] = []
+            for entry in os.scandir(self.path):
+                if not entry.name.endswith(".json.gz") or entry.name.startswith(".tmp-"):
+                    continue
+                key = entry.name.split(".", 1)[0]
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, key, entry.path))
+
+            total_bytes = sum(size for _, size, _, _ in entries)
+            for _, size, key, path in sorted(entries):
+                if total_bytes <= self.max_bytes:
+                    break
+                if key == keep:
+                    continue
+                total_bytes -= size
+                for stale_path in (path, self._meta_path(key)):
+                    try:
+                        os.remove(stale_path)
+                    except OSError:
+                        pass
+                LOGGER.info(f"Evicted cached report {key}.")
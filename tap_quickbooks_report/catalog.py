@@ -0,0 +1,66 @@
+from typing import Dict, List, Optional, Tuple, Type
+
+from singer import metadata
+
+from .streams import DEFAULT_REPORTS, REPORT_STREAMS, QuickbooksStream
+
+
+def discover(config: Dict) -> Dict:
+    '''Builds a catalog of every report stream. The default reports
+    are selected by default, and the key properties and properties
+    the tap adds itself are always included. Only streams supporting a
+    single replication method force it, since the others are switched
+    to INCREMENTAL through the `replication_method` config value.
+    '''
+    streams = []
+    for tap_stream_id, stream_class in REPORT_STREAMS.items():
+        schema = stream_class.get_schema(config)
+        key_properties = stream_class.get_key_properties(config)
+        forced_replication_method = stream_class.replication_method if len(stream_class.replication_methods) == 1 else None
+        mdata = metadata.to_map(metadata.get_standard_metadata(schema=schema,
+                                                               key_properties=key_properties,
+                                                               replication_method=forced_replication_method))
+        mdata = metadata.write(mdata, (), "selected-by-default", tap_stream_id in DEFAULT_REPORTS)
+        for name in stream_class.get_automatic_properties(config):
+            if name in schema["properties"]:
+                mdata = metadata.write(mdata, ("properties", name), "inclusion", "automatic")
+        streams.append({
+            "tap_stream_id": tap_stream_id,
+            "stream": stream_class.stream,
+            "schema": schema,
+            "key_properties": key_properties,
+            "metadata": metadata.to_list(mdata)
+        })
+    return {"streams": streams}
+
+
+def _is_selected(mdata: Dict, breadcrumb: Tuple) -> Optional[bool]:
+    selected = metadata.get(mdata, breadcrumb, "selected")
+    if selected is None:
+        return metadata.get(mdata, breadcrumb, "selected-by-default")
+    return selected
+
+
+def get_selected_streams(catalog: Dict) -> List[Tuple[Type[QuickbooksStream], List[str]]]:
+    '''Returns the stream class of every stream selected in a catalog,
+    along with the properties selected for it. Properties are left out
+    only when they are explicitly deselected or unsupported.
+    '''
+    selected_streams = []
+    for entry in catalog.get("streams", []):
+        stream_class = REPORT_STREAMS.get(entry["tap_stream_id"])
+        if stream_class is None:
+            raise ValueError(f"Unknown stream {entry['tap_stream_id']} in catalog. "
+                             f"Available streams are {list(REPORT_STREAMS)}.")
+        mdata = metadata.to_map(entry.get("metadata", []))
+        if not _is_selected(mdata, ()):
+            continue
+
+        selected_properties = []
+        for name in entry.get("schema", {}).get("properties", {}):
+            breadcrumb = ("properties", name)
+            inclusion = metadata.get(mdata, breadcrumb, "inclusion")
+            if inclusion == "automatic" or (inclusion != "unsupported" and metadata.get(mdata, breadcrumb, "selected") is not False):
+                selected_properties.append(name)
+        selected_streams.append((stream_class, selected_properties))
+    return selected_streams
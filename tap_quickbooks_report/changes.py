@@ -0,0 +1,156 @@
+import hashlib
+import os
+import shutil
+from datetime import date
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, Optional, Tuple, Type
+
+from .rows import DetailRow
+from .utils import load_json, write_json_atomic
+
+# Properties identifying detail records, added when they are keyed by RowId.
+ROW_ID_PROPERTIES = {
+    "RowId": {"type": ["null", "string"]},
+    "TransactionId": {"type": ["null", "string"]}
+}
+
+# Properties added to detail records when change capture is enabled.
+CHANGE_CAPTURE_PROPERTIES = {
+    **ROW_ID_PROPERTIES,
+    "_sdc_deleted_at": {"type": ["null", "string"], "format": "date-time"}
+}
+
+
+def _digest(text: str) -> str:
+    return hashlib.blake2b(text.encode(), digest_size=8).hexdigest()
+
+
+@lru_cache(maxsize=None)
+def _get_fingerprint_indexes(row_type: Type[DetailRow], exclude: Tuple[str, ...]) -> Tuple[int, ...]:
+    return tuple(index for index, field in enumerate(row_type._fields) if field not in exclude)
+
+
+def get_fingerprint(row: DetailRow, exclude: Tuple[str, ...] = ()) -> str:
+    '''Hashes the values of a row other than the columns in exclude, so
+    that any change to them changes its fingerprint. Derived columns, such
+    as running balances, are excluded so that a change to one row does
+    not change the fingerprints of the rows after it.
+    '''
+    if not exclude:
+        return _digest(repr(tuple(row)))
+    return _digest(repr(tuple(row[index] for index in _get_fingerprint_indexes(type(row), exclude))))
+
+
+def get_row_ids(rows: Iterable[DetailRow], exclude: Tuple[str, ...] = ()) -> Iterator[Tuple[str, DetailRow]]:
+    '''Yields a stable id for every row of a report, along with the row.
+
+    A row is identified by its transaction's type and id, its categories
+    and its position among the report's rows sharing them. Every row of a
+    transaction falls on its date, so the id does not depend on how the
+    period was split into windows. Rows without a transaction are
+    identified by their fingerprint, leaving out the columns in exclude,
+    so a change to one of them shows up as a deletion and an insertion.
+    '''
+    occurrences: Dict[str, int] = {}
+    row_type = None
+    for row in rows:
+        if type(row) is not row_type:
+            row_type = type(row)
+            id_index = row._fields.index("TransactionId")
+            type_index = row._fields.index("TransactionType") if "TransactionType" in row._fields else None
+            categories_index = row._fields.index("Categories")
+        transaction_id = row[id_index]
+        if transaction_id is None:
+            transaction = get_fingerprint(row, exclude)
+        else:
+            transaction = f"{row[type_index] if type_index is not None else ''}:{transaction_id}"
+        identity = "\x1f".join([transaction, *row[categories_index]])
+        occurrence = occurrences.get(identity, 0)
+        occurrences[identity] = occurrence + 1
+        yield _digest(f"{identity}\x1f{occurrence}"), row
+
+
+def diff_rows(rows: Iterable[DetailRow], previous: Optional[Dict[str, str]], fingerprints: Dict[str, str],
+              exclude: Tuple[str, ...] = ()) -> Iterator[Tuple[str, DetailRow]]:
+    '''Yields the id of every row of a date window that is new or has
+    changed since the previous run, along with the row, and records the
+    fingerprint of every row in fingerprints. Changes to the columns in
+    exclude alone are not reported.
+    '''
+    for row_id, row in get_row_ids(rows, exclude):
+        fingerprint = get_fingerprint(row, exclude)
+        fingerprints[row_id] = fingerprint
+        if previous is None or previous.get(row_id) != fingerprint:
+            yield row_id, row
+
+
+class ChangeIndex:
+    '''The fingerprints of the rows written for each date window of a
+    stream by previous runs, kept as one JSON file per window and run
+    under `<change_capture_path>/<stream>/<realm_id>/<window start>/`.
+
+    Each run saves a new generation of a window's index and names it in
+    the STATE message written after the window. An index is only used
+    once the State file passed to a later run names its generation, so
+    rows are not skipped before the target has confirmed loading them.
+    '''
+
+    def __init__(self, path: str):
+        self.path = path
+
+    @classmethod
+    def from_config(cls, config: Dict, tap_stream_id: str) -> Optional["ChangeIndex"]:
+        '''Builds the index of a stream, or returns None when
+        the `change_capture_path` config value is not set.
+        '''
+        path = config.get("change_capture_path")
+        if not path:
+            return None
+        return cls(os.path.join(path, tap_stream_id, str(config.get("realm_id"))))
+
+    def _get_window_dir(self, window: Tuple[date, date]) -> str:
+        return os.path.join(self.path, window[0].isoformat())
+
+    def _get_window_path(self, window: Tuple[date, date], generation: str) -> str:
+        return os.path.join(self._get_window_dir(window), f"{generation}.json")
+
+    def load(self, window: Tuple[date, date], generation: Optional[str]) -> Optional[Dict[str, str]]:
+        '''Returns the fingerprints of the rows written for a window starting
+        on the same date by the run that saved the given generation, or None
+        when there are none. An index reaching past the window's end is also
+        ignored, since rows beyond the end would wrongly look deleted.
+        '''
+        if generation is None:
+            return None
+        path = self._get_window_path(window, generation)
+        if not os.path.exists(path):
+            return None
+        index = load_json(path)
+        if index.get("end_date", "") > window[1].isoformat():
+            return None
+        return index.get("rows")
+
+    def save(self, window: Tuple[date, date], generation: str, fingerprints: Dict[str, str]):
+        '''Saves a new generation of a window's index.'''
+        os.makedirs(self._get_window_dir(window), exist_ok=True)
+        write_json_atomic(self._get_window_path(window, generation), {
+            "start_date": window[0].isoformat(),
+            "end_date": window[1].isoformat(),
+            "rows": fingerprints
+        })
+
+    def prune_windows(self, window_starts: Iterable[str]):
+        '''Removes the indexes of every window not starting on one of window_starts.'''
+        if not os.path.isdir(self.path):
+            return
+        keep = set(window_starts)
+        for window_start in os.listdir(self.path):
+            if window_start not in keep:
+                shutil.rmtree(os.path.join(self.path, window_start))
+
+    def prune(self, window: Tuple[date, date], keep: Iterable[Optional[str]]):
+        '''Removes the generations of a window's index other than those in keep.'''
+        keep_files = {f"{generation}.json" for generation in keep if generation is not None}
+        for file_name in os.listdir(self._get_window_dir(window)):
+            if file_name not in keep_files:
+                os.remove(os.path.join(self._get_window_dir(window), file_name))
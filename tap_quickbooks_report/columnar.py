@@ -0,0 +1,147 @@
+import json
+import os
+import tempfile
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+import singer
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None  # type: ignore
+
+DEFAULT_BATCH_SIZE = 10000
+DEFAULT_COMPRESSION = "snappy"
+MAX_CACHED_DATETIMES = 10000
+
+
+def _get_type(property_schema: Dict) -> str:
+    '''Returns the non-null JSON schema type of a property.'''
+    types = property_schema.get("type", [])
+    if isinstance(types, str):
+        return types
+    return next((type for type in types if type != "null"), "string")
+
+
+def get_arrow_type(property_schema: Dict):
+    '''Maps a JSON schema property onto an Arrow type. Objects have no
+    fixed set of keys, so they are stored as JSON encoded strings.
+    '''
+    type = _get_type(property_schema)
+    if type == "string" and property_schema.get("format") == "date-time":
+        return pyarrow.timestamp("us", tz="UTC")
+    if type == "number":
+        return pyarrow.float64()
+    if type == "integer":
+        return pyarrow.int64()
+    if type == "boolean":
+        return pyarrow.bool_()
+    if type == "array":
+        return pyarrow.list_(get_arrow_type(property_schema.get("items", {})))
+    return pyarrow.string()
+
+
+def get_arrow_schema(schema: Dict):
+    '''Maps the properties of a stream's JSON schema onto an Arrow schema.'''
+    return pyarrow.schema([pyarrow.field(name, get_arrow_type(property_schema))
+                           for name, property_schema in schema["properties"].items()])
+
+
+class ParquetWindowWriter:
+    '''Writes the records of a single date window to a Parquet file, one
+    row group per batch_size records. Columns are typed from the stream's
+    JSON schema, and dictionary_columns are dictionary encoded. The file
+    is written under a temporary name and only moved into place once it
+    is closed, so readers never see a partial window.
+    '''
+
+    def __init__(self, path: str, schema: Dict, dictionary_columns: Optional[List[str]] = None,
+                 batch_size: int = DEFAULT_BATCH_SIZE, compression: str = DEFAULT_COMPRESSION):
+        if pyarrow is None:
+            raise RuntimeError("The parquet output_format requires the parquet extra: "
+                               "pip install tap-quickbooks-report[parquet]")
+        self.path = path
+        self.arrow_schema = get_arrow_schema(schema)
+        self.batch_size = max(batch_size, 1)
+        self.record_count = 0
+        self._converters: Dict[str, Callable[[Any], Any]] = {
+            field.name: self._get_converter(field.type) for field in self.arrow_schema
+        }
+        self._columns: Dict[str, List] = {name: [] for name in self._converters}
+        self._datetime_cache: Dict[str, datetime] = {}
+
+        dictionary_paths = []
+        for field in self.arrow_schema:
+            if field.name in (dictionary_columns or []):
+                # Parquet encodes leaf columns, so lists are addressed by their elements.
+                dictionary_paths.append(f"{field.name}.list.element" if pyarrow.types.is_list(field.type) else field.name)
+
+        directory = os.path.dirname(path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, self._temp_path = tempfile.mkstemp(dir=directory, prefix=".", suffix=".parquet.tmp")
+        os.close(fd)
+        self._writer = pyarrow.parquet.ParquetWriter(self._temp_path, self.arrow_schema, compression=compression,
+                                                     use_dictionary=dictionary_paths or False)
+
+    def _get_converter(self, arrow_type) -> Callable[[Any], Any]:
+        if pyarrow.types.is_timestamp(arrow_type):
+            return self._convert_datetime
+        if pyarrow.types.is_string(arrow_type):
+            return lambda value: value if isinstance(value, str) else json.dumps(value)
+        return lambda value: value
+
+    def _convert_datetime(self, value):
+        '''Parses date-time strings, memoising them since report
+        rows repeat the same handful of dates.
+        '''
+        if not isinstance(value, str):
+            return value
+        try:
+            return self._datetime_cache[value]
+        except KeyError:
+            if len(self._datetime_cache) >= MAX_CACHED_DATETIMES:
+                self._datetime_cache.clear()
+            converted = self._datetime_cache[value] = singer.utils.strptime_to_utc(value)
+            return converted
+
+    def write(self, record: Dict):
+        '''Buffers a record, writing a row group once batch_size are buffered.'''
+        for name, column in self._columns.items():
+            value = record.get(name)
+            column.append(None if value is None else self._converters[name](value))
+        self.record_count += 1
+        if len(next(iter(self._columns.values()), [])) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        '''Writes the buffered records as a row group.'''
+        if not any(self._columns.values()):
+            return
+        batch = pyarrow.RecordBatch.from_arrays(
+            [pyarrow.array(self._columns[field.name], type=field.type) for field in self.arrow_schema],
+            schema=self.arrow_schema)
+        self._writer.write_table(pyarrow.Table.from_batches([batch]))
+        for column in self._columns.values():
+            column.clear()
+
+    def close(self):
+        '''Writes any buffered records and moves the file into place.'''
+        self.flush()
+        self._writer.close()
+        os.replace(self._temp_path, self.path)
+
+    def abort(self):
+        '''Discards the file without moving it into place.'''
+        self._writer.close()
+        os.remove(self._temp_path)
+
+    def __enter__(self) -> "ParquetWindowWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
@@ -0,0 +1,135 @@
+import argparse
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+DEFAULT_SECTION_ROWS = 5000
+
+# A run of sibling rows of a Rows tree, with the categories of the section holding them.
+Slice = Tuple[List[Dict], List[str]]
+
+
+class StreamSpec(NamedTuple):
+    '''What a transform worker needs to rebuild the stream it transforms rows for.'''
+    stream_class: Any
+    config: Dict
+    selected_properties: Optional[List[str]]
+    sync_started_at: datetime
+
+
+class SectionBatch(NamedTuple):
+    '''The serialised RECORD messages of a batch of rows, and the
+    time a worker spent flattening and transforming them.
+    '''
+    lines: List[str]
+    flatten_seconds: float
+    transform_seconds: float
+
+
+def split_sections(row_array: List[Dict], section_rows: int = DEFAULT_SECTION_ROWS) -> Iterator[List[Slice]]:
+    '''Splits a report's Rows tree into consecutive batches of about
+    section_rows data rows, walking it like DetailReportStream._iter_rows.
+    Top-level sections are descended into, so that a report made of a few
+    huge sections still spreads across workers, and flattening the slices
+    of every batch in order yields the report's rows in order.
+    '''
+    batch: List[Slice] = []
+    batch_rows = 0
+    run: List[Dict] = []
+    stack: List[Tuple[Iterator[Dict], List[str]]] = [(iter(row_array), [])]
+    while stack:
+        rows, categories = stack[-1]
+        row = next(rows, None)
+        if row is not None and "ColData" in row:
+            run.append(row)
+            batch_rows += 1
+            if batch_rows < section_rows:
+                continue
+        # The run of sibling rows ends with its section, a sub-section or a full batch.
+        if run:
+            batch.append((run, categories))
+            run = []
+        if batch_rows >= section_rows:
+            yield batch
+            batch, batch_rows = [], 0
+        if row is None:
+            stack.pop()
+        elif "ColData" not in row and row.get("Rows"):
+            header = row.get("Header")
+            if header is not None:
+                categories = categories + [header.get("ColData")[0].get("value")]
+            stack.append((iter(row["Rows"].get("Row") or []), categories))
+    if batch:
+        yield batch
+
+
+# Streams rebuilt by this worker process, by stream, realm and run.
+_streams: Dict[Tuple, Any] = {}
+
+
+def _get_stream(spec: StreamSpec):
+    key = (spec.stream_class.tap_stream_id, spec.config.get("realm_id"), spec.sync_started_at)
+    try:
+        return _streams[key]
+    except KeyError:
+        stream = spec.stream_class(config=spec.config, args=argparse.Namespace(),
+                                   selected_properties=spec.selected_properties,
+                                   transport=None, response_cache=None, transform_pool=None)
+        # Records must carry the parent's sync timestamps.
+        stream.sync_started_at = spec.sync_started_at
+        _streams[key] = stream
+        return stream
+
+
+def _transform_batch(spec: StreamSpec, columns: List[str], id_index: Optional[int], batch: List[Slice],
+                     version: Optional[int]) -> SectionBatch:
+    return _get_stream(spec)._transform_batch(columns, id_index, batch, version)
+
+
+class SectionResults:
+    '''The batches of a report submitted to a TransformPool, iterated in report order.'''
+
+    def __init__(self, results: List):
+        self.results = results
+
+    def __iter__(self) -> Iterator[SectionBatch]:
+        for result in self.results:
+            yield result.get()
+
+
+class TransformPool:
+    '''A pool of worker processes that flatten, transform and serialise
+    batches of detail report rows, so that huge reports are not held up
+    by a single core. Workers are spawned rather than forked, since the
+    tap runs fetch threads, and only once the first report is submitted.
+    '''
+
+    def __init__(self, processes: int, section_rows: int = DEFAULT_SECTION_ROWS):
+        self.processes = processes
+        self.section_rows = section_rows
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                # Only runs with transform_processes set load multiprocessing.
+                import multiprocessing
+
+                self._pool = multiprocessing.get_context("spawn").Pool(self.processes)
+            return self._pool
+
+    def submit(self, spec: StreamSpec, columns: List[str], id_index: Optional[int], row_array: List[Dict],
+               version: Optional[int]) -> SectionResults:
+        '''Splits a report's Rows tree into batches and queues them on the workers.'''
+        pool = self._get_pool()
+        return SectionResults([pool.apply_async(_transform_batch, (spec, columns, id_index, batch, version))
+                               for batch in split_sections(row_array, self.section_rows)])
+
+    def close(self):
+        '''Stops the worker processes, abandoning any batches still being transformed.'''
+        with self._lock:
+            if self._pool is not None:
+                self._pool.terminate()
+                self._pool.join()
+                self._pool = None
@@ -0,0 +1,100 @@
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+ROW_PREFIX = "Rows.Row.item"
+
+
+class _RowFrame:
+    '''Parser state for a single object in a `Rows.Row` array.'''
+    __slots__ = ("prefix", "categories", "has_header", "values", "transaction_id")
+
+    def __init__(self, prefix: str, categories: List[str]):
+        self.prefix = prefix
+        self.categories = categories
+        self.has_header = False
+        self.values: Optional[List[Any]] = None
+        self.transaction_id: Optional[str] = None
+
+
+def _read_columns(events: Iterator[Tuple[str, str, Any]]) -> Dict:
+    '''Consumes parser events up to the end of the
+    top-level `Columns` object and returns it as a dict.
+    '''
+    for prefix, event, value in events:
+        if prefix == "Columns" and event == "start_map":
+            builder = ijson.ObjectBuilder()
+            builder.event(event, value)
+            for prefix, event, value in events:
+                if prefix == "Columns" and event == "end_map":
+                    return builder.value
+                builder.event(event, value)
+        elif prefix == "Rows":
+            break
+    raise ValueError("Report response does not contain Columns ahead of Rows.")
+
+
+def _iter_rows(events: Iterator[Tuple[str, str, Any]], id_index: Optional[int] = None) -> Iterator[List]:
+    '''Walks the `Rows` tree from a stream of parser events, yielding
+    the ColData values of every data row followed by its categories and
+    the `id` of its id_index'th ColData, in the same shape as
+    DetailReportStream._iter_rows.
+    Section headers must precede their nested rows, which is the order
+    the Quickbooks API serialises them in.
+    '''
+    stack: List[_RowFrame] = []
+    for prefix, event, value in events:
+        frame = stack[-1] if stack else None
+        if event == "start_map" and frame is None and prefix == ROW_PREFIX:
+            stack.append(_RowFrame(prefix, []))
+        elif frame is None:
+            continue
+        elif event == "start_map" and prefix == f"{frame.prefix}.{ROW_PREFIX}":
+            stack.append(_RowFrame(prefix, frame.categories))
+        elif event == "end_map" and prefix == frame.prefix:
+            stack.pop()
+        elif prefix == f"{frame.prefix}.ColData":
+            if event == "start_array":
+                frame.values = []
+            elif event == "end_array" and frame.values is not None:
+                frame.values.append(frame.categories)
+                frame.values.append(frame.transaction_id)
+                yield frame.values
+                frame.values = None
+                frame.transaction_id = None
+        elif frame.values is not None and prefix == f"{frame.prefix}.ColData.item":
+            if event == "start_map":
+                frame.values.append(None)
+        elif frame.values is not None and prefix == f"{frame.prefix}.ColData.item.value":
+            frame.values[-1] = value
+        elif frame.values is not None and prefix == f"{frame.prefix}.ColData.item.id":
+            if len(frame.values) - 1 == id_index:
+                frame.transaction_id = value
+        elif prefix == f"{frame.prefix}.Header.ColData.item.value" and not frame.has_header:
+            frame.has_header = True
+            frame.categories = frame.categories + [value]
+
+
+def get_id_index(columns: Optional[Dict], id_column: Optional[str]) -> Optional[int]:
+    '''Returns the index of the column titled id_column, whose
+    ColData `id` identifies the transaction of each row.
+    '''
+    return next((index for index, column in enumerate((columns or {}).get("Column") or [])
+                 if column.get("ColTitle") == id_column), None)
+
+
+def parse_report(fileobj, id_column: Optional[str] = None) -> Tuple[Dict, Iterator[List]]:
+    '''Incrementally parses a Quickbooks report response body.
+    Returns the report's Columns object along with a generator
+    that yields the report's data rows as they are read, so the
+    body never has to be held in memory as a whole.
+    '''
+    if ijson is None:
+        raise ImportError("Streaming report responses requires the ijson package. "
+                          "Install it with `pip install tap-quickbooks-report[streaming]`.")
+    events = iter(ijson.parse(fileobj))
+    columns = _read_columns(events)
+    return columns, _iter_rows(events, get_id_index(columns, id_column))
@@ -0,0 +1,139 @@
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, Optional, Tuple, TypeVar
+
+import singer
+
+from .utils import write_json_atomic
+
+try:
+    import resource
+except ImportError:
+    resource = None  # type: ignore
+
+LOGGER = singer.get_logger()
+
+T = TypeVar("T")
+
+
+def get_peak_rss_mb() -> Optional[float]:
+    '''Returns the peak resident set size of the process in megabytes,
+    or None on platforms without the resource module.
+    '''
+    if resource is None:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in kilobytes elsewhere.
+    return round(peak_rss / (1024 ** 2 if sys.platform == "darwin" else 1024), 2)
+
+
+class Profiler:
+    '''Accumulates the time each stream spends in each stage of a sync,
+    along with counters such as bytes downloaded and retries. A disabled
+    profiler records nothing, so streams can time stages unconditionally.
+    Stages and counters are kept per stream, and updates are serialised
+    with a lock so a single profiler can be shared between threads.
+    '''
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.started_at = time.monotonic()
+        self._seconds: Dict[Tuple[str, str], float] = defaultdict(float)
+        self._calls: Dict[Tuple[str, str], int] = defaultdict(int)
+        self._counters: Dict[Tuple[str, str], float] = defaultdict(float)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config: Dict) -> "Profiler":
+        '''Builds a profiler that is enabled by the `instrumentation`
+        or `profile_path` config values.
+        '''
+        return cls(enabled=bool(config.get("instrumentation") or config.get("profile_path")))
+
+    def add_time(self, stream: str, stage: str, seconds: float, calls: int = 1):
+        '''Adds time spent by a stream in a stage.'''
+        if not self.enabled:
+            return
+        with self._lock:
+            self._seconds[(stream, stage)] += seconds
+            self._calls[(stream, stage)] += calls
+
+    def increment(self, stream: str, counter: str, value: float = 1):
+        '''Adds value to one of a stream's counters.'''
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[(stream, counter)] += value
+
+    @contextmanager
+    def stage(self, stream: str, stage: str):
+        '''Times the enclosed block as a stage of a stream.'''
+        if not self.enabled:
+            yield
+            return
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stream, stage, time.perf_counter() - started_at)
+
+    def iter_stage(self, stream: str, stage: str, items: Iterable[T]) -> Iterator[T]:
+        '''Yields from items, timing the work done to produce each
+        item as a stage of a stream. Suits lazily evaluated stages.
+        '''
+        if not self.enabled:
+            yield from items
+            return
+        iterator = iter(items)
+        seconds = 0.0
+        count = 0
+        try:
+            while True:
+                started_at = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    seconds += time.perf_counter() - started_at
+                    break
+                seconds += time.perf_counter() - started_at
+                count += 1
+                yield item
+        finally:
+            self.add_time(stream, stage, seconds, calls=count)
+
+    def get_profile(self) -> Dict:
+        '''Returns every stream's stage timings and counters,
+        along with the run's duration and peak RSS.
+        '''
+        with self._lock:
+            streams: Dict[str, Dict] = defaultdict(lambda: {"stages": {}, "counters": {}})
+            for (stream, stage), seconds in self._seconds.items():
+                streams[stream]["stages"][stage] = {"seconds": round(seconds, 6), "calls": self._calls[(stream, stage)]}
+            for (stream, counter), value in self._counters.items():
+                streams[stream]["counters"][counter] = round(value, 6)
+        return {
+            "duration_seconds": round(time.monotonic() - self.started_at, 6),
+            "peak_rss_mb": get_peak_rss_mb(),
+            "streams": dict(streams)
+        }
+
+    def log_metrics(self):
+        '''Logs the profile as Singer METRIC messages.'''
+        if not self.enabled:
+            return
+        profile = self.get_profile()
+        for stream, stats in profile["streams"].items():
+            for stage, timing in stats["stages"].items():
+                singer.metrics.log(LOGGER, singer.metrics.Point("timer", "stage_duration", timing["seconds"],
+                                                                {"endpoint": stream, "stage": stage}))
+            for counter, value in stats["counters"].items():
+                singer.metrics.log(LOGGER, singer.metrics.Point("counter", counter, value, {"endpoint": stream}))
+        if profile["peak_rss_mb"] is not None:
+            singer.metrics.log(LOGGER, singer.metrics.Point("gauge", "peak_rss_mb", profile["peak_rss_mb"], {}))
+
+    def write_profile(self, path: str):
+        '''Writes the profile to a JSON file.'''
+        write_json_atomic(path, self.get_profile())
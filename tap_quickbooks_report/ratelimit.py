@@ -0,0 +1,269 @@
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple, Union
+
+import requests
+
+if TYPE_CHECKING:
+    import asyncio
+
+DEFAULT_REALM_REQUESTS_PER_MINUTE = 500
+DEFAULT_REALM_MAX_CONCURRENCY = 10
+
+
+class RateLimiter:
+    '''A thread-safe token bucket. Tokens refill continuously at `rate`
+    per second up to `capacity`, and acquire() blocks until a token is
+    available. Waiting callers reserve their token up front, so they
+    sleep outside the lock and are released in arrival order. The bucket
+    can also be paused, which holds back every caller until a deadline.
+    Coroutines wait with acquire_async() instead, without a thread.
+    '''
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError("Rate limits must allow at least some requests.")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        '''Takes a token, returning how long to wait before using it.'''
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            wait = max(wait, self._paused_until - now)
+            if wait > 0:
+                self.waits += 1
+                self.wait_seconds += wait
+        return wait
+
+    def acquire(self) -> float:
+        '''Takes a token, sleeping until one is available.
+        Returns the number of seconds spent waiting.
+        '''
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self) -> float:
+        '''Takes a token like acquire(), awaiting it instead of sleeping.'''
+        # asyncio is only loaded by runs using the asyncio http_engine.
+        import asyncio
+
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def pause(self, seconds: float):
+        '''Holds back every caller for the given number of seconds.'''
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+class ConcurrencyLimiter:
+    '''Caps the number of requests in flight, adapting the cap with
+    additive-increase/multiplicative-decrease: every throttled response
+    halves the cap, and each successful response grows it by 1/cap, so
+    the cap climbs back by one request per round of successes. Threads
+    and coroutines may wait on the same limiter: coroutines wait on a
+    future that release() wakes on the coroutine's event loop.
+    '''
+
+    def __init__(self, max_limit: int, min_limit: int = 1):
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.limit = float(max_limit)
+        self.in_flight = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self._condition = threading.Condition()
+        self._waiters: List[Tuple["asyncio.AbstractEventLoop", "asyncio.Future"]] = []
+
+    def acquire(self) -> float:
+        '''Blocks until a request slot is free and takes it.
+        Returns the number of seconds spent waiting.
+        '''
+        with self._condition:
+            started_at = time.monotonic()
+            if self.in_flight >= int(self.limit):
+                self.waits += 1
+                while self.in_flight >= int(self.limit):
+                    self._condition.wait()
+            waited = time.monotonic() - started_at
+            self.wait_seconds += waited
+            self.in_flight += 1
+            return waited
+
+    async def acquire_async(self) -> float:
+        '''Awaits a free request slot and takes it.
+        Returns the number of seconds spent waiting.
+        '''
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        started_at = time.monotonic()
+        counted = False
+        while True:
+            with self._condition:
+                if self.in_flight < int(self.limit):
+                    waited = time.monotonic() - started_at
+                    self.wait_seconds += waited
+                    self.in_flight += 1
+                    return waited
+                if not counted:
+                    self.waits += 1
+                    counted = True
+                waiter = (loop, loop.create_future())
+                self._waiters.append(waiter)
+            try:
+                await waiter[1]
+            finally:
+                with self._condition:
+                    if waiter in self._waiters:
+                        self._waiters.remove(waiter)
+
+    def release(self, throttled: bool = False):
+        '''Frees a request slot and adjusts the cap for its outcome.'''
+        with self._condition:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(float(self.min_limit), self.limit / 2)
+            else:
+                self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+            self._condition.notify_all()
+            waiters, self._waiters = self._waiters, []
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_wake, future)
+
+
+def _wake(future: "asyncio.Future"):
+    if not future.done():
+        future.set_result(None)
+
+
+def get_retry_after(response: requests.Response) -> Optional[float]:
+    '''Returns the number of seconds a Retry-After header asks
+    the client to wait, or None if the header is absent or invalid.
+    '''
+    value = response.headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+class Throttle:
+    '''Throttles the requests made to a single realm. Each request takes
+    a token from the realm's rate limiter, and from the process-wide one
+    when configured, plus a slot from the realm's adaptive concurrency
+    limiter. A 429 response halves the realm's concurrency and pauses its
+    rate limiter for as long as the response's Retry-After header asks.
+    '''
+
+    def __init__(self, rate_limiter: RateLimiter, concurrency_limiter: ConcurrencyLimiter,
+                 global_rate_limiter: Optional[RateLimiter] = None):
+        self.rate_limiter = rate_limiter
+        self.concurrency_limiter = concurrency_limiter
+        self.global_rate_limiter = global_rate_limiter
+        self.throttled_responses = 0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        '''Blocks until a request may be sent. Returns the seconds waited.'''
+        waited = self.concurrency_limiter.acquire()
+        try:
+            if self.global_rate_limiter is not None:
+                waited += self.global_rate_limiter.acquire()
+            waited += self.rate_limiter.acquire()
+        except BaseException:
+            self.concurrency_limiter.release()
+            raise
+        return waited
+
+    async def acquire_async(self) -> float:
+        '''Awaits until a request may be sent, without holding a thread.
+        Returns the seconds waited.
+        '''
+        waited = await self.concurrency_limiter.acquire_async()
+        try:
+            if self.global_rate_limiter is not None:
+                waited += await self.global_rate_limiter.acquire_async()
+            waited += await self.rate_limiter.acquire_async()
+        except BaseException:
+            self.concurrency_limiter.release()
+            raise
+        return waited
+
+    def release(self, response: Optional[requests.Response] = None):
+        '''Records the outcome of a request sent after acquire() or acquire_async().'''
+        throttled = response is not None and response.status_code == 429
+        if throttled:
+            with self._lock:
+                self.throttled_responses += 1
+            retry_after = get_retry_after(response)  # type: ignore
+            if retry_after:
+                self.rate_limiter.pause(retry_after)
+        self.concurrency_limiter.release(throttled=throttled)
+
+    def get_stats(self) -> Dict:
+        '''Returns counters describing how often requests were held back.'''
+        limiters: List[Union[RateLimiter, ConcurrencyLimiter]] = [self.rate_limiter, self.concurrency_limiter]
+        if self.global_rate_limiter is not None:
+            limiters.append(self.global_rate_limiter)
+        return {
+            "throttled_responses": self.throttled_responses,
+            "throttled_waits": sum(limiter.waits for limiter in limiters),
+            "throttled_wait_seconds": round(sum(limiter.wait_seconds for limiter in limiters), 3),
+            "concurrency_limit": int(self.concurrency_limiter.limit)
+        }
+
+
+_GLOBAL_RATE_LIMITER: Optional[RateLimiter] = None
+_THROTTLES: Dict[str, Throttle] = {}
+_THROTTLES_LOCK = threading.Lock()
+
+
+def get_realm_throttle(realm_id: str, config: Dict) -> Throttle:
+    '''Returns the process-wide throttle for a realm, creating it on first
+    use from the `realm_requests_per_minute`, `realm_max_concurrency` and
+    process-wide `requests_per_minute` config values.
+    '''
+    global _GLOBAL_RATE_LIMITER
+    with _THROTTLES_LOCK:
+        if realm_id not in _THROTTLES:
+            if _GLOBAL_RATE_LIMITER is None and config.get("requests_per_minute"):
+                _GLOBAL_RATE_LIMITER = RateLimiter(rate=float(config["requests_per_minute"]) / 60)
+            requests_per_minute = float(config.get("realm_requests_per_minute", DEFAULT_REALM_REQUESTS_PER_MINUTE))
+            max_concurrency = int(config.get("realm_max_concurrency", DEFAULT_REALM_MAX_CONCURRENCY))
+            _THROTTLES[realm_id] = Throttle(rate_limiter=RateLimiter(rate=requests_per_minute / 60),
+                                            concurrency_limiter=ConcurrencyLimiter(max_limit=max(max_concurrency, 1)),
+                                            global_rate_limiter=_GLOBAL_RATE_LIMITER)
+        return _THROTTLES[realm_id]
+
+
+def get_throttle_stats() -> Dict[str, Dict]:
+    '''Returns the throttling counters of every realm, keyed by Realm ID.'''
+    with _THROTTLES_LOCK:
+        return {realm_id: throttle.get_stats() for realm_id, throttle in _THROTTLES.items()}
@@ -0,0 +1,24 @@
+from functools import lru_cache
+from typing import ClassVar, Dict, Tuple, Type
+
+
+class DetailRow(tuple):
+    '''Base of the compact row types built by get_row_type. A row is a
+    tuple of the values of a report's selected columns in column order,
+    already converted, and is only turned into a record dict once it is
+    written.
+    '''
+    __slots__ = ()
+    _fields: ClassVar[Tuple[str, ...]] = ()
+
+    def to_dict(self) -> Dict:
+        '''Converts the row into a record, leaving out empty values.'''
+        return {column: value for column, value in zip(self._fields, self) if value is not None}
+
+
+@lru_cache(maxsize=None)
+def get_row_type(columns: Tuple[str, ...]) -> Type[DetailRow]:
+    '''Returns the row type holding the given columns. Reports with the
+    same selected columns share a row type, so it is only built once.
+    '''
+    return type("DetailRow", (DetailRow,), {"__slots__": (), "_fields": columns})
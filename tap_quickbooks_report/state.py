@@ -0,0 +1,35 @@
+import copy
+import threading
+from typing import Any, Dict, Optional
+
+import singer
+
+from .writer import MessageWriter
+
+
+class State:
+    '''Singer state shared by every stream and realm of a sync.
+    Bookmarks are kept per stream and per realm, and each update is
+    written out as a STATE message while holding the state's lock so
+    concurrent streams never emit a half-updated state.
+    '''
+
+    def __init__(self, value: Optional[Dict] = None, writer: Optional[MessageWriter] = None):
+        self.value = copy.deepcopy(value) if value else {}
+        self.writer = writer or MessageWriter()
+        self._lock = threading.Lock()
+
+    def get_bookmark(self, tap_stream_id: str, realm_id: str, key: str, default: Any = None) -> Any:
+        '''Returns a bookmark value for a stream and realm.'''
+        with self._lock:
+            return singer.get_bookmark(self.value, tap_stream_id, realm_id, {}).get(key, default)
+
+    def write_bookmark(self, tap_stream_id: str, realm_id: str, key: str, value: Any):
+        '''Updates a bookmark value for a stream and realm
+        and writes the resulting state.
+        '''
+        with self._lock:
+            bookmark = singer.get_bookmark(self.value, tap_stream_id, realm_id, {})
+            bookmark[key] = value
+            singer.write_bookmark(self.value, tap_stream_id, realm_id, bookmark)
+            self.writer.write_state(copy.deepcopy(self.value))
@@ -1,64 +1,257 @@
+import argparse
+import gzip
 import json
 import os
-import webbrowser
-from datetime import datetime, timedelta
-from typing import ClassVar, Dict, List, Optional
+import sys
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+from functools import partial
+from typing import (TYPE_CHECKING, Any, Callable, ClassVar, Coroutine, Deque,
+                    Dict, Iterable, Iterator, List, Optional, Tuple, Type,
+                    Union)
 
 import attr
 import backoff
-import pytz
 import requests
 import singer
-from intuitlib.client import AuthClient
-from intuitlib.enums import Scopes
 
+from .auth import CachedAuthClient, get_token_cache
+from .cache import ResponseCache
+from .changes import (CHANGE_CAPTURE_PROPERTIES, ROW_ID_PROPERTIES,
+                      ChangeIndex, diff_rows, get_row_ids)
+from .parallel import SectionBatch, SectionResults, StreamSpec, TransformPool
+from .parsing import get_id_index, parse_report
+from .profiling import Profiler
+from .ratelimit import get_realm_throttle, get_retry_after
+from .rows import DetailRow, get_row_type
+from .state import State
+from .transform import Transformer
+from .utils import (first_of_month, generate_date_windows, is_fatal_status,
+                    update_config, write_json_atomic)
 from .version import __version__
+from .writer import MessageWriter, format_record, format_time_extracted
+
+if TYPE_CHECKING:
+    from .transport import AsyncTransport
 
 LOGGER = singer.get_logger()
 
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_HTTP_POOL_SIZE = 10
+DEFAULT_CONNECT_TIMEOUT = 10
+DEFAULT_REQUEST_TIMEOUT = 300
+DEFAULT_LOOKBACK_MONTHS = 1
+DEFAULT_BACKFILL_WINDOW_MONTHS = 1
+# Consecutive 429 responses retried after their Retry-After wait, before the request backs off as usual.
+MAX_THROTTLED_RETRIES = 10
+
+REPLICATION_METHODS = ['FULL_TABLE', 'INCREMENTAL']
+OUTPUT_FORMATS = ['singer', 'parquet']
+HTTP_ENGINES = ['requests', 'asyncio']
+
+# Properties added to every record by the tap rather than read from a report.
+AUTOMATIC_PROPERTIES = ['SyncTimestampUtc', 'RealmId']
+
 
 def is_fatal_code(e: requests.exceptions.RequestException) -> bool:
     '''Helper function to determine if a Requests reponse status code
     is a "fatal" status code. If it is, the backoff decorator will giveup
     instead of attemtping to backoff.'''
-    return 400 <= e.response.status_code < 500 and e.response.status_code != 429
+    return is_fatal_status(e.response.status_code)
+
+
+def record_backoff(details: Dict):
+    '''Counts a retry of a stream's request, and the time
+    spent sleeping before it, in the stream's profiler.
+    '''
+    stream = details["args"][0]
+    stream.profiler.increment(stream.tap_stream_id, "retries")
+    stream.profiler.increment(stream.tap_stream_id, "backoff_seconds", details.get("wait") or 0)
+
+
+def build_session(config: Dict) -> requests.Session:
+    '''Builds a pooled HTTP session for the Quickbooks REST API.
+    Connections are kept alive between requests, and the pool is sized
+    by the `http_pool_size` config value so that every concurrent
+    request can reuse a connection.
+    '''
+    pool_size = max(int(config.get("http_pool_size", DEFAULT_HTTP_POOL_SIZE)),
+                    int(config.get("max_workers", DEFAULT_MAX_WORKERS)))
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update(get_default_headers())
+    return session
+
+
+def get_default_headers() -> Dict[str, str]:
+    '''Returns the headers sent with every request to the Quickbooks REST API.'''
+    return {
+        "Accept": "application/json",
+        "Accept-Encoding": "gzip, deflate",
+        "User-Agent": f"python-quickbooks-reporting-tap/{__version__}",
+        "Content-Type": "application/json"
+    }
+
+
+def build_transport(config: Dict) -> Optional["AsyncTransport"]:
+    '''Builds the asyncio transport when the `http_engine` config value
+    asks for it, or returns None to send requests with requests.
+    '''
+    if config.get("http_engine", "requests") != "asyncio":
+        return None
+    # aiohttp is slow to import, so runs using requests never load it.
+    from .transport import DEFAULT_ASYNC_MAX_CONCURRENCY, AsyncTransport
+    return AsyncTransport(get_default_headers(),
+                          max_concurrency=int(config.get("async_max_concurrency", DEFAULT_ASYNC_MAX_CONCURRENCY)),
+                          connect_timeout=float(config.get("connect_timeout", DEFAULT_CONNECT_TIMEOUT)),
+                          request_timeout=float(config.get("request_timeout", DEFAULT_REQUEST_TIMEOUT)))
+
+
+def build_transform_pool(config: Dict) -> Optional[TransformPool]:
+    '''Builds the pool of processes detail reports are transformed on when
+    the `transform_processes` config value is positive, or returns None.
+    '''
+    processes = int(config.get("transform_processes") or 0)
+    if processes <= 0:
+        return None
+    return TransformPool(processes)
 
 
 @attr.s
 class QuickbooksStream:
-    tap_stream_id: ClassVar[Optional[str]] = None
+    tap_stream_id: ClassVar[str]
+    stream: ClassVar[str]
+    key_properties: ClassVar[Union[str, List[str]]]
+    replication_method: ClassVar[str] = 'FULL_TABLE'
+    replication_methods: ClassVar[List[str]] = ['FULL_TABLE']
     base_url: ClassVar[str] = "https://quickbooks.api.intuit.com"
     api_version: ClassVar[str] = "v3"
     api_minor_version: ClassVar[int] = 40
+    report_entity: ClassVar[str]
+    params: ClassVar[Dict[str, str]] = {}
+    # Properties whose values repeat enough to dictionary encode in columnar output.
+    dictionary_columns: ClassVar[List[str]] = ['RealmId']
 
     config: Dict = attr.ib()
-    args: Dict = attr.ib()
+    args: argparse.Namespace = attr.ib()
+    writer: MessageWriter = attr.ib(factory=MessageWriter, kw_only=True)
+    session: requests.Session = attr.ib(default=attr.Factory(lambda self: build_session(self.config), takes_self=True),
+                                        kw_only=True)
+    version: int = attr.ib(factory=lambda: int(datetime.utcnow().timestamp()), kw_only=True)
+    state: State = attr.ib(default=attr.Factory(lambda self: State(writer=self.writer), takes_self=True), kw_only=True)
+    transport: Optional["AsyncTransport"] = attr.ib(default=attr.Factory(lambda self: build_transport(self.config), takes_self=True),
+                                                    kw_only=True)
+    transform_pool: Optional[TransformPool] = attr.ib(default=attr.Factory(lambda self: build_transform_pool(self.config),
+                                                                           takes_self=True),
+                                                      kw_only=True)
+    response_cache: Optional[ResponseCache] = attr.ib(default=attr.Factory(lambda self: ResponseCache.from_config(self.config),
+                                                                           takes_self=True),
+                                                      kw_only=True)
+    selected_properties: Optional[List[str]] = attr.ib(default=None, kw_only=True)
+    profiler: Profiler = attr.ib(factory=Profiler, kw_only=True)
+    sync_started_at: datetime = attr.ib(init=False, factory=singer.utils.now)
+    # The first date window and its report body, when prefetch() started fetching it.
+    _prefetched: Optional[Tuple[Tuple[date, date], Future]] = attr.ib(init=False, default=None, repr=False)
+    schema: Dict
     @config.validator
     def check(self, attribute, value):
         if value.get("environment") not in ["sandbox", "production"]:
             raise ValueError('environment attribute must be either "sandbox" or "production".')
+        if value.get("http_engine", "requests") not in HTTP_ENGINES:
+            raise ValueError(f"http_engine must be one of {HTTP_ENGINES}.")
+        if value.get("http_engine") == "asyncio" and (value.get("stream_responses") or value.get("cache_path")):
+            raise ValueError("stream_responses and cache_path cannot be used with the asyncio http_engine.")
+        if value.get("output_format", "singer") not in OUTPUT_FORMATS:
+            raise ValueError(f"output_format must be one of {OUTPUT_FORMATS}.")
+        if value.get("output_format") == "parquet" and not value.get("output_dir"):
+            raise ValueError("output_dir is required when output_format is parquet.")
+        if value.get("output_format") == "parquet" and value.get("change_capture_path"):
+            raise ValueError("change_capture_path cannot be used when output_format is parquet.")
+        serial_only = value.get("stream_responses") or value.get("change_capture_path") or value.get("output_format") == "parquet"
+        if int(value.get("transform_processes") or 0) > 0 and serial_only:
+            raise ValueError("transform_processes cannot be used with stream_responses, change_capture_path "
+                             "or a parquet output_format.")
+        if int(value.get("transform_processes") or 0) > 0 and value.get("replication_method") == "INCREMENTAL":
+            raise ValueError("transform_processes cannot be used with the INCREMENTAL replication_method.")
 
-    def _get_abs_path(self, path: str) -> str:
+    def __attrs_post_init__(self):
+        if self.selected_properties is not None:
+            self.schema = self._select_properties(self.schema)
+        if self._is_backfill():
+            self._check_backfill()
+
+    def _check_backfill(self):
+        '''Rejects a backfill whose rows the next scheduled sync would
+        retire. Full table syncs of Parquet files remove the files of
+        windows outside their period.
+        '''
+        if self._is_columnar() and self._get_replication_method() == 'FULL_TABLE':
+            raise ValueError(f"--backfill cannot be used for {self.tap_stream_id} with the parquet output_format, "
+                             "since the next full table sync removes the backfilled files.")
+
+    @classmethod
+    def _get_abs_path(cls, path: str) -> str:
         return os.path.join(os.path.dirname(os.path.realpath(__file__)), path)
 
-    def _load_schema(self) -> Dict:
+    @classmethod
+    def _load_schema(cls) -> Dict:
         '''Loads a JSON schema file for a given
         Quickbooks Report resource into a dict representation.
         '''
-        schema_path = self._get_abs_path("schemas")
-        return singer.utils.load_json(f"{schema_path}/{self.tap_stream_id}.json")
+        schema_path = cls._get_abs_path("schemas")
+        return singer.utils.load_json(f"{schema_path}/{cls.tap_stream_id}.json")
+
+    @classmethod
+    def get_schema(cls, config: Dict) -> Dict:
+        '''Returns the stream's JSON schema for a given config.'''
+        return cls._load_schema()
+
+    @classmethod
+    def get_automatic_properties(cls, config: Dict) -> List[str]:
+        '''Returns the properties that are always
+        included, whichever properties are selected.
+        '''
+        return list(AUTOMATIC_PROPERTIES)
+
+    @classmethod
+    def get_key_properties(cls, config: Dict) -> List[str]:
+        '''Returns the stream's key properties, which include
+        RealmId when several realms are extracted.
+        '''
+        key_properties = [cls.key_properties] if isinstance(cls.key_properties, str) else list(cls.key_properties)
+        if key_properties and config.get("realms"):
+            key_properties.insert(0, "RealmId")
+        return key_properties
+
+    def _select_properties(self, schema: Dict) -> Dict:
+        '''Narrows a schema down to the selected properties, always
+        keeping the key properties and those the tap adds itself.
+        '''
+        keep = set(self.selected_properties or []) | set(self.get_key_properties(self.config)) | set(self.get_automatic_properties(self.config))
+        properties = {name: value for name, value in schema["properties"].items() if name in keep}
+        return {**schema, "properties": properties}
 
     def _generate_token_expiration(self, refresh_token_expires_in_seconds: int) -> str:
         '''Generates a string-formatted expiration date using the
         refresh_token_expires_in_seconds value attached to the Auth Client.
         '''
-        return datetime.strftime((datetime.utcnow().replace(tzinfo=pytz.UTC) + timedelta(seconds=refresh_token_expires_in_seconds)), '%Y-%m-%d %H:%M:%S %Z')
+        return datetime.strftime((datetime.now(timezone.utc) + timedelta(seconds=refresh_token_expires_in_seconds)), '%Y-%m-%d %H:%M:%S %Z')
 
     def user_consent(self):
         '''Triggers the User Consent OAuth2.0 flow
         in order to retrieve an Authorization Code
         and a Realm ID.
         '''
+        # Only needed for --auth, so kept out of the sync import path.
+        import webbrowser
+
+        from intuitlib.client import AuthClient
+        from intuitlib.enums import Scopes
+
         auth_client = AuthClient(self.config.get("client_id"),
                                  self.config.get("client_secret"),
                                  self.config.get("redirect_uri"),
@@ -75,8 +268,7 @@ class QuickbooksStream:
         self.config["refresh_token_expires_at"] = self._generate_token_expiration(auth_client.x_refresh_token_expires_in)
 
         LOGGER.info('Generating new config..')
-        with open(self.args.config_path, 'r+') as f:
-            json.dump(self.config, f, indent=2)
+        write_json_atomic(self.args.config_path, self.config)
 
     def _check_token_expiry(self, auth_client):
         '''Checks the expiration status
@@ -93,67 +285,382 @@ class QuickbooksStream:
 
     def _get_auth_client(self):
         '''Returns an OAuth2.0 Client for interacting
-        with Quickbooks Reporting API.
+        with Quickbooks Reporting API. Access Tokens are shared
+        through the token cache, so a realm is only refreshed
+        once its cached Access Token has expired.
         '''
+        if self.transport is not None:
+            # The asyncio engine refreshes tokens on its event loop.
+            return self.transport.submit(self._get_auth_client_async()).result()
 
-        auth_client = AuthClient(self.config.get("client_id"),
-                                 self.config.get("client_secret"),
-                                 self.config.get("redirect_uri"),
-                                 self.config.get("environment"),
-                                 refresh_token=self.config.get("refresh_token"),
-                                 realm_id=self.config.get("realm_id"))
+        realm_id = self.config.get("realm_id")
+        token_cache = get_token_cache(self.config.get("token_cache_path"))
 
-        # Refresh to get new Access Token.
-        auth_client.refresh()
+        with token_cache.lock(realm_id):
+            access_token = token_cache.get_access_token(realm_id)
+            if access_token is not None:
+                LOGGER.info("Using cached Access Token..")
+                return CachedAuthClient(realm_id=realm_id, access_token=access_token)
 
-        if auth_client.refresh_token == self.config.get("refresh_token"):
-            LOGGER.info("Config file Refresh Token and Refresh Token received from Refresh Token API are identical.")
-        else:
-            LOGGER.info("Config file Refresh Token and Refresh Token received from Refresh Token API has drifted.")
-            LOGGER.info("Overwriting Config file with new Refresh Token values..")
+            # Building an AuthClient pulls in python-jose and its crypto
+            # backends, so intuitlib is only imported once a refresh is due.
+            from intuitlib.client import AuthClient
+
+            auth_client = AuthClient(self.config.get("client_id"),
+                                     self.config.get("client_secret"),
+                                     self.config.get("redirect_uri"),
+                                     self.config.get("environment"),
+                                     refresh_token=self.config.get("refresh_token"),
+                                     realm_id=realm_id)
+
+            # Refresh to get new Access Token.
+            auth_client.refresh()
+            self._store_tokens(token_cache, auth_client)
+
+        # Check Refresh Token Expiry.
+        self._check_token_expiry(auth_client)
+
+        return auth_client
 
-            self.config["refresh_token"] = auth_client.refresh_token
-            self.config["refresh_token_expires_at"] = self._generate_token_expiration(auth_client.x_refresh_token_expires_in)
+    async def _get_auth_client_async(self):
+        '''Returns an OAuth2.0 Client like _get_auth_client, awaiting
+        the token refresh on the asyncio transport's event loop. Refreshes
+        of a realm are serialised by a lock on the loop.
+        '''
+        assert self.transport is not None
+        realm_id = self.config.get("realm_id")
+        token_cache = get_token_cache(self.config.get("token_cache_path"))
 
-            with open(self.args.config_path, 'r+') as f:
-                json.dump(self.config, f, indent=2)
+        async with self.transport.get_refresh_lock(realm_id):
+            access_token = token_cache.get_access_token(realm_id)
+            if access_token is not None:
+                LOGGER.info("Using cached Access Token..")
+                return CachedAuthClient(realm_id=realm_id, access_token=access_token)
+
+            auth_client = await self.transport.refresh(realm_id, self.config.get("environment"),
+                                                       self.config.get("client_id"), self.config.get("client_secret"),
+                                                       self.config.get("refresh_token"))
+            self._store_tokens(token_cache, auth_client)
 
         # Check Refresh Token Expiry.
         self._check_token_expiry(auth_client)
 
         return auth_client
 
+    def _store_tokens(self, token_cache, auth_client):
+        '''Caches a refreshed Access Token, and writes the Refresh
+        Token back to the Config file if it has changed.
+        '''
+        token_cache.set_access_token(auth_client.realm_id, auth_client.access_token, auth_client.expires_in)
+
+        if auth_client.refresh_token == self.config.get("refresh_token"):
+            LOGGER.info("Config file Refresh Token and Refresh Token received from Refresh Token API are identical.")
+        else:
+            LOGGER.info("Config file Refresh Token and Refresh Token received from Refresh Token API has drifted.")
+            LOGGER.info("Overwriting Config file with new Refresh Token values..")
+
+            refresh_token_values = {
+                "refresh_token": auth_client.refresh_token,
+                "refresh_token_expires_at": self._generate_token_expiration(auth_client.x_refresh_token_expires_in)
+            }
+            self.config.update(refresh_token_values)
+            update_config(self.args.config_path, auth_client.realm_id, refresh_token_values)
+
     def _construct_headers(self, access_token) -> Dict:
-        '''Constructs a standard set of headers for GET requests.'''
-        headers = requests.utils.default_headers()
-        headers["Accept"] = "application/json"
-        headers["User-Agent"] = f"python-quickbooks-reporting-tap/{__version__}"
-        headers["Authorization"] = f"Bearer {access_token}"
-        headers["Content-Type"] = "application/json"
-        headers["Date"] = singer.utils.strftime(singer.utils.now(), '%a, %d %b %Y %H:%M:%S %Z')
-        return headers
+        '''Constructs the per-request headers for GET requests. Headers
+        shared by every request are set on the session by build_session.
+        '''
+        return {
+            "Authorization": f"Bearer {access_token}",
+            "Date": singer.utils.strftime(singer.utils.now(), '%a, %d %b %Y %H:%M:%S %Z')
+        }
+
+    def _get_timeout(self) -> Tuple[float, float]:
+        '''Returns the (connect, read) timeout for GET requests.'''
+        return (float(self.config.get("connect_timeout", DEFAULT_CONNECT_TIMEOUT)),
+                float(self.config.get("request_timeout", DEFAULT_REQUEST_TIMEOUT)))
+
+    def _get_url(self, auth_client, report_entity: str) -> str:
+        return f"{self.base_url}/{self.api_version}/company/{auth_client.realm_id}/reports/{report_entity}"
 
     @backoff.on_exception(backoff.fibo,
                           requests.exceptions.HTTPError,
                           max_time=120,
                           giveup=is_fatal_code,
+                          on_backoff=record_backoff,
                           logger=LOGGER)
     @backoff.on_exception(backoff.fibo,
                           (requests.exceptions.ConnectionError,
                            requests.exceptions.Timeout),
                           max_time=120,
+                          on_backoff=record_backoff,
                           logger=LOGGER)
-    def _get(self, auth_client, report_entity: str, params: Optional[Dict] = None) -> Dict:
+    def _request(self, auth_client, report_entity: str, params: Optional[Dict] = None, stream: bool = False) -> requests.Response:
         '''Constructs a standard way of making
         a GET request to the Quickbooks REST API.
+        A 429 response with a Retry-After header is retried once the
+        realm's throttle has waited it out, instead of backing off, so
+        long throttles neither add a backoff wait nor use up max_time.
         '''
-        url = f"{self.base_url}/{self.api_version}/company/{auth_client.realm_id}/reports/{report_entity}"
+        url = self._get_url(auth_client, report_entity)
         headers = self._construct_headers(access_token=auth_client.access_token)
         if params:
             params.update({"minorversion": self.api_minor_version})
-        response = requests.get(url, headers=headers, params=params)
+        throttle = get_realm_throttle(auth_client.realm_id, self.config)
+        throttled_retries = 0
+        while True:
+            throttle.acquire()
+            response = None
+            try:
+                with self.profiler.stage(self.tap_stream_id, "http"):
+                    response = self.session.get(url, headers=headers, params=params, stream=stream, timeout=self._get_timeout())
+            finally:
+                throttle.release(response)
+            retry_after = get_retry_after(response) if response.status_code == 429 else None
+            if retry_after is None or throttled_retries == MAX_THROTTLED_RETRIES:
+                break
+            # Releasing the 429 paused the throttle, so the next acquire() waits out Retry-After.
+            LOGGER.info(f"Throttled by Quickbooks, retrying after {retry_after:.1f} seconds..")
+            response.close()
+            self.profiler.increment(self.tap_stream_id, "retries")
+            self.profiler.increment(self.tap_stream_id, "backoff_seconds", retry_after)
+            throttled_retries += 1
         response.raise_for_status()
-        return response.json()
+        return response
+
+    def _get(self, auth_client, report_entity: str, params: Optional[Dict] = None) -> Dict:
+        '''Makes a GET request to the Quickbooks REST API
+        and returns the decoded JSON response body.
+        '''
+        if self.response_cache is not None:
+            body, _ = self._open_report(auth_client, report_entity, params=params)
+            with body, self.profiler.stage(self.tap_stream_id, "decode"):
+                return json.load(body)
+        if self.transport is not None:
+            content = self.transport.get(self._get_url(auth_client, report_entity),
+                                         self._construct_headers(access_token=auth_client.access_token),
+                                         params={**params, "minorversion": self.api_minor_version} if params else params,
+                                         throttle=get_realm_throttle(auth_client.realm_id, self.config),
+                                         stream=self)
+            with self.profiler.stage(self.tap_stream_id, "decode"):
+                return json.loads(content)
+        response = self._request(auth_client, report_entity, params=params)
+        self._record_download(response)
+        with self.profiler.stage(self.tap_stream_id, "decode"):
+            return response.json()
+
+    async def _fetch_report(self, auth_client, window: Tuple[date, date]) -> bytes:
+        '''Fetches the report body for a single date window on the
+        transport's event loop. Decoding is left to _load_window, so
+        that the loop only waits on the network.
+        '''
+        assert self.transport is not None
+        return await self.transport.fetch(self._get_url(auth_client, self.report_entity),
+                                          self._construct_headers(access_token=auth_client.access_token),
+                                          params={**self._get_window_params(window), "minorversion": self.api_minor_version},
+                                          throttle=get_realm_throttle(auth_client.realm_id, self.config),
+                                          stream=self)
+
+    async def _prefetch_report(self, window: Tuple[date, date]) -> bytes:
+        auth_client = await self._get_auth_client_async()
+        return await self._fetch_report(auth_client, window)
+
+    def _load_window(self, content: bytes) -> Any:
+        '''Decodes a report body fetched by _fetch_report into what
+        _get_window returns for the window.
+        '''
+        with self.profiler.stage(self.tap_stream_id, "decode"):
+            return json.loads(content)
+
+    def _get_stream(self, auth_client, report_entity: str, params: Optional[Dict] = None) -> requests.Response:
+        '''Makes a streaming GET request to the Quickbooks REST API and
+        returns the open response, leaving the body to be read incrementally.
+        '''
+        response = self._request(auth_client, report_entity, params=params, stream=True)
+        response.raw.decode_content = True
+        return response
+
+    def _record_download(self, response):
+        '''Counts the bytes read over the wire for a response.'''
+        raw = getattr(response, "raw", None)
+        if raw is None or not self.profiler.enabled:
+            return
+        try:
+            self.profiler.increment(self.tap_stream_id, "bytes_downloaded", raw.tell())
+        except (AttributeError, OSError):
+            pass
+
+    def _open_report(self, auth_client, report_entity: str, params: Optional[Dict] = None) -> Tuple[gzip.GzipFile, bool]:
+        '''Opens a report response body through the response cache. A fresh
+        cached body is served without a request, otherwise the report is
+        streamed into the cache and read back from it. Returns the open
+        body and whether its content differs from the copy it replaced.
+        '''
+        assert self.response_cache is not None
+        key = self.response_cache.make_key(auth_client.realm_id, report_entity, params)
+        cached = self.response_cache.get(key)
+        if cached is not None and self.response_cache.is_fresh(cached):
+            LOGGER.info(f"Using cached {report_entity} report..")
+            return self.response_cache.open(cached), True
+
+        response = self._get_stream(auth_client, report_entity, params=params)
+        with response:
+            entry = self.response_cache.put(key, response.raw)
+            self._record_download(response)
+        changed = cached is None or cached.content_hash != entry.content_hash
+        return self.response_cache.open(entry), changed
+
+    def _get_report_period(self) -> Tuple[date, date]:
+        '''Returns the default reporting period, which runs from
+        the first of the month 365 days ago through today.
+        '''
+        now = singer.utils.now()
+        return (now - timedelta(days=365)).date().replace(day=1), now.date()
+
+    def _get_replication_method(self) -> str:
+        '''Returns the replication method requested through the
+        `replication_method` config value, falling back to the stream's
+        default when the stream does not support the requested method.
+        '''
+        replication_method = self.config.get("replication_method", self.replication_method)
+        if replication_method not in REPLICATION_METHODS:
+            raise ValueError(f"replication_method must be one of {REPLICATION_METHODS}.")
+        if replication_method not in self.replication_methods:
+            return self.replication_method
+        return replication_method
+
+    def _get_date_windows(self, start_date: date, end_date: date) -> List[Tuple[date, date]]:
+        '''Splits a reporting period into the date windows
+        requested through the `date_window_months` config value.
+        '''
+        months = self.config.get("date_window_months")
+        if self._is_columnar() and self._get_replication_method() == 'INCREMENTAL':
+            # Incremental runs rewrite the months they fetch again, so each month needs a file of its own.
+            months = 1
+        elif self.config.get("change_capture_path"):
+            # The report period starts on a rolling date, so only monthly
+            # windows start on the same dates as the run their index was saved by.
+            months = 1
+        return generate_date_windows(start_date, end_date, months=int(months) if months else None)
+
+    def _get_max_workers(self) -> int:
+        '''Returns the size of the thread pool used to fetch date windows.'''
+        return max(int(self.config.get("max_workers", DEFAULT_MAX_WORKERS)), 1)
+
+    def _get_windows(self) -> List[Tuple[date, date]]:
+        '''Returns the date windows the next sync fetches.'''
+        return self._get_backfill_windows() if self._is_backfill() else [self._get_report_period()]
+
+    def _get_window_params(self, window: Tuple[date, date]) -> Dict:
+        '''Returns the report params requesting a single date window.'''
+        start_date, end_date = window
+        return {
+            "start_date": start_date.isoformat(),
+            "end_date": end_date.isoformat(),
+            **self.params
+        }
+
+    def prefetch(self):
+        '''Starts fetching the first date window of the next sync on the
+        asyncio transport's event loop, so that the reports of every realm
+        and stream are requested at once rather than as sync threads reach
+        them. Only one report per stream is held before its sync starts.
+        '''
+        if self.transport is None or self._prefetched is not None:
+            return
+        windows = self._get_windows()
+        if windows:
+            self._prefetched = (windows[0], self.transport.submit(self._prefetch_report(windows[0])))
+
+    def _fetch_windows(self, windows: List[Tuple[date, date]], get_window: Callable[[Tuple[date, date]], Any],
+                       fetch_report: Optional[Callable[[Tuple[date, date]], Coroutine[Any, Any, bytes]]] = None
+                       ) -> Iterator[Tuple[Tuple[date, date], Any]]:
+        '''Fetches date windows concurrently with get_window, yielding each
+        window with its report in window order. At most max_workers reports
+        are fetched ahead of the window being consumed, so long backfills do
+        not hold every report in memory at once. Under the asyncio
+        http_engine, windows are fetched with fetch_report instead.
+        '''
+        if self.transport is not None and fetch_report is not None:
+            yield from self._fetch_windows_async(windows, fetch_report)
+            return
+        max_workers = self._get_max_workers()
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pending: Deque = deque()
+            for window in windows:
+                pending.append((window, executor.submit(get_window, window)))
+                if len(pending) > max_workers:
+                    window, future = pending.popleft()
+                    yield window, future.result()
+            while pending:
+                window, future = pending.popleft()
+                yield window, future.result()
+
+    def _fetch_windows_async(self, windows: List[Tuple[date, date]],
+                             fetch_report: Callable[[Tuple[date, date]], Coroutine[Any, Any, bytes]]
+                             ) -> Iterator[Tuple[Tuple[date, date], Any]]:
+        '''Fetches date windows as coroutines on the transport's event loop,
+        yielding each window with its decoded report in window order. Up to
+        async_max_concurrency reports are fetched ahead of the window being
+        consumed, and the transport's semaphore caps the requests in flight
+        across every stream, so this thread only decodes and flattens.
+        '''
+        assert self.transport is not None
+        ahead = self.transport.max_concurrency
+        prefetched, self._prefetched = self._prefetched, None
+        pending: Deque[Tuple[Tuple[date, date], Future]] = deque()
+        try:
+            for window in windows:
+                if prefetched is not None and prefetched[0] == window:
+                    future, prefetched = prefetched[1], None
+                else:
+                    future = self.transport.submit(fetch_report(window))
+                pending.append((window, future))
+                if len(pending) > ahead:
+                    window, future = pending.popleft()
+                    yield window, self._load_window(future.result())
+            while pending:
+                window, future = pending.popleft()
+                yield window, self._load_window(future.result())
+        finally:
+            # Reports the sync no longer needs are cancelled on the loop.
+            if prefetched is not None:
+                prefetched[1].cancel()
+            for _, future in pending:
+                future.cancel()
+
+    def _is_backfill(self) -> bool:
+        '''Returns whether the tap was run with --backfill.'''
+        return getattr(self.args, "backfill", None) is not None
+
+    def _get_backfill_windows(self) -> List[Tuple[date, date]]:
+        '''Splits the --backfill period into windows of `date_window_months`
+        calendar months, skipping the windows a previous run of the same
+        backfill already checkpointed in the State file.
+        '''
+        start_date, end_date = self.args.backfill
+        checkpoint = self.state.get_bookmark(self.tap_stream_id, self.config["realm_id"], "backfill") or {}
+        resuming = checkpoint.get("start_date") == start_date.isoformat() and checkpoint.get("end_date") == end_date.isoformat()
+        if resuming and checkpoint.get("completed_through"):
+            completed_through = datetime.strptime(checkpoint["completed_through"], "%Y-%m-%d").date()
+            LOGGER.info(f"Resuming {self.tap_stream_id} backfill after {completed_through}..")
+            start_date = completed_through + timedelta(days=1)
+        months = int(self.config.get("date_window_months") or DEFAULT_BACKFILL_WINDOW_MONTHS)
+        if self._is_columnar() or self.config.get("change_capture_path"):
+            # Backfilled months must replace the files, and match the change indexes, other runs wrote for them.
+            start_date, months = first_of_month(start_date), 1
+        return generate_date_windows(start_date, end_date, months=months)
+
+    def _write_backfill_checkpoint(self, window_end: date):
+        '''Records in the State file that every backfill
+        window up to and including window_end was written.
+        '''
+        start_date, end_date = self.args.backfill
+        self.state.write_bookmark(self.tap_stream_id, self.config["realm_id"], "backfill", {
+            "start_date": start_date.isoformat(),
+            "end_date": end_date.isoformat(),
+            "completed_through": window_end.isoformat()
+        })
 
     def _convert_string_value_to_float(self, value: str) -> float:
         '''Safely converts string values to floats.'''
@@ -163,44 +670,40 @@ class QuickbooksStream:
             float_value = float(value)
         return float_value
 
-    def _get_row_data(self, resp, column_enum, input):
-        for row in resp.get("Rows").get("Row"):
-            if row.get("type") == "Section" and row.get("Rows") is not None:
-                data_dict = {}
-                key = row.get("Header").get("ColData")[0].get("value").title().replace(" ", "")
-                data = {
-                    key: {
-                        "Lines": [],
-                        "Total": self._convert_string_value_to_float(row.get("Summary").get("ColData")[column_enum].get("value"))
-                    }
-                }
-                data_dict.update(data)
-                input.append(data_dict)
-                self._get_row_data(resp=row, input=data_dict[key]["Lines"], column_enum=column_enum)
+    def _get_section_key(self, value: str) -> str:
+        '''Converts a row title into an interned ReportData key.'''
+        return sys.intern(value.title().replace(" ", ""))
+
+    def _get_row_data(self, resp, column_enums: List[int], inputs: List[List]) -> List[List]:
+        '''Walks the Rows tree once, appending the lines of every row
+        to the input of each requested column at the same time.
+        '''
+        for row in resp.get("Rows").get("Row") or []:
+            is_section = row.get("type") == "Section" and row.get("Rows") is not None
+            if is_section:
+                key_data = row.get("Header").get("ColData")
+                total_data = row.get("Summary").get("ColData")
             elif row.get("Summary") is not None:
-                data_dict = {}
-                key = row.get("Summary").get("ColData")[0].get("value").title().replace(" ", "")
-                data = {
-                    key: {
-                        "Lines": [],
-                        "Total": self._convert_string_value_to_float(row.get("Summary").get("ColData")[column_enum].get("value"))
-                    }
-                }
-                data_dict.update(data)
-                input.append(data_dict)
+                key_data = total_data = row.get("Summary").get("ColData")
             else:
-                data_dict = {}
-                key = row.get("ColData")[0].get("value").title().replace(" ", "")
-                data = {
+                key_data = total_data = row.get("ColData")
+
+            key = self._get_section_key(key_data[0].get("value"))
+            lines = []
+            for column_enum, input in zip(column_enums, inputs):
+                column_lines: List[Dict] = []
+                input.append({
                     key: {
-                        "Lines": [],
-                        "Total": self._convert_string_value_to_float(row.get("ColData")[column_enum].get("value"))
+                        "Lines": column_lines,
+                        "Total": self._convert_string_value_to_float(total_data[column_enum].get("value"))
                     }
-                }
-                data_dict.update(data)
-                input.append(data_dict)
+                })
+                lines.append(column_lines)
+
+            if is_section:
+                self._get_row_data(resp=row, column_enums=column_enums, inputs=lines)
 
-        return input
+        return inputs
 
     def _transform_columns_into_rows(self, resp):
         records = []
@@ -213,60 +716,261 @@ class QuickbooksStream:
 
         return records
 
+    def _get_sync_properties(self) -> Dict[str, str]:
+        '''Returns the properties the tap adds to every record of the run.'''
+        properties = {"SyncTimestampUtc": singer.utils.strftime(self.sync_started_at, "%Y-%m-%dT%H:%M:%SZ")}
+        if self.config.get("realms"):
+            properties["RealmId"] = self.config.get("realm_id")
+        return properties
+
+    def _write_records(self, records: Iterable[Dict], counter, version: Optional[int] = None,
+                       transformer: Optional[Transformer] = None):
+        '''Transforms and writes records, sharing one Transformer
+        and the same sync timestamps across every record of the run.
+        '''
+        if transformer is None:
+            with Transformer() as transformer:
+                return self._write_records(records, counter, version=version, transformer=transformer)
+
+        sync_properties = self._get_sync_properties()
+        if not self.profiler.enabled:
+            # Timing every record is only worth its cost when instrumented.
+            for record in records:
+                record.update(sync_properties)
+                self.writer.write_record(stream=self.stream,
+                                         record=transformer.transform(data=record, schema=self.schema),
+                                         version=version,
+                                         time_extracted=self.sync_started_at)
+                counter.increment()
+            return
+
+        transform_seconds = write_seconds = 0.0
+        record_count = 0
+        for record in records:
+            record.update(sync_properties)
+            started_at = time.perf_counter()
+            transformed_record = transformer.transform(data=record, schema=self.schema)
+            transformed_at = time.perf_counter()
+            self.writer.write_record(stream=self.stream,
+                                     record=transformed_record,
+                                     version=version,
+                                     time_extracted=self.sync_started_at)
+            write_seconds += time.perf_counter() - transformed_at
+            transform_seconds += transformed_at - started_at
+            record_count += 1
+            counter.increment()
+        self.profiler.add_time(self.tap_stream_id, "transform", transform_seconds, calls=record_count)
+        self.profiler.add_time(self.tap_stream_id, "write", write_seconds, calls=record_count)
+
+    def _is_columnar(self) -> bool:
+        '''Returns whether records are written to columnar files instead of stdout.'''
+        return self.config.get("output_format", "singer") != "singer"
+
+    def _get_output_dir(self) -> str:
+        '''Returns the directory holding the stream's columnar files for the realm.'''
+        return os.path.join(self.config["output_dir"], self.stream, str(self.config.get("realm_id")))
+
+    def _get_window_path(self, window: Tuple[date, date]) -> str:
+        '''Returns the columnar file of a date window, which is
+        `<output_dir>/<stream>/<realm_id>/<start_date>.parquet`. The last
+        window ends on the day of the run, so later runs rewriting the same
+        window replace its file rather than adding one.
+        '''
+        return os.path.join(self._get_output_dir(), f"{window[0].isoformat()}.parquet")
+
+    def _remove_stale_files(self, written_paths: Iterable[Optional[str]]):
+        '''Removes the columnar files of a full table sync that it did not
+        write, as an ACTIVATE_VERSION message would drop their rows.
+        '''
+        output_dir = self._get_output_dir()
+        if not os.path.isdir(output_dir):
+            return
+        for file_name in os.listdir(output_dir):
+            path = os.path.join(output_dir, file_name)
+            if file_name.endswith(".parquet") and path not in written_paths:
+                LOGGER.info(f"Removing {path}, which this {self.tap_stream_id} sync replaces..")
+                os.remove(path)
+
+    def _write_parquet(self, window: Tuple[date, date], records: Iterable[Dict], counter) -> str:
+        '''Writes the records of a date window to their own Parquet file,
+        typed by the stream's schema rather than transformed record by record.
+        '''
+        # pyarrow is slow to import, so sync runs writing Singer messages never load it.
+        from .columnar import (DEFAULT_BATCH_SIZE, DEFAULT_COMPRESSION,
+                               ParquetWindowWriter)
+
+        sync_properties = self._get_sync_properties()
+        path = self._get_window_path(window)
+        write_seconds = 0.0
+        with ParquetWindowWriter(path, self.schema, dictionary_columns=self.dictionary_columns,
+                                 batch_size=int(self.config.get("parquet_batch_size", DEFAULT_BATCH_SIZE)),
+                                 compression=self.config.get("parquet_compression", DEFAULT_COMPRESSION)) as window_writer:
+            for record in records:
+                record.update(sync_properties)
+                if not self.profiler.enabled:
+                    window_writer.write(record)
+                else:
+                    started_at = time.perf_counter()
+                    window_writer.write(record)
+                    write_seconds += time.perf_counter() - started_at
+                counter.increment()
+            # Closing the writer writes its last row group.
+            started_at = time.perf_counter()
+        write_seconds += time.perf_counter() - started_at
+        self.profiler.add_time(self.tap_stream_id, "write", write_seconds, calls=window_writer.record_count)
+        LOGGER.info(f"Wrote {window_writer.record_count} {self.tap_stream_id} records to {path}..")
+        return path
+
+    def _write_window(self, window: Tuple[date, date], records: Iterable[Dict], counter,
+                      version: Optional[int] = None, transformer: Optional[Transformer] = None) -> Optional[str]:
+        '''Writes the records of a date window in the configured `output_format`,
+        returning the path of the columnar file written, if any.
+        '''
+        if self._is_columnar():
+            return self._write_parquet(window, records, counter)
+        self._write_records(records, counter, version=version, transformer=transformer)
+        return None
+
     def write_schema_message(self):
-        '''Writes a Singer schema message.'''
-        return singer.write_schema(stream_name=self.stream, schema=self.schema, key_properties=self.key_properties)
+        '''Writes a Singer schema message. Columnar output
+        carries its own schema, so none is written for it.
+        '''
+        if self._is_columnar():
+            return
+        return self.writer.write_schema(stream=self.stream, schema=self.schema,
+                                        key_properties=self.get_key_properties(self.config))
 
+    def write_version_message(self):
+        '''Writes a Singer activate version message for streams
+        whose table is replaced by every sync. Other streams write none.
+        '''
 
-class ProfitAndLossStream(QuickbooksStream):
-    tap_stream_id: ClassVar[str] = 'profit_and_loss'
-    stream: ClassVar[str] = 'profit_and_loss'
+
+class SummaryReportStream(QuickbooksStream):
+    '''Flattens reports summarized by column, such as ProfitAndLoss
+    summarized by month, into one record per column. Each record holds
+    the column's totals for every row of the report under ReportData.
+    '''
     key_properties: ClassVar[str] = 'StartDate'
-    replication_method: ClassVar[str] = 'FULL_TABLE'
+    report_entity: ClassVar[str]
+    dictionary_columns: ClassVar[List[str]] = ['ColKey', 'RealmId']
+    params: ClassVar[Dict[str, str]] = {"summarize_column_by": "Month"}
+
+    def __init__(self, config: Dict, args: argparse.Namespace, **kwargs):
+        self.schema = self.get_schema(config)
+        super().__init__(config, args, **kwargs)
+
+    def _get_window(self, auth_client, window: Tuple[date, date]) -> Dict:
+        '''Fetches the report for a single date window.'''
+        return self._get(auth_client=auth_client, report_entity=self.report_entity,
+                         params=self._get_window_params(window))
 
-    def __init__(self, config: Dict, args: Dict):
-        self.schema = self._load_schema()
-        super().__init__(config, args)
+    def _get_records(self, resp) -> List[Dict]:
+        '''Builds one record per month column of a report.'''
+        rows = self._transform_columns_into_rows(resp)
+
+        # Money column i is the (i + 1)th ColData entry of every row.
+        column_enums = [i + 1 for i, row in enumerate(rows) if row.get("StartDate") is not None]
+        rows = [row for row in rows if row.get("StartDate") is not None]
+        inputs = self._get_row_data(resp=resp, column_enums=column_enums, inputs=[[] for _ in rows])
+
+        for row, data in zip(rows, inputs):
+            new_data = {}
+            for line in data:
+                new_data.update(line)
+            row["ReportData"] = new_data
+
+        return rows
 
     def sync(self):
+        backfill = self._is_backfill()
         with singer.metrics.job_timer(job_type=f"sync_{self.tap_stream_id}"):
             with singer.metrics.record_counter(endpoint=self.tap_stream_id) as counter:
-                client = self._get_auth_client()
-                params = {
-                    "start_date": singer.utils.strftime(singer.utils.now() - timedelta(days=365), format_str='%Y-%m-01'),
-                    "end_date": singer.utils.strftime(singer.utils.now(), format_str="%Y-%m-%d"),
-                    "accounting_method": "Accrual",
-                    "summarize_column_by": "Month"
-                }
-                resp = self._get(auth_client=client, report_entity='ProfitAndLoss', params=params)
-                rows = self._transform_columns_into_rows(resp)
-
-                for i, row in enumerate(rows):
-                    if row.get("StartDate") is None:
-                        continue
-                    input = []
-                    data = self._get_row_data(resp=resp, column_enum=i + 1, input=input)
-                    new_data = {}
-                    for line in data:
-                        new_data.update(line)
-                    row["ReportData"] = new_data
-                    row["SyncTimestampUtc"] = singer.utils.strftime(singer.utils.now(), "%Y-%m-%dT%H:%M:%SZ")
-
-                    with singer.Transformer() as transformer:
-                        transformed_record = transformer.transform(data=row, schema=self.schema)
-                        singer.write_record(stream_name=self.stream, time_extracted=singer.utils.now(), record=transformed_record)
-                        counter.increment()
-
-
-class ProfitAndLossDetailStream(QuickbooksStream):
-    tap_stream_id: ClassVar[str] = 'profit_and_loss_detail'
-    stream: ClassVar[str] = 'profit_and_loss_detail'
+                with self.profiler.stage(self.tap_stream_id, "auth"):
+                    client = self._get_auth_client()
+                written_paths = []
+                for window, resp in self._fetch_windows(self._get_windows(), partial(self._get_window, client),
+                                                        partial(self._fetch_report, client)):
+                    with self.profiler.stage(self.tap_stream_id, "flatten"):
+                        records = self._get_records(resp)
+                    written_paths.append(self._write_window(window, records, counter))
+                    if backfill:
+                        self._write_backfill_checkpoint(window[1])
+                if self._is_columnar() and not backfill:
+                    self._remove_stale_files(written_paths)
+
+
+class DetailReportStream(QuickbooksStream):
+    '''Flattens detail reports, such as ProfitAndLossDetail, into one
+    record per transaction row. Each record holds the row's columns along
+    with the titles of the sections it is nested in under Categories.
+    '''
     key_properties: ClassVar[List[str]] = []
-    replication_method: ClassVar[str] = 'FULL_TABLE'
+    replication_methods: ClassVar[List[str]] = ['FULL_TABLE', 'INCREMENTAL']
+    report_entity: ClassVar[str]
+    params: ClassVar[Dict[str, str]] = {}
+    numeric_columns: ClassVar[List[str]] = ['Amount', 'Balance']
+    # Running totals, which change on every later row when an earlier one does.
+    fingerprint_exclude: ClassVar[Tuple[str, ...]] = ('Balance',)
+    dictionary_columns: ClassVar[List[str]] = ['TransactionType', 'Name', 'Split', 'Account', 'Categories', 'RealmId']
+    # First column values of rows that label a section rather than a transaction.
+    label_rows: ClassVar[List[str]] = []
+    # Title of the column whose ColData `id` identifies a row's transaction.
+    id_column: ClassVar[str] = "Transaction Type"
+    # Values of the report's `columns` param that request each property.
+    api_columns: ClassVar[Dict[str, str]] = {
+        "Date": "tx_date",
+        "TransactionType": "txn_type",
+        "Num": "doc_num",
+        "Name": "name",
+        "Memo": "memo",
+        "Split": "split_acc",
+        "Amount": "subt_nat_amount",
+        "Balance": "rbal_nat_amount"
+    }
+
+    def __init__(self, config: Dict, args: argparse.Namespace, **kwargs):
+        self.schema = self.get_schema(config)
+        self._categories: Dict[Tuple[str, ...], List[str]] = {}
+        super().__init__(config, args, **kwargs)
+
+    @classmethod
+    def _uses_row_ids(cls, config: Dict) -> bool:
+        '''Returns whether records are keyed by a RowId, which they are
+        whenever rows already written can be sent again: under change
+        capture, and when incremental syncs re-fetch their lookback.
+        '''
+        return bool(config.get("change_capture_path")) or config.get("replication_method") == 'INCREMENTAL'
+
+    @classmethod
+    def get_schema(cls, config: Dict) -> Dict:
+        '''Returns the stream's JSON schema, which gains a RowId and the
+        TransactionId when records are keyed by RowId, and a deletion
+        marker under change capture.
+        '''
+        schema = cls._load_schema()
+        if config.get("change_capture_path"):
+            schema["properties"].update(CHANGE_CAPTURE_PROPERTIES)
+        elif cls._uses_row_ids(config):
+            schema["properties"].update(ROW_ID_PROPERTIES)
+        return schema
 
-    def __init__(self, config: Dict, args: Dict):
-        self.schema = self._load_schema()
-        super().__init__(config, args)
+    @classmethod
+    def get_automatic_properties(cls, config: Dict) -> List[str]:
+        automatic_properties = super().get_automatic_properties(config)
+        if cls._uses_row_ids(config):
+            # Rows are identified by their transaction and categories, and
+            # transactions by the ColData id of their TransactionType.
+            automatic_properties.extend(["Categories", "TransactionType", *ROW_ID_PROPERTIES])
+        if config.get("change_capture_path"):
+            automatic_properties.append("_sdc_deleted_at")
+        return automatic_properties
+
+    @classmethod
+    def get_key_properties(cls, config: Dict) -> List[str]:
+        if not cls._uses_row_ids(config):
+            return super().get_key_properties(config)
+        return ["RealmId", "RowId"] if config.get("realms") else ["RowId"]
 
     def _get_column_metadata(self, resp):
         columns = []
@@ -275,78 +979,439 @@ class ProfitAndLossDetailStream(QuickbooksStream):
                 columns.append("Memo")
             else:
                 columns.append(column.get("ColTitle").replace(" ", ""))
-        columns.append("Categories")
+        columns.extend(["Categories", "TransactionId"])
         return columns
 
-    def _recursive_row_search(self, row, output, categories):
-        row_group = row.get("Rows")
-        if 'ColData' in list(row.keys()):
-            # Write the row
-            data = row.get("ColData")
-            values = [column.get("value") for column in data]
-            categories_copy = categories.copy()
-            values.append(categories_copy)
-            values_copy = values.copy()
-            output.append(values_copy)
-        elif row_group is None or row_group == {}:
-            pass
-        else:
-            row_array = row_group.get("Row")
-            header = row.get("Header")
-            if header is not None:
-                categories.append(header.get("ColData")[0].get("value"))
-            for row in row_array:
-                self._recursive_row_search(row, output, categories)
-            if header is not None:
-                categories.pop()
+    def _iter_rows(self, row_array: List[Dict], id_index: Optional[int] = None,
+                   categories: Optional[List[str]] = None) -> Iterator[List]:
+        '''Walks a Rows tree depth first without recursion, yielding the
+        ColData values of every data row followed by its categories and
+        the `id` of its id_index'th ColData, which identifies the row's
+        transaction. Each section builds its categories list once and
+        every row beneath it shares that list. Rows of a sub-section
+        start from the categories of the sections holding it.
+        '''
+        stack: List[Tuple[Iterator[Dict], List[str]]] = [(iter(row_array), categories or [])]
+        while stack:
+            rows, categories = stack[-1]
+            row = next(rows, None)
+            if row is None:
+                stack.pop()
+            elif "ColData" in row:
+                col_data = row["ColData"]
+                values = [column.get("value") for column in col_data]
+                values.append(categories)
+                values.append(col_data[id_index].get("id") if id_index is not None and id_index < len(col_data) else None)
+                yield values
+            elif row.get("Rows"):
+                header = row.get("Header")
+                if header is not None:
+                    categories = categories + [header.get("ColData")[0].get("value")]
+                stack.append((iter(row["Rows"].get("Row") or []), categories))
+
+    def _get_rows(self, resp) -> Iterator[List]:
+        '''Flattens the Rows tree of a decoded report response.'''
+        row_array = resp.get("Rows").get("Row")
+
+        if row_array is None:
+            LOGGER.info("Report has no rows!")
+            return iter([])
+
+        return self._iter_rows(row_array, get_id_index(resp.get("Columns"), self.id_column))
+
+    def _flatten_report(self, resp) -> Tuple[List[str], Iterable]:
+        '''Returns the column names of a decoded report response and its
+        flattened rows, or the batches of serialised records its rows are
+        being turned into when a transform pool is configured.
+        '''
+        columns = self._get_column_metadata(resp)
+        if self.transform_pool is None:
+            return columns, self._get_rows(resp)
+        spec = StreamSpec(type(self), self.config, self.selected_properties, self.sync_started_at)
+        return columns, self.transform_pool.submit(spec, columns, get_id_index(resp.get("Columns"), self.id_column),
+                                                   resp.get("Rows").get("Row") or [], self._get_record_version())
+
+    def _transform_batch(self, columns: List[str], id_index: Optional[int], batch: List[Tuple[List[Dict], List[str]]],
+                         version: Optional[int]) -> SectionBatch:
+        '''Flattens, transforms and serialises a batch of a report's rows.
+        Runs in a transform worker, which writes nothing itself.
+        '''
+        started_at = time.perf_counter()
+        rows = [row for row_array, categories in batch
+                for row in self._get_detail_rows(columns, self._iter_rows(row_array, id_index, categories))]
+        flattened_at = time.perf_counter()
+        sync_properties = self._get_sync_properties()
+        time_extracted = format_time_extracted(self.sync_started_at)
+        lines = []
+        with Transformer() as transformer:
+            for row in rows:
+                record = row.to_dict()
+                record.update(sync_properties)
+                lines.append(format_record(self.stream, transformer.transform(data=record, schema=self.schema),
+                                           version=version, time_extracted=time_extracted))
+        return SectionBatch(lines, flattened_at - started_at, time.perf_counter() - flattened_at)
+
+    def _write_batches(self, batches: Iterable[SectionBatch], counter):
+        '''Writes batches of serialised records in report order as they are transformed.'''
+        for batch in batches:
+            self.profiler.add_time(self.tap_stream_id, "flatten", batch.flatten_seconds, calls=len(batch.lines))
+            self.profiler.add_time(self.tap_stream_id, "transform", batch.transform_seconds, calls=len(batch.lines))
+            with self.profiler.stage(self.tap_stream_id, "write"):
+                self.writer.write_lines(batch.lines)
+            counter.increment(len(batch.lines))
+
+    def _stream_rows(self, response, rows: Iterator[List]) -> Iterator[List]:
+        '''Yields rows parsed from a streaming response or cached
+        body, closing it once they are exhausted.
+        '''
+        try:
+            yield from rows
+        finally:
+            self._record_download(response)
+            response.close()
+
+    def _parse_window(self, body) -> Tuple[List[str], Iterable[List]]:
+        '''Incrementally parses a report body, closing it once its rows are read.'''
+        try:
+            report_columns, rows = parse_report(body, self.id_column)
+        except Exception:
+            body.close()
+            raise
+        return self._get_column_metadata({"Columns": report_columns}), self._stream_rows(body, rows)
+
+    def _fetch_windows(self, windows: List[Tuple[date, date]], get_window: Callable[[Tuple[date, date]], Any],
+                       fetch_report: Optional[Callable[[Tuple[date, date]], Coroutine[Any, Any, bytes]]] = None
+                       ) -> Iterator[Tuple[Tuple[date, date], Any]]:
+        '''Fetches date windows like QuickbooksStream._fetch_windows, except
+        that streamed responses are opened one window after another. A
+        prefetched streaming response would sit unread while earlier windows
+        are parsed, and could time out mid-body without being retried.
+        '''
+        if not self.config.get("stream_responses"):
+            return super()._fetch_windows(windows, get_window, fetch_report)
+        return ((window, get_window(window)) for window in windows)
+
+    def _check_backfill(self):
+        '''Also rejects full table backfills of detail streams without change
+        capture. Their rows carry no key, so running a backfill again would
+        duplicate them, and the next full table sync's ACTIVATE_VERSION
+        message would retire them.
+        '''
+        super()._check_backfill()
+        if self._get_replication_method() == 'FULL_TABLE' and not self.config.get("change_capture_path"):
+            raise ValueError(f"--backfill requires the INCREMENTAL replication_method or change_capture_path "
+                             f"for {self.tap_stream_id}.")
+
+    def _skip_unchanged(self) -> bool:
+        '''Returns whether windows whose re-fetched report matches the cached
+        copy should be skipped. Full table syncs must re-emit every record
+        under their new table version, so only incremental syncs skip them.
+        '''
+        return bool(self.config.get("cache_skip_unchanged")) and self._get_replication_method() == 'INCREMENTAL'
+
+    def _get_api_columns(self) -> Optional[str]:
+        '''Returns the `columns` param requesting only the selected
+        properties, or None when every column should be requested.
+        '''
+        if self.selected_properties is None:
+            return None
+        api_columns = [api_column for name, api_column in self.api_columns.items() if name in self.schema["properties"]]
+        return ",".join(api_columns) or None
+
+    def _get_window_params(self, window: Tuple[date, date]) -> Dict:
+        params = super()._get_window_params(window)
+        api_columns = self._get_api_columns()
+        if api_columns is not None:
+            params["columns"] = api_columns
+        return params
+
+    def _load_window(self, content: bytes) -> Tuple[List[str], Iterable[List]]:
+        return self._flatten_report(super()._load_window(content))
+
+    def _get_windows(self) -> List[Tuple[date, date]]:
+        if self._is_backfill():
+            return self._get_backfill_windows()
+        return self._get_date_windows(*self._get_sync_period())
+
+    def _get_window(self, auth_client, window: Tuple[date, date]) -> Tuple[List[str], Iterable[List]]:
+        '''Fetches the report for a single date window, returning
+        its column names and an iterable of its flattened rows.
+        '''
+        start_date, end_date = window
+        params = self._get_window_params(window)
+        if self.response_cache is not None:
+            body, changed = self._open_report(auth_client, self.report_entity, params=params)
+            if not changed and self._skip_unchanged():
+                body.close()
+                LOGGER.info(f"Report for {start_date} to {end_date} is unchanged, skipping..")
+                return [], iter([])
+            if self.config.get("stream_responses"):
+                return self._parse_window(body)
+            with body, self.profiler.stage(self.tap_stream_id, "decode"):
+                resp = json.load(body)
+            return self._flatten_report(resp)
+
+        if self.config.get("stream_responses"):
+            response = self._get_stream(auth_client=auth_client, report_entity=self.report_entity, params=params)
+            try:
+                report_columns, rows = parse_report(response.raw, self.id_column)
+            except Exception:
+                response.close()
+                raise
+            return self._get_column_metadata({"Columns": report_columns}), self._stream_rows(response, rows)
+
+        resp = self._get(auth_client=auth_client, report_entity=self.report_entity, params=params)
+        return self._flatten_report(resp)
+
+    def _intern_categories(self, categories: List[str]) -> List[str]:
+        '''Returns the shared copy of a category path, so that rows
+        of every window and report with the same path share one list.
+        '''
+        key = tuple(categories)
+        try:
+            return self._categories[key]
+        except KeyError:
+            interned = self._categories[key] = [sys.intern(category) for category in categories]
+            return interned
+
+    def _get_detail_rows(self, columns: List[str], rows: Iterable[List]) -> Iterator[DetailRow]:
+        '''Converts the flattened rows of a single report into compact rows
+        of the columns of its schema, leaving out unselected columns.
+        Numeric columns are parsed once here, and empty values become None.
+        '''
+        properties = self.schema["properties"]
+        selected_columns = [(index, column) for index, column in enumerate(columns) if column in properties]
+        row_type = get_row_type(tuple(column for _, column in selected_columns))
+        kinds = [(index, "number" if column in self.numeric_columns else "categories" if column == "Categories" else "string")
+                 for index, column in selected_columns]
+        # Rows of a section share its categories list, so consecutive rows
+        # usually look up the same path and can skip the interning.
+        last_categories: Optional[List[str]] = None
+        interned_categories: List[str] = []
+        for raw_row in rows:
+            if self.label_rows and raw_row[0] in self.label_rows:
+                continue
+            values = []
+            for index, kind in kinds:
+                value = raw_row[index]
+                if kind == "string":
+                    values.append(None if value == "" else value)
+                elif kind == "number":
+                    values.append(self._convert_string_value_to_float(value))
+                else:
+                    if value is not last_categories:
+                        last_categories, interned_categories = value, self._intern_categories(value)
+                    values.append(interned_categories)
+            yield row_type(values)
+
+    def _get_records(self, columns: List[str], rows: Iterable[List]) -> Iterator[Dict]:
+        '''Zips the flattened rows of a single report with the
+        columns of its schema, leaving out unselected columns.
+        '''
+        return (row.to_dict() for row in self._get_detail_rows(columns, rows))
+
+    def _get_sync_period(self) -> Tuple[date, date]:
+        '''Returns the period to sync. Incremental syncs resume from the
+        bookmarked end date, re-fetching the `lookback_months` calendar months
+        before it so that changes to still-open periods are picked up.
+        '''
+        start_date, end_date = self._get_report_period()
+        if self._get_replication_method() != 'INCREMENTAL':
+            return start_date, end_date
+
+        bookmark = self.state.get_bookmark(self.tap_stream_id, self.config["realm_id"], "end_date")
+        if bookmark is None:
+            return start_date, end_date
+
+        lookback_months = int(self.config.get("lookback_months", DEFAULT_LOOKBACK_MONTHS))
+        bookmark_date = datetime.strptime(bookmark, "%Y-%m-%d").date()
+        return min(first_of_month(bookmark_date, -lookback_months), end_date), end_date
+
+    def _get_record_version(self) -> Optional[int]:
+        '''Returns the table version RECORD messages carry. Only full table
+        syncs replace the table, so other syncs write records without one.
+        '''
+        replaces_table = not (self._is_backfill() or self.config.get("change_capture_path"))
+        if self._get_replication_method() == 'FULL_TABLE' and replaces_table:
+            return self.version
+        return None
+
+    def _capture_changes(self, window: Tuple[date, date], rows: Iterable[DetailRow], previous: Optional[Dict[str, str]],
+                         fingerprints: Dict[str, str]) -> Iterator[Dict]:
+        '''Yields records for the rows of a window that are new or changed
+        since they were last written, followed by a deletion marker for
+        every previously written row that the window no longer holds.
+        '''
+        changed = 0
+        for row_id, row in diff_rows(rows, previous, fingerprints, self.fingerprint_exclude):
+            record = row.to_dict()
+            record["RowId"] = row_id
+            changed += 1
+            yield record
+
+        deleted = [row_id for row_id in previous or {} if row_id not in fingerprints]
+        deleted_at = singer.utils.strftime(self.sync_started_at, "%Y-%m-%dT%H:%M:%SZ")
+        for row_id in deleted:
+            yield {"RowId": row_id, "_sdc_deleted_at": deleted_at}
+        LOGGER.info(f"{self.tap_stream_id} {window[0]} to {window[1]}: {len(fingerprints)} rows, "
+                    f"{changed} new or changed, {len(deleted)} deleted..")
+
+    def _commit_change_index(self, change_index: ChangeIndex, window: Tuple[date, date], fingerprints: Dict[str, str],
+                             generations: Dict[str, str]):
+        '''Saves a new generation of a window's index once its changes are
+        written, and names it in the STATE message that follows them. Later
+        runs only compare against it once the target hands that state back,
+        so changes a target failed to load are sent again.
+        '''
+        window_start = window[0].isoformat()
+        previous_generation = generations.get(window_start)
+        generation = str(self.version)
+        change_index.save(window, generation, fingerprints)
+        generations[window_start] = generation
+        self.state.write_bookmark(self.tap_stream_id, self.config["realm_id"], "change_index", dict(generations))
+        # The confirmed generation is kept until a state naming the new one is passed in.
+        change_index.prune(window, keep=[previous_generation, generation])
+
+    def _remove_stale_change_indexes(self, change_index: ChangeIndex, windows: List[Tuple[date, date]],
+                                     generations: Dict[str, str]):
+        '''Removes the indexes, and their generations in the State file, of
+        windows that have dropped out of the report period.
+        '''
+        window_starts = {window[0].isoformat() for window in windows}
+        change_index.prune_windows(window_starts)
+        stale = [window_start for window_start in generations if window_start not in window_starts]
+        if stale:
+            for window_start in stale:
+                del generations[window_start]
+            self.state.write_bookmark(self.tap_stream_id, self.config["realm_id"], "change_index", dict(generations))
+
+    def write_version_message(self):
+        # Backfills only add history, so they must not retire the rows of other periods,
+        # and change capture leaves unchanged rows to the target.
+        replaces_table = not (self._is_backfill() or self._is_columnar() or self.config.get("change_capture_path"))
+        if self._get_replication_method() == 'FULL_TABLE' and replaces_table:
+            return self.writer.write_version(stream=self.stream, version=self.version)
 
     def sync(self):
-        singer_version = int(datetime.utcnow().timestamp())
+        backfill = self._is_backfill()
+        incremental = self._get_replication_method() == 'INCREMENTAL'
+        change_index = ChangeIndex.from_config(self.config, self.tap_stream_id)
+        # The index generations the State file passed in confirms were loaded.
+        generations = dict(self.state.get_bookmark(self.tap_stream_id, self.config["realm_id"], "change_index") or {})
+        version = self._get_record_version()
         with singer.metrics.job_timer(job_type=f"sync_{self.tap_stream_id}"):
             with singer.metrics.record_counter(endpoint=self.tap_stream_id) as counter:
-                client = self._get_auth_client()
-                params = {
-                    "start_date": singer.utils.strftime(singer.utils.now() - timedelta(days=365), format_str='%Y-%m-01'),
-                    "end_date": singer.utils.strftime(singer.utils.now(), format_str="%Y-%m-%d"),
-                    "accounting_method": "Accrual"
-                }
-                resp = self._get(auth_client=client, report_entity='ProfitAndLossDetail', params=params)
-
-                # Get column metadata.
-                columns = self._get_column_metadata(resp)
-
-                # Recursively get row data.
-                row_group = resp.get("Rows")
-                row_array = row_group.get("Row")
-
-                if row_array is None:
-                    return LOGGER.info("Report has no rows!")
-
-                output = []
-                categories = []
-                for row in row_array:
-                    self._recursive_row_search(row, output, categories)
-
-                # Zip columns and row data.
-                for raw_row in output:
-                    row = dict(zip(columns, raw_row))
-                    cleansed_row = {}
-                    for k, v in row.items():
-                        if v == "":
-                            continue
-                        else:
-                            cleansed_row.update({k: v})
-
-                    cleansed_row["Amount"] = float(row.get("Amount"))
-                    cleansed_row["Balance"] = float(row.get("Balance"))
-                    cleansed_row["SyncTimestampUtc"] = singer.utils.strftime(singer.utils.now(), "%Y-%m-%dT%H:%M:%SZ")
-
-                    with singer.Transformer() as transformer:
-                        transformed_record = transformer.transform(data=cleansed_row, schema=self.schema)
-                        singer.write_message(singer.RecordMessage(stream=self.stream,
-                                                                  record=transformed_record,
-                                                                  version=singer_version,
-                                                                  time_extracted=singer.utils.now()))
-                        counter.increment()
-
-        singer.write_version(stream_name=self.stream, version=singer_version)
+                with self.profiler.stage(self.tap_stream_id, "auth"):
+                    client = self._get_auth_client()
+                # Windows are fetched concurrently, but are yielded in
+                # window order so records stay date-ordered.
+                windows = self._get_windows()
+                written_paths = []
+                with Transformer() as transformer:
+                    for window, (columns, rows) in self._fetch_windows(windows, partial(self._get_window, client),
+                                                                       partial(self._fetch_report, client)):
+                        window_end = window[1]
+                        # Windows skipped as unchanged have no columns, and must
+                        # not replace the columnar file written by an earlier run.
+                        if columns and isinstance(rows, SectionResults):
+                            self._write_batches(rows, counter)
+                        elif columns:
+                            detail_rows = self.profiler.iter_stage(self.tap_stream_id, "flatten",
+                                                                   self._get_detail_rows(columns, rows))
+                            fingerprints = {}
+                            if change_index is None and self._uses_row_ids(self.config):
+                                # Re-fetched rows carry the same RowId, so targets update them in place.
+                                records = ({**row.to_dict(), "RowId": row_id} for row_id, row in get_row_ids(detail_rows, self.fingerprint_exclude))
+                            elif change_index is None:
+                                # Rows only become record dicts as they are written.
+                                records = (row.to_dict() for row in detail_rows)
+                            else:
+                                previous = change_index.load(window, generations.get(window[0].isoformat()))
+                                records = self._capture_changes(window, detail_rows, previous, fingerprints)
+                            written_paths.append(self._write_window(window, records, counter, version=version,
+                                                                    transformer=transformer))
+                            if change_index is not None:
+                                self._commit_change_index(change_index, window, fingerprints, generations)
+                        if backfill:
+                            self._write_backfill_checkpoint(window_end)
+                        elif incremental:
+                            self.state.write_bookmark(self.tap_stream_id, self.config["realm_id"],
+                                                      "end_date", window_end.isoformat())
+                if self._is_columnar() and not (backfill or incremental):
+                    self._remove_stale_files(written_paths)
+                if change_index is not None and not (backfill or incremental):
+                    self._remove_stale_change_indexes(change_index, windows, generations)
+
+
+class ProfitAndLossStream(SummaryReportStream):
+    tap_stream_id: ClassVar[str] = 'profit_and_loss'
+    stream: ClassVar[str] = 'profit_and_loss'
+    report_entity: ClassVar[str] = 'ProfitAndLoss'
+    params: ClassVar[Dict[str, str]] = {"accounting_method": "Accrual", "summarize_column_by": "Month"}
+
+
+class ProfitAndLossDetailStream(DetailReportStream):
+    tap_stream_id: ClassVar[str] = 'profit_and_loss_detail'
+    stream: ClassVar[str] = 'profit_and_loss_detail'
+    report_entity: ClassVar[str] = 'ProfitAndLossDetail'
+    params: ClassVar[Dict[str, str]] = {"accounting_method": "Accrual"}
+
+
+class BalanceSheetStream(SummaryReportStream):
+    tap_stream_id: ClassVar[str] = 'balance_sheet'
+    stream: ClassVar[str] = 'balance_sheet'
+    report_entity: ClassVar[str] = 'BalanceSheet'
+    params: ClassVar[Dict[str, str]] = {"accounting_method": "Accrual", "summarize_column_by": "Month"}
+
+
+class CashFlowStream(SummaryReportStream):
+    tap_stream_id: ClassVar[str] = 'cash_flow'
+    stream: ClassVar[str] = 'cash_flow'
+    report_entity: ClassVar[str] = 'CashFlow'
+    params: ClassVar[Dict[str, str]] = {"summarize_column_by": "Month"}
+
+
+class GeneralLedgerStream(DetailReportStream):
+    tap_stream_id: ClassVar[str] = 'general_ledger'
+    stream: ClassVar[str] = 'general_ledger'
+    report_entity: ClassVar[str] = 'GeneralLedger'
+    params: ClassVar[Dict[str, str]] = {"accounting_method": "Accrual"}
+    label_rows: ClassVar[List[str]] = ['Beginning Balance']
+
+
+class TransactionListStream(DetailReportStream):
+    tap_stream_id: ClassVar[str] = 'transaction_list'
+    stream: ClassVar[str] = 'transaction_list'
+    report_entity: ClassVar[str] = 'TransactionList'
+    numeric_columns: ClassVar[List[str]] = ['Amount']
+    api_columns: ClassVar[Dict[str, str]] = {
+        "Date": "tx_date",
+        "TransactionType": "txn_type",
+        "Num": "doc_num",
+        "Posting": "is_no_post",
+        "Name": "name",
+        "Memo": "memo",
+        "Account": "account_name",
+        "Split": "other_account",
+        "Amount": "subt_nat_amount"
+    }
+
+
+REPORT_STREAMS: Dict[str, Type[QuickbooksStream]] = {
+    stream_class.tap_stream_id: stream_class
+    for stream_class in [ProfitAndLossStream, ProfitAndLossDetailStream, BalanceSheetStream,
+                         CashFlowStream, GeneralLedgerStream, TransactionListStream]
+}
+
+DEFAULT_REPORTS = ['profit_and_loss', 'profit_and_loss_detail']
+
+
+def get_report_streams(config: Dict) -> List[Type[QuickbooksStream]]:
+    '''Returns the stream classes of the reports listed
+    under the `reports` config value, in the listed order.
+    '''
+    reports = config.get("reports") or DEFAULT_REPORTS
+    unknown_reports = [report for report in reports if report not in REPORT_STREAMS]
+    if unknown_reports:
+        raise ValueError(f"Unknown reports {unknown_reports}. Available reports are {list(REPORT_STREAMS)}.")
+    return [REPORT_STREAMS[report] for report in reports]
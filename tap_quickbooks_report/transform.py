@@ -0,0 +1,27 @@
+from typing import Dict
+
+import singer
+
+MAX_CACHED_DATETIMES = 10000
+
+
+class Transformer(singer.Transformer):
+    '''A singer Transformer that memoises date-time conversions.
+    Report rows repeat the same handful of dates, and parsing them
+    is the most expensive step of transforming a record.
+    '''
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._datetime_cache: Dict[str, str] = {}
+
+    def _transform_datetime(self, value):
+        if not isinstance(value, str):
+            return super()._transform_datetime(value)
+        try:
+            return self._datetime_cache[value]
+        except KeyError:
+            if len(self._datetime_cache) >= MAX_CACHED_DATETIMES:
+                self._datetime_cache.clear()
+            transformed = self._datetime_cache[value] = super()._transform_datetime(value)
+            return transformed
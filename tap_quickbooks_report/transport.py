@@ -0,0 +1,194 @@
+import asyncio
+import base64
+import threading
+import time
+from concurrent.futures import Future
+from typing import (Any, Awaitable, Callable, Coroutine, Dict, NamedTuple,
+                    Optional)
+
+import backoff
+import singer
+from intuitlib.config import DISCOVERY_URL
+
+from .auth import RefreshedAuthClient
+from .utils import is_fatal_status
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None  # type: ignore
+
+LOGGER = singer.get_logger()
+
+DEFAULT_ASYNC_MAX_CONCURRENCY = 50
+MAX_RETRY_SECONDS = 120
+
+if aiohttp is not None:
+    HTTP_ERRORS: tuple = (aiohttp.ClientResponseError,)
+    CONNECTION_ERRORS: tuple = (aiohttp.ClientConnectionError, asyncio.TimeoutError)
+else:
+    HTTP_ERRORS = CONNECTION_ERRORS = ()
+
+
+class _ResponseStatus(NamedTuple):
+    '''The parts of a response that a Throttle reads, named as on a requests Response.'''
+    status_code: int
+    headers: Any
+
+
+def _get_basic_auth(client_id: str, client_secret: str) -> str:
+    credentials = base64.b64encode(f"{client_id}:{client_secret}".encode()).decode()
+    return f"Basic {credentials}"
+
+
+def _is_fatal_error(e) -> bool:
+    return isinstance(e, HTTP_ERRORS) and is_fatal_status(e.status)
+
+
+async def _retry(request: Callable[[], Awaitable], stream=None, max_time: float = MAX_RETRY_SECONDS):
+    '''Awaits request(), retrying HTTP and connection errors with the
+    fibonacci backoff QuickbooksStream._request uses, and giving up on
+    fatal status codes or once max_time seconds have passed. Retries are
+    counted in the profiler of the stream making the request.
+    '''
+    started_at = time.monotonic()
+    waits = backoff.fibo()
+    tries = 0
+    while True:
+        tries += 1
+        try:
+            return await request()
+        except HTTP_ERRORS + CONNECTION_ERRORS as e:
+            elapsed = time.monotonic() - started_at
+            if _is_fatal_error(e) or elapsed >= max_time:
+                LOGGER.error(f"Giving up after {tries} tries ({e}).")
+                raise
+            wait = min(backoff.full_jitter(next(waits)), max_time - elapsed)
+            LOGGER.info(f"Backing off {wait:.1f} seconds after {tries} tries ({e}).")
+            if stream is not None:
+                stream.profiler.increment(stream.tap_stream_id, "retries")
+                stream.profiler.increment(stream.tap_stream_id, "backoff_seconds", wait)
+            await asyncio.sleep(wait)
+
+
+class AsyncTransport:
+    '''Sends report and token requests from one asyncio event loop running
+    on a background thread. Streams submit fetch() coroutines from any
+    thread and collect their results later, so requests in flight do not
+    each need a thread of their own, and realm throttles are awaited on
+    the loop. A semaphore caps the number of requests in flight, and
+    requests are retried like QuickbooksStream._request.
+    '''
+
+    def __init__(self, headers: Dict[str, str], max_concurrency: int = DEFAULT_ASYNC_MAX_CONCURRENCY,
+                 connect_timeout: Optional[float] = None, request_timeout: Optional[float] = None):
+        if aiohttp is None:
+            raise RuntimeError("The asyncio http_engine requires the async extra: "
+                               "pip install tap-quickbooks-report[async]")
+        self.headers = headers
+        self.max_concurrency = max(max_concurrency, 1)
+        self.timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=request_timeout)
+        # Token endpoints by environment, read from Intuit's discovery documents like AuthClient does.
+        self._token_endpoints: Dict[str, str] = {}
+        # Locks serialising the token refreshes of each realm, created on the loop.
+        self._refresh_locks: Dict[str, asyncio.Lock] = {}
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="async-transport", daemon=True)
+        self._thread.start()
+        self._session, self._semaphore = self._run(self._open())
+
+    async def _open(self):
+        # The session and semaphore must be created on the loop they are used from.
+        connector = aiohttp.TCPConnector(limit=self.max_concurrency)
+        session = aiohttp.ClientSession(connector=connector, headers=self.headers, timeout=self.timeout)
+        return session, asyncio.Semaphore(self.max_concurrency)
+
+    def submit(self, coroutine: Coroutine) -> Future:
+        '''Schedules a coroutine on the event loop from any thread.'''
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+
+    def _run(self, coroutine):
+        '''Runs a coroutine on the event loop and blocks until it finishes.'''
+        return self.submit(coroutine).result()
+
+    async def _fetch(self, url: str, headers: Dict[str, str], params: Optional[Dict] = None,
+                     throttle=None, stream=None) -> bytes:
+        if throttle is not None:
+            await throttle.acquire_async()
+        status: Any = None
+        try:
+            async with self._semaphore:
+                started_at = time.perf_counter()
+                async with self._session.get(url, headers=headers, params=params) as response:
+                    status = _ResponseStatus(response.status, response.headers)
+                    response.raise_for_status()
+                    body = await response.read()
+                if stream is not None:
+                    stream.profiler.add_time(stream.tap_stream_id, "http", time.perf_counter() - started_at)
+                    stream.profiler.increment(stream.tap_stream_id, "bytes_downloaded", response.content_length or len(body))
+        finally:
+            if throttle is not None:
+                throttle.release(status)
+        return body
+
+    async def fetch(self, url: str, headers: Dict[str, str], params: Optional[Dict] = None,
+                    throttle=None, stream=None) -> bytes:
+        '''Sends a GET request through a realm's throttle and returns the
+        response body. Retries are counted in the stream's profiler.
+        Must be run on the transport's event loop, through submit().
+        '''
+        return await _retry(lambda: self._fetch(url, headers, params=params, throttle=throttle, stream=stream),
+                            stream=stream)
+
+    def get(self, url: str, headers: Dict[str, str], params: Optional[Dict] = None, throttle=None, stream=None) -> bytes:
+        '''Sends a GET request like fetch(), blocking until it finishes.'''
+        return self._run(self.fetch(url, headers, params=params, throttle=throttle, stream=stream))
+
+    def get_refresh_lock(self, realm_id: str) -> asyncio.Lock:
+        '''Returns the lock serialising a realm's token refreshes.
+        Must be called on the transport's event loop.
+        '''
+        return self._refresh_locks.setdefault(realm_id, asyncio.Lock())
+
+    async def _get_discovery_doc(self, environment: str) -> Dict:
+        async with self._semaphore:
+            async with self._session.get(DISCOVERY_URL[environment]) as response:
+                response.raise_for_status()
+                return await response.json(content_type=None)
+
+    async def _get_token_endpoint(self, environment: str) -> str:
+        if environment not in self._token_endpoints:
+            discovery_doc = await _retry(lambda: self._get_discovery_doc(environment))
+            self._token_endpoints[environment] = discovery_doc["token_endpoint"]
+        return self._token_endpoints[environment]
+
+    async def _refresh(self, token_endpoint: str, client_id: str, client_secret: str, refresh_token: str) -> Dict:
+        async with self._semaphore:
+            async with self._session.post(token_endpoint,
+                                          data={"grant_type": "refresh_token", "refresh_token": refresh_token},
+                                          headers={"Authorization": _get_basic_auth(client_id, client_secret),
+                                                   "Accept": "application/json",
+                                                   "Content-Type": "application/x-www-form-urlencoded"}) as response:
+                response.raise_for_status()
+                return await response.json(content_type=None)
+
+    async def refresh(self, realm_id: str, environment: str, client_id: str, client_secret: str,
+                      refresh_token: str) -> RefreshedAuthClient:
+        '''Exchanges a Refresh Token for a new Access Token at the token
+        endpoint of the environment's OAuth2.0 discovery document.
+        Must be run on the transport's event loop, through submit().
+        '''
+        token_endpoint = await self._get_token_endpoint(environment)
+        tokens = await _retry(lambda: self._refresh(token_endpoint, client_id, client_secret, refresh_token))
+        return RefreshedAuthClient(realm_id=realm_id,
+                                   access_token=tokens["access_token"],
+                                   refresh_token=tokens["refresh_token"],
+                                   expires_in=tokens["expires_in"],
+                                   x_refresh_token_expires_in=tokens["x_refresh_token_expires_in"])
+
+    def close(self):
+        '''Closes the session and stops the event loop.'''
+        self._run(self._session.close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
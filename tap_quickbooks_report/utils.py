@@ -1,5 +1,25 @@
 import argparse
 import json
+import os
+import tempfile
+import threading
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+REALM_CONFIG_KEYS = [
+    "realm_id",
+    "refresh_token",
+    "refresh_token_expires_at"
+]
+
+_CONFIG_LOCK = threading.Lock()
+
+
+def is_fatal_status(status_code: int) -> bool:
+    '''Returns whether a response status code means retrying the request
+    cannot succeed. Client errors are fatal, except for 429 Too Many Requests.
+    '''
+    return 400 <= status_code < 500 and status_code != 429
 
 
 def load_json(path):
@@ -7,6 +27,37 @@ def load_json(path):
         return json.load(fil)
 
 
+def write_json_atomic(path, data, mode: Optional[int] = None):
+    '''Writes data as JSON to a temporary file beside path and then
+    renames it into place, so readers never see a partially written file.
+    '''
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".json")
+    try:
+        with os.fdopen(fd, "w") as fil:
+            json.dump(data, fil, indent=2)
+        if mode is not None:
+            os.chmod(temp_path, mode)
+        elif os.path.exists(path):
+            os.chmod(temp_path, os.stat(path).st_mode & 0o777)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def update_config(path, realm_id: str, values: Dict):
+    '''Updates the values stored for a realm in the config file at path,
+    whether the realm is configured at the top level or in `realms`.
+    '''
+    with _CONFIG_LOCK:
+        config = load_json(path)
+        realm_config = next((realm for realm in config.get("realms", []) if realm.get("realm_id") == realm_id), config)
+        realm_config.update(values)
+        write_json_atomic(path, config)
+
+
 def parse_args(required_config_keys):
     '''Parse standard command-line args.
     Parses the command-line arguments mentioned in the SPEC and the
@@ -17,8 +68,9 @@ def parse_args(required_config_keys):
     -p,--properties Properties file: DEPRECATED, please use --catalog instead
     -a,--auth       Establish user consent to retrieve OAuth2.0 credentials
     --catalog       Catalog file
+    --backfill      Start and end dates of a historical period to backfill
     Returns the parsed args object from argparse. For each argument that
-    point to JSON files (config, state, properties), we will automatically
+    point to JSON files (config, state, properties, catalog), we will automatically
     load and parse the JSON file.
     '''
     parser = argparse.ArgumentParser()
@@ -50,7 +102,16 @@ def parse_args(required_config_keys):
         action='store_true',
         help='Establish user consent to retrieve OAuth2.0 credentials')
 
+    parser.add_argument(
+        '--backfill',
+        nargs=2,
+        metavar=('START', 'END'),
+        type=parse_date,
+        help='Backfill the reports between two YYYY-MM-DD dates, resuming from the State file')
+
     args = parser.parse_args()
+    if args.backfill and args.backfill[0] > args.backfill[1]:
+        parser.error('--backfill START must not be after END')
     if args.config:
         setattr(args, 'config_path', args.config)
         args.config = load_json(args.config)
@@ -62,13 +123,71 @@ def parse_args(required_config_keys):
     if args.properties:
         setattr(args, 'properties_path', args.properties)
         args.properties = load_json(args.properties)
+    if args.catalog:
+        setattr(args, 'catalog_path', args.catalog)
+        args.catalog = load_json(args.catalog)
 
     check_config(args.config, required_config_keys)
 
     return args
 
 
+def parse_date(value: str) -> date:
+    '''Parses a YYYY-MM-DD command-line date.'''
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{value} is not a YYYY-MM-DD date")
+
+
 def check_config(config, required_keys):
     missing_keys = [key for key in required_keys if key not in config]
     if missing_keys:
         raise Exception("Config is missing required keys: {}".format(missing_keys))
+
+
+def get_realm_configs(config: Dict) -> List[Dict]:
+    '''Returns one config per realm to extract. A config listing several
+    companies under `realms` yields the shared config overlaid with each
+    realm's own values, otherwise the config itself is the only realm.
+    '''
+    realms = config.get("realms")
+    if not realms:
+        check_config(config, REALM_CONFIG_KEYS)
+        return [config]
+
+    realm_configs = []
+    for realm in realms:
+        check_config(realm, REALM_CONFIG_KEYS)
+        realm_configs.append({**config, **realm})
+    return realm_configs
+
+
+def first_of_month(value: date, months: int = 0) -> date:
+    '''Returns the first day of the month the given
+    number of months before or after value.
+    '''
+    month_index = value.year * 12 + value.month - 1 + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def generate_date_windows(start_date: date, end_date: date, months: Optional[int] = None) -> List[Tuple[date, date]]:
+    '''Splits the inclusive range between start_date and end_date
+    into consecutive windows aligned to calendar months, each spanning
+    at most the given number of months. When months is None the whole
+    range is returned as a single window.
+    '''
+    if start_date > end_date:
+        return []
+    if not months:
+        return [(start_date, end_date)]
+    if months < 1:
+        raise ValueError("Date windows must span at least one month.")
+
+    windows = []
+    window_start = start_date
+    while window_start <= end_date:
+        window_end = min(first_of_month(window_start, months) - timedelta(days=1), end_date)
+        windows.append((window_start, window_end))
+        window_start = window_end + timedelta(days=1)
+    return windows
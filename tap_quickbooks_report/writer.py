@@ -0,0 +1,171 @@
+import json
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import singer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None  # type: ignore
+
+LOGGER = singer.get_logger()
+
+DEFAULT_FLUSH_INTERVAL = 1.0
+
+
+def _dumps(message: Dict) -> str:
+    '''Serialises a message with the fastest available JSON encoder.'''
+    if orjson is not None:
+        return orjson.dumps(message).decode()
+    return json.dumps(message)
+
+
+def format_time_extracted(time_extracted: datetime) -> str:
+    '''Formats a RECORD message's time_extracted as singer-python does.'''
+    return singer.utils.strftime(time_extracted.astimezone(timezone.utc))
+
+
+def format_record(stream: str, record: Dict[str, Any], version: Optional[int] = None,
+                  time_extracted: Optional[str] = None) -> str:
+    '''Serialises a RECORD message into a line, given its already formatted time_extracted.'''
+    message: Dict[str, Any] = {"type": "RECORD", "stream": stream, "record": record}
+    if version is not None:
+        message["version"] = version
+    if time_extracted:
+        message["time_extracted"] = time_extracted
+    return _dumps(message) + "\n"
+
+
+class MessageWriter:
+    '''Writes Singer messages to stdout.
+
+    By default every message is serialised by singer-python and flushed
+    as soon as it is written. With a positive buffer_size, RECORD messages
+    are serialised with a faster encoder into a buffer that is flushed once
+    it holds buffer_size characters or flush_interval seconds have passed.
+    The buffer is always flushed before any other message type is written,
+    so SCHEMA, STATE and ACTIVATE_VERSION messages keep their ordering
+    relative to records. Writes are serialised with a lock, so a single
+    writer can be shared by streams running on several threads.
+    '''
+
+    def __init__(self, buffer_size: int = 0, flush_interval: float = DEFAULT_FLUSH_INTERVAL, output=None):
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.output = output
+        self.record_count = 0
+        self._buffer: List[str] = []
+        self._buffered_chars = 0
+        self._last_flush = time.monotonic()
+        self._started_at: Optional[float] = None
+        self._time_extracted_strs: Dict[datetime, str] = {}
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_config(cls, config: Dict) -> "MessageWriter":
+        '''Builds a writer from the `output_buffer_size`
+        and `output_flush_interval` config values.
+        '''
+        return cls(buffer_size=int(config.get("output_buffer_size", 0)),
+                   flush_interval=float(config.get("output_flush_interval", DEFAULT_FLUSH_INTERVAL)))
+
+    @property
+    def _output(self):
+        return self.output or sys.stdout
+
+    def _format_time_extracted(self, time_extracted: datetime) -> str:
+        try:
+            return self._time_extracted_strs[time_extracted]
+        except KeyError:
+            formatted = format_time_extracted(time_extracted)
+            self._time_extracted_strs[time_extracted] = formatted
+            return formatted
+
+    def _write_line(self, line: str):
+        output = self._output
+        output.write(line)
+        output.flush()
+
+    def write_record(self, stream: str, record: Dict[str, Any], version: Optional[int] = None,
+                     time_extracted: Optional[datetime] = None):
+        '''Writes a RECORD message.'''
+        if self.buffer_size <= 0:
+            with self._lock:
+                self._count_record()
+                self._write_line(singer.format_message(singer.RecordMessage(stream=stream,
+                                                                            record=record,
+                                                                            version=version,
+                                                                            time_extracted=time_extracted)) + "\n")
+            return
+
+        line = format_record(stream, record, version=version,
+                             time_extracted=self._format_time_extracted(time_extracted) if time_extracted else None)
+        self.write_lines([line])
+
+    def write_lines(self, lines: List[str]):
+        '''Writes RECORD messages already serialised by format_record,
+        buffering them like any other record when buffer_size is positive.
+        '''
+        with self._lock:
+            self._count_record(len(lines))
+            if self.buffer_size <= 0:
+                self._write_line("".join(lines))
+                return
+            self._buffer.extend(lines)
+            self._buffered_chars += sum(len(line) for line in lines)
+            if self._buffered_chars >= self.buffer_size or time.monotonic() - self._last_flush >= self.flush_interval:
+                self.flush()
+
+    def write_message(self, message: singer.Message):
+        '''Flushes any buffered records, then writes a message.'''
+        if isinstance(message, singer.RecordMessage):
+            return self.write_record(stream=message.stream,
+                                     record=message.record,
+                                     version=message.version,
+                                     time_extracted=message.time_extracted)
+        with self._lock:
+            self.flush()
+            self._write_line(singer.format_message(message) + "\n")
+
+    def write_schema(self, stream: str, schema: Dict, key_properties, bookmark_properties=None):
+        '''Writes a SCHEMA message.'''
+        if isinstance(key_properties, (str, bytes)):
+            key_properties = [key_properties]
+        self.write_message(singer.SchemaMessage(stream=stream,
+                                                schema=schema,
+                                                key_properties=key_properties,
+                                                bookmark_properties=bookmark_properties))
+
+    def write_state(self, value: Dict):
+        '''Writes a STATE message.'''
+        self.write_message(singer.StateMessage(value=value))
+
+    def write_version(self, stream: str, version: int):
+        '''Writes an ACTIVATE_VERSION message.'''
+        self.write_message(singer.ActivateVersionMessage(stream=stream, version=version))
+
+    def _count_record(self, count: int = 1):
+        if self._started_at is None:
+            self._started_at = time.monotonic()
+        self.record_count += count
+
+    def flush(self):
+        '''Writes out any buffered records.'''
+        with self._lock:
+            if self._buffer:
+                self._write_line("".join(self._buffer))
+                self._buffer = []
+                self._buffered_chars = 0
+            self._last_flush = time.monotonic()
+
+    def close(self):
+        '''Flushes any buffered records and logs the record throughput.'''
+        self.flush()
+        if self._started_at is not None:
+            elapsed = time.monotonic() - self._started_at
+            rate = self.record_count / elapsed if elapsed > 0 else float(self.record_count)
+            LOGGER.info(f"Wrote {self.record_count} records in {elapsed:.2f} seconds ({rate:.0f} records/second).")
@@ -1,12 +1,22 @@
 import argparse
 import json
+from datetime import date
 
+import intuitlib.client
 import pytest
+from intuitlib.client import AuthClient
 
+import tap_quickbooks_report.auth
+import tap_quickbooks_report.ratelimit
 from tap_quickbooks_report.streams import (ProfitAndLossDetailStream,
                                            ProfitAndLossStream)
 
 
+def read_messages(output):
+    '''Parses the Singer messages written to stdout.'''
+    return [json.loads(line) for line in output.splitlines() if line]
+
+
 @pytest.fixture(scope='function')
 def config(shared_datadir):
     with open(shared_datadir / 'test.config.json') as f:
@@ -18,6 +28,7 @@ def args(config, shared_datadir):
     args = argparse.Namespace()
     setattr(args, 'config', config)
     setattr(args, 'config_path', shared_datadir / 'test.config.json')
+    setattr(args, 'state', {})
     return args
 
 
@@ -25,3 +36,70 @@ def args(config, shared_datadir):
 def client(config, args, shared_datadir, request):
     return request.param(config=config,
                          args=args)
+
+
+@pytest.fixture(scope='function')
+def profit_and_loss_report(shared_datadir):
+    with open(shared_datadir / 'profit_and_loss.json') as f:
+        return json.load(f)
+
+
+@pytest.fixture(scope='function')
+def profit_and_loss_detail_report(shared_datadir):
+    with open(shared_datadir / 'profit_and_loss_detail.json') as f:
+        return json.load(f)
+
+
+@pytest.fixture(scope='function')
+def auth_client():
+    return argparse.Namespace(realm_id='123456', access_token='access-token')
+
+
+@pytest.fixture(scope='function')
+def sync(auth_client, monkeypatch, capsys):
+    '''Syncs a stream against a canned report for the given
+    period and returns the Singer messages it wrote.
+    '''
+    def sync(stream, report, period=(date(2020, 1, 1), date(2020, 1, 31))):
+        monkeypatch.setattr(stream, "_get_auth_client", lambda: auth_client)
+        monkeypatch.setattr(stream, "_get_report_period", lambda: period)
+        monkeypatch.setattr(stream, "_get", lambda auth_client, report_entity, params: report)
+        stream.write_schema_message()
+        stream.sync()
+        stream.write_version_message()
+        return read_messages(capsys.readouterr().out)
+    return sync
+
+
+@pytest.fixture(scope='function')
+def refreshes(monkeypatch):
+    calls = []
+
+    def fake_refresh(self, refresh_token=None):
+        calls.append(self.realm_id)
+        self.access_token = f"access-token-{len(calls)}"
+        self.refresh_token = "rotated-refresh-token"
+        self.expires_in = 3600
+        self.x_refresh_token_expires_in = 8726400
+
+    monkeypatch.setattr(AuthClient, "refresh", fake_refresh)
+    monkeypatch.setattr(intuitlib.client, "get_discovery_doc", lambda environment, session=None: {
+        "authorization_endpoint": "https://appcenter.intuit.com/connect/oauth2",
+        "token_endpoint": "https://oauth.platform.intuit.com/oauth2/v1/tokens/bearer",
+        "revocation_endpoint": "https://developer.api.intuit.com/v2/oauth2/tokens/revoke",
+        "issuer": "https://oauth.platform.intuit.com/op/v1",
+        "jwks_uri": "https://oauth.platform.intuit.com/op/v1/jwks",
+        "userinfo_endpoint": "https://accounts.platform.intuit.com/v1/openid_connect/userinfo"
+    })
+    return calls
+
+
+@pytest.fixture(autouse=True)
+def token_caches(monkeypatch):
+    monkeypatch.setattr(tap_quickbooks_report.auth, "_TOKEN_CACHES", {})
+
+
+@pytest.fixture(autouse=True)
+def throttles(monkeypatch):
+    monkeypatch.setattr(tap_quickbooks_report.ratelimit, "_THROTTLES", {})
+    monkeypatch.setattr(tap_quickbooks_report.ratelimit, "_GLOBAL_RATE_LIMITER", None)
@@ -0,0 +1,38 @@
+import json
+import os
+
+from tap_quickbooks_report.auth import TokenCache, get_token_cache
+from tap_quickbooks_report.streams import (ProfitAndLossDetailStream,
+                                           ProfitAndLossStream)
+
+
+def test_streams_share_cached_access_token(config, args, refreshes, tmp_path):
+    config["token_cache_path"] = str(tmp_path / "tokens.json")
+
+    first = ProfitAndLossStream(config=config, args=args)._get_auth_client()
+    second = ProfitAndLossDetailStream(config=config, args=args)._get_auth_client()
+
+    assert refreshes == ["123456"]
+    assert first.access_token == second.access_token == "access-token-1"
+    with open(args.config_path) as f:
+        assert json.load(f)["refresh_token"] == "rotated-refresh-token"
+
+
+def test_token_cache_persists_between_runs(tmp_path):
+    path = str(tmp_path / "tokens.json")
+    TokenCache(path).set_access_token("123456", "access-token", 3600)
+
+    assert TokenCache(path).get_access_token("123456") == "access-token"
+    assert TokenCache(path).get_access_token("654321") is None
+    assert os.stat(path).st_mode & 0o777 == 0o600
+
+
+def test_token_cache_ignores_expiring_tokens(tmp_path):
+    cache = TokenCache()
+    cache.set_access_token("123456", "access-token", 60)
+    assert cache.get_access_token("123456") is None
+
+
+def test_get_token_cache_is_shared(tmp_path):
+    path = str(tmp_path / "tokens.json")
+    assert get_token_cache(path) is get_token_cache(path)
@@ -0,0 +1,41 @@
+import copy
+
+from benchmarks.generate import generate_profit_and_loss_detail
+from benchmarks.run import check_regressions, main, run
+from tap_quickbooks_report.streams import ProfitAndLossDetailStream
+
+
+def test_generate_profit_and_loss_detail(config, args):
+    report = generate_profit_and_loss_detail(rows=10, depth=3, sections=2)
+    stream = ProfitAndLossDetailStream(config=config, args=args)
+    records = list(stream._get_records(stream._get_column_metadata(report), stream._get_rows(report)))
+
+    assert len(records) == 10
+    assert all(len(record["Categories"]) == 3 for record in records)
+
+
+def test_run_benchmarks():
+    results = run(detail_rows=20, rows=10, depth=2, months=3, sections=2, repeat=1)
+
+    assert results["scenarios"]["profit_and_loss"]["records"] == 3
+    assert results["scenarios"]["profit_and_loss_detail"]["records"] == 20
+    assert set(results["scenarios"]["profit_and_loss_detail"]["stages"]) == {"fetch", "flatten", "emit"}
+    assert check_regressions(results, results) == []
+
+    baseline = copy.deepcopy(results)
+    baseline["scenarios"]["profit_and_loss_detail"]["records_per_second"] = \
+        results["scenarios"]["profit_and_loss_detail"]["records_per_second"] * 2
+    assert len(check_regressions(results, baseline)) == 1
+
+    baseline["scenarios"]["profit_and_loss_detail"]["records_per_second"] = None
+    assert check_regressions(results, baseline) == []
+
+
+def test_main_fails_without_a_baseline(tmp_path, monkeypatch):
+    monkeypatch.setattr("benchmarks.run.run", lambda **kwargs: {"parameters": {}, "scenarios": {}})
+    monkeypatch.setattr("logging.disable", lambda level: None)
+    baseline = str(tmp_path / "baseline.json")
+
+    assert main(["--baseline", baseline]) == 1
+    assert main(["--baseline", baseline, "--save-baseline"]) == 0
+    assert main(["--baseline", baseline]) == 0
@@ -0,0 +1,100 @@
+import hashlib
+import io
+import os
+import time
+
+import pytest
+import responses
+from conftest import read_messages
+
+from tap_quickbooks_report.cache import ResponseCache
+from tap_quickbooks_report.state import State
+from tap_quickbooks_report.streams import (ProfitAndLossDetailStream,
+                                           ProfitAndLossStream)
+
+
+def test_response_cache_round_trip(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    key = cache.make_key("123456", "ProfitAndLoss", {"start_date": "2020-01-01", "end_date": "2020-01-31"})
+    assert key == cache.make_key("123456", "ProfitAndLoss", {"end_date": "2020-01-31", "start_date": "2020-01-01"})
+    assert key != cache.make_key("654321", "ProfitAndLoss", {"start_date": "2020-01-01", "end_date": "2020-01-31"})
+    assert cache.get(key) is None
+
+    entry = cache.put(key, io.BytesIO(b'{"Rows": {}}'))
+    assert cache.get(key) == entry
+    assert cache.is_fresh(entry)
+    with cache.open(entry) as body:
+        assert body.read() == b'{"Rows": {}}'
+    assert cache.put(key, io.BytesIO(b'{"Rows": {}}')).content_hash == entry.content_hash
+    assert cache.put(key, io.BytesIO(b'{"Rows": {"Row": []}}')).content_hash != entry.content_hash
+
+    expired = ResponseCache(str(tmp_path), ttl=0)
+    assert not expired.is_fresh(expired.get(key))
+
+
+def test_response_cache_keeps_entries_consistent_when_a_put_is_interrupted(tmp_path, monkeypatch):
+    cache = ResponseCache(str(tmp_path))
+    entry = cache.put("a", io.BytesIO(b'{"Rows": {}}'))
+
+    def crash(path, data, mode=None):
+        raise KeyboardInterrupt()
+
+    monkeypatch.setattr("tap_quickbooks_report.cache.write_json_atomic", crash)
+    with pytest.raises(KeyboardInterrupt):
+        cache.put("a", io.BytesIO(b'{"Rows": {"Row": []}}'))
+
+    assert cache.get("a") == entry
+    with cache.open(entry) as body:
+        assert hashlib.sha256(body.read()).hexdigest() == entry.content_hash
+
+
+def test_response_cache_evicts_least_recently_used(tmp_path):
+    cache = ResponseCache(str(tmp_path), max_bytes=10 ** 9)
+    entries = [cache.put(key, io.BytesIO(os.urandom(1000))) for key in ("a", "b", "c")]
+    for age, entry in zip((30, 20, 10), entries):
+        os.utime(entry.path, (time.time() - age, time.time() - age))
+    cache.open(entries[0]).close()
+
+    cache.max_bytes = 2500
+    cache.evict()
+
+    assert cache.get("a") is not None
+    assert cache.get("b") is None
+    assert cache.get("c") is not None
+
+
+@responses.activate
+def test_get_serves_fresh_cached_reports(config, args, auth_client, profit_and_loss_report, tmp_path):
+    config["cache_path"] = str(tmp_path)
+    responses.add(responses.GET,
+                  f"{ProfitAndLossStream.base_url}/v3/company/123456/reports/ProfitAndLoss",
+                  json=profit_and_loss_report)
+    params = {"start_date": "2020-01-01", "end_date": "2020-01-31"}
+
+    first = ProfitAndLossStream(config=config, args=args)._get(auth_client, "ProfitAndLoss", params=dict(params))
+    second = ProfitAndLossStream(config=config, args=args)._get(auth_client, "ProfitAndLoss", params=dict(params))
+
+    assert first == second == profit_and_loss_report
+    assert len(responses.calls) == 1
+
+
+@responses.activate
+def test_profit_and_loss_detail_skips_unchanged_windows(config, args, auth_client, profit_and_loss_detail_report,
+                                                        monkeypatch, capsys, tmp_path):
+    config.update({"cache_path": str(tmp_path), "cache_ttl": 0, "cache_skip_unchanged": True,
+                   "replication_method": "INCREMENTAL"})
+    responses.add(responses.GET,
+                  f"{ProfitAndLossDetailStream.base_url}/v3/company/123456/reports/ProfitAndLossDetail",
+                  json=profit_and_loss_detail_report)
+
+    record_counts = []
+    for _ in range(2):
+        stream = ProfitAndLossDetailStream(config=config, args=args, state=State())
+        monkeypatch.setattr(stream, "_get_auth_client", lambda: auth_client)
+        stream.sync()
+        messages = read_messages(capsys.readouterr().out)
+        record_counts.append(len([message for message in messages if message["type"] == "RECORD"]))
+        assert messages[-1]["type"] == "STATE"
+
+    assert len(responses.calls) == 2
+    assert record_counts == [3, 0]
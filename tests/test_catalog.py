@@ -0,0 +1,87 @@
+import argparse
+
+from conftest import read_messages
+from singer import metadata
+
+from tap_quickbooks_report import sync
+from tap_quickbooks_report.catalog import discover, get_selected_streams
+from tap_quickbooks_report.streams import (ProfitAndLossDetailStream,
+                                           ProfitAndLossStream,
+                                           QuickbooksStream)
+
+
+def select(catalog, tap_stream_id, properties=None):
+    for entry in catalog["streams"]:
+        mdata = metadata.to_map(entry["metadata"])
+        mdata = metadata.write(mdata, (), "selected", entry["tap_stream_id"] == tap_stream_id)
+        if entry["tap_stream_id"] == tap_stream_id and properties is not None:
+            for name in entry["schema"]["properties"]:
+                mdata = metadata.write(mdata, ("properties", name), "selected", name in properties)
+        entry["metadata"] = metadata.to_list(mdata)
+    return catalog
+
+
+def test_discover(config):
+    catalog = discover(config)
+    entries = {entry["tap_stream_id"]: entry for entry in catalog["streams"]}
+
+    assert set(entries) == {"profit_and_loss", "profit_and_loss_detail", "balance_sheet",
+                            "cash_flow", "general_ledger", "transaction_list"}
+    assert entries["profit_and_loss"]["key_properties"] == ["StartDate"]
+    mdata = metadata.to_map(entries["profit_and_loss_detail"]["metadata"])
+    assert metadata.get(mdata, (), "selected-by-default") is True
+    assert metadata.get(mdata, ("properties", "SyncTimestampUtc"), "inclusion") == "automatic"
+    assert metadata.get(mdata, ("properties", "Memo"), "inclusion") == "available"
+    assert metadata.get(metadata.to_map(entries["general_ledger"]["metadata"]), (), "selected-by-default") is False
+    assert metadata.get(mdata, (), "forced-replication-method") is None
+    assert metadata.get(metadata.to_map(entries["profit_and_loss"]["metadata"]), (), "forced-replication-method") == "FULL_TABLE"
+
+    selected_streams = get_selected_streams(catalog)
+    assert [stream_class for stream_class, _ in selected_streams] == [ProfitAndLossStream, ProfitAndLossDetailStream]
+    assert selected_streams[1][1] == list(entries["profit_and_loss_detail"]["schema"]["properties"])
+
+
+def test_discover_incremental_keys(config):
+    config["replication_method"] = "INCREMENTAL"
+    entries = {entry["tap_stream_id"]: entry for entry in discover(config)["streams"]}
+
+    assert entries["profit_and_loss_detail"]["key_properties"] == ["RowId"]
+    assert entries["profit_and_loss"]["key_properties"] == ["StartDate"]
+    mdata = metadata.to_map(entries["profit_and_loss_detail"]["metadata"])
+    assert metadata.get(mdata, ("properties", "RowId"), "inclusion") == "automatic"
+    assert metadata.get(mdata, ("properties", "TransactionType"), "inclusion") == "automatic"
+
+
+def test_get_selected_streams(config):
+    catalog = select(discover(config), "profit_and_loss_detail", properties=["Date", "Amount"])
+    selected_streams = get_selected_streams(catalog)
+
+    assert len(selected_streams) == 1
+    stream_class, selected_properties = selected_streams[0]
+    assert stream_class is ProfitAndLossDetailStream
+    assert selected_properties == ["Date", "Amount", "SyncTimestampUtc", "RealmId"]
+
+
+def test_sync_selected_properties(config, args, profit_and_loss_detail_report, monkeypatch, capsys):
+    args.catalog = select(discover(config), "profit_and_loss_detail", properties=["Date", "Name", "Amount"])
+    requested = []
+
+    def fake_get(self, auth_client, report_entity, params):
+        requested.append((report_entity, params.get("columns")))
+        return profit_and_loss_detail_report
+
+    monkeypatch.setattr(QuickbooksStream, "_get_auth_client",
+                        lambda self: argparse.Namespace(realm_id=self.config["realm_id"], access_token="token"))
+    monkeypatch.setattr(QuickbooksStream, "_get", fake_get)
+
+    sync(config, args)
+
+    messages = read_messages(capsys.readouterr().out)
+    schemas = [message for message in messages if message["type"] == "SCHEMA"]
+    records = [message["record"] for message in messages if message["type"] == "RECORD"]
+    assert requested == [("ProfitAndLossDetail", "tx_date,name,subt_nat_amount")]
+    assert [schema["stream"] for schema in schemas] == ["profit_and_loss_detail"]
+    assert set(schemas[0]["schema"]["properties"]) == {"Date", "Name", "Amount", "SyncTimestampUtc", "RealmId"}
+    assert len(records) == 3
+    assert all(set(record) <= {"Date", "Name", "Amount", "SyncTimestampUtc"} for record in records)
+    assert records[0]["Amount"] == 120.5
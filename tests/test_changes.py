@@ -0,0 +1,135 @@
+import copy
+from datetime import date
+
+import pytest
+from singer import metadata
+
+from tap_quickbooks_report.catalog import discover
+from tap_quickbooks_report.changes import ChangeIndex
+from tap_quickbooks_report.state import State
+from tap_quickbooks_report.streams import ProfitAndLossDetailStream
+
+WINDOW = (date(2020, 1, 1), date(2020, 1, 31))
+
+
+def detail_stream(config, args, state=None, version=1):
+    stream = ProfitAndLossDetailStream(config=config, args=args, version=version)
+    stream.state = State(state, writer=stream.writer)
+    return stream
+
+
+def get_state(messages):
+    return [message["value"] for message in messages if message["type"] == "STATE"][-1]
+
+
+def test_change_capture(config, args, profit_and_loss_detail_report, sync, tmp_path):
+    config["change_capture_path"] = str(tmp_path)
+
+    messages = sync(detail_stream(config, args), profit_and_loss_detail_report)
+    assert messages[0]["key_properties"] == ["RowId"]
+    first_records = [message["record"] for message in messages if message["type"] == "RECORD"]
+    assert [record["TransactionId"] for record in first_records] == ["101", "102", "201"]
+    assert len({record["RowId"] for record in first_records}) == 3
+    assert "ACTIVATE_VERSION" not in [message["type"] for message in messages]
+
+    state = get_state(messages)
+    assert state["bookmarks"]["profit_and_loss_detail"]["123456"]["change_index"] == {"2020-01-01": "1"}
+    assert (tmp_path / "profit_and_loss_detail" / "123456" / "2020-01-01" / "1.json").exists()
+
+    messages = sync(detail_stream(config, args, state=state, version=2), profit_and_loss_detail_report)
+    assert [message for message in messages if message["type"] == "RECORD"] == []
+    state = get_state(messages)
+
+    report = copy.deepcopy(profit_and_loss_detail_report)
+    income = report["Rows"]["Row"][0]["Rows"]["Row"][0]["Rows"]["Row"]
+    income[0]["ColData"][6]["value"] = "125.00"
+    del income[1]
+    messages = sync(detail_stream(config, args, state=state, version=3), report)
+    records = [message["record"] for message in messages if message["type"] == "RECORD"]
+    assert len(records) == 2
+    assert records[0]["RowId"] == first_records[0]["RowId"]
+    assert records[0]["Amount"] == 125.0
+    assert records[1]["RowId"] == first_records[1]["RowId"]
+    assert "_sdc_deleted_at" in records[1]
+    assert sorted(path.name for path in (tmp_path / "profit_and_loss_detail" / "123456" / "2020-01-01").iterdir()) == ["2.json", "3.json"]
+
+
+def test_change_capture_ignores_running_balances(config, args, profit_and_loss_detail_report, sync, tmp_path):
+    config["change_capture_path"] = str(tmp_path)
+    state = get_state(sync(detail_stream(config, args), profit_and_loss_detail_report))
+
+    report = copy.deepcopy(profit_and_loss_detail_report)
+    income = report["Rows"]["Row"][0]["Rows"]["Row"][0]["Rows"]["Row"]
+    backdated = copy.deepcopy(income[0])
+    backdated["ColData"][0]["value"] = "2020-01-02"
+    backdated["ColData"][1]["id"] = "100"
+    backdated["ColData"][6]["value"] = backdated["ColData"][7]["value"] = "10.00"
+    income.insert(0, backdated)
+    # Every later row of the account now has a higher running balance.
+    income[1]["ColData"][7]["value"] = "130.50"
+    income[2]["ColData"][7]["value"] = "210.00"
+    messages = sync(detail_stream(config, args, state=state, version=2), report)
+
+    records = [message["record"] for message in messages if message["type"] == "RECORD"]
+    assert [record["TransactionId"] for record in records] == ["100"]
+
+
+def test_change_capture_uses_monthly_windows(config, args, profit_and_loss_detail_report, sync, tmp_path):
+    config.update({"change_capture_path": str(tmp_path), "date_window_months": 3})
+    index_path = tmp_path / "profit_and_loss_detail" / "123456"
+    messages = sync(detail_stream(config, args), profit_and_loss_detail_report,
+                    period=(date(2019, 12, 1), date(2020, 1, 20)))
+    assert sorted(path.name for path in index_path.iterdir()) == ["2019-12-01", "2020-01-01"]
+
+    # A month later the rolling report period starts a month later too.
+    messages = sync(detail_stream(config, args, state=get_state(messages), version=2), profit_and_loss_detail_report,
+                    period=(date(2020, 1, 1), date(2020, 2, 20)))
+    records = [message["record"] for message in messages if message["type"] == "RECORD"]
+    assert len(records) == 3
+    assert all("_sdc_deleted_at" not in record for record in records)
+    assert sorted(path.name for path in index_path.iterdir()) == ["2020-01-01", "2020-02-01"]
+    assert set(get_state(messages)["bookmarks"]["profit_and_loss_detail"]["123456"]["change_index"]) == {
+        "2020-01-01", "2020-02-01"
+    }
+
+
+def test_change_capture_resends_unconfirmed_changes(config, args, profit_and_loss_detail_report, sync, tmp_path):
+    config["change_capture_path"] = str(tmp_path)
+    state = get_state(sync(detail_stream(config, args), profit_and_loss_detail_report))
+
+    report = copy.deepcopy(profit_and_loss_detail_report)
+    report["Rows"]["Row"][0]["Rows"]["Row"][0]["Rows"]["Row"][0]["ColData"][6]["value"] = "125.00"
+    # The target failed to load this run, so its state is never passed back.
+    sync(detail_stream(config, args, state=state, version=2), report)
+
+    messages = sync(detail_stream(config, args, state=state, version=3), report)
+    records = [message["record"] for message in messages if message["type"] == "RECORD"]
+    assert [record["Amount"] for record in records] == [125.0]
+
+
+def test_change_index_ignores_longer_windows(tmp_path):
+    index = ChangeIndex(str(tmp_path))
+    index.save(WINDOW, "1", {"a": "b"})
+
+    assert index.load(WINDOW, "1") == {"a": "b"}
+    assert index.load(WINDOW, "2") is None
+    assert index.load(WINDOW, None) is None
+    assert index.load((date(2020, 1, 1), date(2020, 2, 29)), "1") == {"a": "b"}
+    assert index.load((date(2020, 1, 1), date(2020, 1, 15)), "1") is None
+    assert index.load((date(2020, 2, 1), date(2020, 2, 29)), "1") is None
+
+
+def test_change_capture_catalog(config):
+    config["change_capture_path"] = "changes"
+    stream = next(stream for stream in discover(config)["streams"] if stream["tap_stream_id"] == "profit_and_loss_detail")
+
+    assert stream["key_properties"] == ["RowId"]
+    assert "_sdc_deleted_at" in stream["schema"]["properties"]
+    mdata = metadata.to_map(stream["metadata"])
+    assert metadata.get(mdata, ("properties", "TransactionType"), "inclusion") == "automatic"
+
+
+def test_change_capture_rejects_parquet(config, args, tmp_path):
+    config.update({"change_capture_path": str(tmp_path), "output_format": "parquet", "output_dir": str(tmp_path)})
+    with pytest.raises(ValueError):
+        ProfitAndLossDetailStream(config=config, args=args)
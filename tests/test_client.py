@@ -1,8 +1,21 @@
+import copy
+import json
+import sys
+import time
+from datetime import date
+
 import pytest
 import requests
+import responses
+from conftest import read_messages
 from singer.schema import Schema
 
-from tap_quickbooks_report.streams import is_fatal_code
+from tap_quickbooks_report.state import State
+from tap_quickbooks_report.streams import (BalanceSheetStream,
+                                           GeneralLedgerStream,
+                                           ProfitAndLossDetailStream,
+                                           ProfitAndLossStream, build_session,
+                                           get_report_streams, is_fatal_code)
 
 
 @pytest.mark.parametrize('status_code', [400, 401, 403, 404,
@@ -21,3 +34,303 @@ def test_load_schema(client):
     schema = client._load_schema()
     assert isinstance(schema, dict)
     assert Schema.from_dict(schema)
+
+
+def test_profit_and_loss_detail_windows_are_ordered(config, args, auth_client, profit_and_loss_detail_report, monkeypatch, capsys):
+    config["date_window_months"] = 1
+    stream = ProfitAndLossDetailStream(config=config, args=args)
+    monkeypatch.setattr(stream, "_get_auth_client", lambda: auth_client)
+    monkeypatch.setattr(stream, "_get_report_period", lambda: (date(2019, 11, 1), date(2020, 1, 31)))
+    requested = []
+
+    def fake_get(auth_client, report_entity, params):
+        requested.append(params["start_date"])
+        # Later windows return first to exercise out-of-order completion.
+        time.sleep(0.02 * (3 - len(requested)))
+        report = copy.deepcopy(profit_and_loss_detail_report)
+        report_text = json.dumps(report).replace("2020-01-", params["start_date"][:8])
+        return json.loads(report_text)
+
+    monkeypatch.setattr(stream, "_get", fake_get)
+    stream.sync()
+    stream.write_version_message()
+
+    messages = read_messages(capsys.readouterr().out)
+    records = [message["record"] for message in messages if message["type"] == "RECORD"]
+    assert sorted(requested) == ["2019-11-01", "2019-12-01", "2020-01-01"]
+    assert len(records) == 9
+    assert [record["Date"] for record in records] == sorted(record["Date"] for record in records)
+    assert records[0]["Categories"] == ["Ordinary Income/Expenses", "Income"]
+    assert records[0]["Amount"] == 120.5
+    assert messages[-1]["type"] == "ACTIVATE_VERSION"
+
+
+@responses.activate
+def test_profit_and_loss_detail_streaming_matches_decoded(config, args, auth_client, profit_and_loss_detail_report, monkeypatch, capsys):
+    pytest.importorskip("ijson")
+    responses.add(responses.GET,
+                  f"{ProfitAndLossDetailStream.base_url}/v3/company/123456/reports/ProfitAndLossDetail",
+                  json=profit_and_loss_detail_report)
+    outputs = []
+    for stream_responses in (False, True):
+        config["stream_responses"] = stream_responses
+        stream = ProfitAndLossDetailStream(config=config, args=args)
+        monkeypatch.setattr(stream, "_get_auth_client", lambda: auth_client)
+        stream.sync()
+        records = [message["record"] for message in read_messages(capsys.readouterr().out) if message["type"] == "RECORD"]
+        for record in records:
+            record.pop("SyncTimestampUtc")
+        outputs.append(records)
+
+    assert len(outputs[0]) == 3
+    assert outputs[0] == outputs[1]
+
+
+def test_streamed_windows_are_fetched_one_after_another(config, args):
+    config.update({"stream_responses": True, "max_workers": 4})
+    stream = ProfitAndLossDetailStream(config=config, args=args)
+    windows = [(date(2020, 1, 1), date(2020, 1, 31)), (date(2020, 2, 1), date(2020, 2, 29))]
+    fetched = []
+
+    fetched_windows = stream._fetch_windows(windows, lambda window: fetched.append(window) or window)
+    assert next(fetched_windows) == (windows[0], windows[0])
+    assert fetched == windows[:1]
+    assert list(fetched_windows) == [(windows[1], windows[1])]
+
+
+def test_profit_and_loss_detail_rows_share_categories(config, args, profit_and_loss_detail_report):
+    stream = ProfitAndLossDetailStream(config=config, args=args)
+    rows = list(stream._get_rows(profit_and_loss_detail_report))
+
+    assert [row[-2] for row in rows] == [["Ordinary Income/Expenses", "Income"],
+                                         ["Ordinary Income/Expenses", "Income"],
+                                         ["Ordinary Income/Expenses", "Expenses", "Rent"]]
+    assert rows[0][-2] is rows[1][-2]
+    assert [row[-1] for row in rows] == ["101", "102", "201"]
+
+
+def test_profit_and_loss_detail_rows_deeply_nested(config, args):
+    stream = ProfitAndLossDetailStream(config=config, args=args)
+    depth = sys.getrecursionlimit() + 100
+    row = {"ColData": [{"value": "2020-01-01"}], "type": "Data"}
+    for level in range(depth):
+        row = {"Header": {"ColData": [{"value": f"Account {level}"}]}, "Rows": {"Row": [row]}, "type": "Section"}
+
+    rows = list(stream._get_rows({"Rows": {"Row": [row]}}))
+
+    assert len(rows) == 1
+    assert len(rows[0][-2]) == depth
+    assert rows[0][-2][0] == f"Account {depth - 1}"
+
+
+def test_profit_and_loss_report_data(config, args, auth_client, profit_and_loss_report, monkeypatch, capsys):
+    stream = ProfitAndLossStream(config=config, args=args)
+    monkeypatch.setattr(stream, "_get_auth_client", lambda: auth_client)
+    monkeypatch.setattr(stream, "_get", lambda auth_client, report_entity, params: profit_and_loss_report)
+    stream.sync()
+
+    records = [message["record"] for message in read_messages(capsys.readouterr().out) if message["type"] == "RECORD"]
+    assert [record["ColKey"] for record in records] == ["Jan 2020", "Feb 2020"]
+    assert records[0]["ReportData"] == {
+        "Income": {"Lines": [{"SalesOfProductIncome": {"Lines": [], "Total": 120.5}},
+                             {"Services": {"Lines": [], "Total": 0.0}}],
+                   "Total": 120.5},
+        "GrossProfit": {"Lines": [], "Total": 120.5},
+        "Expenses": {"Lines": [{"OfficeExpenses": {"Lines": [{"RentOrLease": {"Lines": [], "Total": 50.0}}],
+                                                   "Total": 50.0}}],
+                     "Total": 50.0},
+        "NetIncome": {"Lines": [], "Total": 70.5}
+    }
+    assert records[1]["ReportData"]["Income"]["Lines"][1] == {"Services": {"Lines": [], "Total": 25.0}}
+    assert records[1]["ReportData"]["NetIncome"]["Total"] == 55.0
+
+
+@responses.activate
+def test_request_waits_out_long_retry_after(config, args, auth_client, profit_and_loss_report, monkeypatch):
+    url = f"{ProfitAndLossStream.base_url}/v3/company/123456/reports/ProfitAndLoss"
+    responses.add(responses.GET, url, status=429, headers={"Retry-After": "300"})
+    responses.add(responses.GET, url, status=429, headers={"Retry-After": "300"})
+    responses.add(responses.GET, url, json=profit_and_loss_report)
+    sleeps = []
+    monkeypatch.setattr(time, "sleep", sleeps.append)
+    stream = ProfitAndLossStream(config=config, args=args)
+
+    assert stream._get(auth_client, "ProfitAndLoss", params={"start_date": "2020-01-01"}) == profit_and_loss_report
+    assert len(responses.calls) == 3
+    # Only the Retry-After waits, without a backoff wait on top.
+    assert sleeps == [pytest.approx(300, abs=1)] * 2
+
+
+@responses.activate
+def test_get_uses_pooled_session(config, args, auth_client, profit_and_loss_report):
+    responses.add(responses.GET,
+                  f"{ProfitAndLossStream.base_url}/v3/company/123456/reports/ProfitAndLoss",
+                  json=profit_and_loss_report)
+    config["http_pool_size"] = 2
+    config["max_workers"] = 6
+    session = build_session(config)
+    stream = ProfitAndLossStream(config=config, args=args, session=session)
+
+    assert stream._get(auth_client, "ProfitAndLoss", params={"start_date": "2020-01-01"}) == profit_and_loss_report
+    assert session.get_adapter(ProfitAndLossStream.base_url)._pool_maxsize == 6
+    request = responses.calls[0].request
+    assert request.headers["Authorization"] == "Bearer access-token"
+    assert request.headers["Accept-Encoding"] == "gzip, deflate"
+    assert request.headers["User-Agent"].startswith("python-quickbooks-reporting-tap/")
+    assert "minorversion=40" in request.url
+
+
+def test_profit_and_loss_detail_incremental(config, args, auth_client, profit_and_loss_detail_report, monkeypatch, capsys):
+    config.update({"replication_method": "INCREMENTAL", "lookback_months": 1, "date_window_months": 1})
+    args.state = {"bookmarks": {"profit_and_loss_detail": {"123456": {"end_date": "2020-01-15"}}}}
+    stream = ProfitAndLossDetailStream(config=config, args=args, state=State(args.state))
+    monkeypatch.setattr(stream, "_get_auth_client", lambda: auth_client)
+    monkeypatch.setattr(stream, "_get_report_period", lambda: (date(2019, 2, 1), date(2020, 2, 10)))
+    requested = []
+
+    def fake_get(auth_client, report_entity, params):
+        requested.append((params["start_date"], params["end_date"]))
+        return profit_and_loss_detail_report
+
+    monkeypatch.setattr(stream, "_get", fake_get)
+    stream.sync()
+    stream.write_version_message()
+
+    messages = read_messages(capsys.readouterr().out)
+    assert requested == [("2019-12-01", "2019-12-31"), ("2020-01-01", "2020-01-31"), ("2020-02-01", "2020-02-10")]
+    assert [message["type"] for message in messages] == ["RECORD"] * 3 + ["STATE"] + ["RECORD"] * 3 + ["STATE"] + ["RECORD"] * 3 + ["STATE"]
+    assert messages[3]["value"]["bookmarks"]["profit_and_loss_detail"]["123456"]["end_date"] == "2019-12-31"
+    assert messages[-1]["value"]["bookmarks"]["profit_and_loss_detail"]["123456"]["end_date"] == "2020-02-10"
+    assert "version" not in messages[0]
+
+
+def test_profit_and_loss_detail_incremental_resends_keyed_rows(config, args, auth_client, profit_and_loss_detail_report,
+                                                               monkeypatch, capsys):
+    config.update({"replication_method": "INCREMENTAL", "lookback_months": 1, "date_window_months": 1})
+    state = {"bookmarks": {"profit_and_loss_detail": {"123456": {"end_date": "2020-01-15"}}}}
+    runs = []
+    for _ in range(2):
+        stream = ProfitAndLossDetailStream(config=config, args=args, state=State(state))
+        monkeypatch.setattr(stream, "_get_auth_client", lambda: auth_client)
+        monkeypatch.setattr(stream, "_get_report_period", lambda: (date(2019, 2, 1), date(2020, 2, 10)))
+        monkeypatch.setattr(stream, "_get", lambda auth_client, report_entity, params: profit_and_loss_detail_report)
+        stream.write_schema_message()
+        stream.sync()
+        messages = read_messages(capsys.readouterr().out)
+        state = messages[-1]["value"]
+        runs.append(messages)
+
+    for messages in runs:
+        assert messages[0]["type"] == "SCHEMA"
+        assert messages[0]["key_properties"] == ["RowId"]
+        assert "RowId" in messages[0]["schema"]["properties"]
+    first = [message["record"] for message in runs[0] if message["type"] == "RECORD"]
+    second = [message["record"] for message in runs[1] if message["type"] == "RECORD"]
+    # The second run re-fetches January and February, which the first run wrote after December.
+    assert len(first) == 9 and len(second) == 6
+    assert [record["RowId"] for record in second] == [record["RowId"] for record in first[3:]]
+    assert all(record["RowId"] and record["TransactionType"] for record in second)
+    assert len({record["RowId"] for record in second[:3]}) == 3
+
+
+def test_profit_and_loss_detail_incremental_without_bookmark(config, args, monkeypatch):
+    config["replication_method"] = "INCREMENTAL"
+    stream = ProfitAndLossDetailStream(config=config, args=args)
+    monkeypatch.setattr(stream, "_get_report_period", lambda: (date(2019, 2, 1), date(2020, 2, 10)))
+    assert stream._get_sync_period() == (date(2019, 2, 1), date(2020, 2, 10))
+
+    config["replication_method"] = "LOG_BASED"
+    with pytest.raises(ValueError):
+        stream._get_sync_period()
+
+
+def test_profit_and_loss_detail_backfill_resumes(config, args, auth_client, profit_and_loss_detail_report, monkeypatch, capsys):
+    config["replication_method"] = "INCREMENTAL"
+    args.backfill = (date(2015, 1, 1), date(2015, 4, 30))
+    requested = []
+    failing = {"2015-03-01"}
+
+    def fake_get(auth_client, report_entity, params):
+        requested.append(params["start_date"])
+        if params["start_date"] in failing:
+            raise requests.exceptions.ConnectionError()
+        return profit_and_loss_detail_report
+
+    state = State()
+    stream = ProfitAndLossDetailStream(config=config, args=args, state=state)
+    monkeypatch.setattr(stream, "_get_auth_client", lambda: auth_client)
+    monkeypatch.setattr(stream, "_get", fake_get)
+    with pytest.raises(requests.exceptions.ConnectionError):
+        stream.sync()
+    assert state.get_bookmark("profit_and_loss_detail", "123456", "backfill")["completed_through"] == "2015-02-28"
+
+    requested.clear()
+    failing.clear()
+    stream = ProfitAndLossDetailStream(config=config, args=args, state=State(state.value))
+    monkeypatch.setattr(stream, "_get_auth_client", lambda: auth_client)
+    monkeypatch.setattr(stream, "_get", fake_get)
+    stream.sync()
+    stream.write_version_message()
+
+    messages = read_messages(capsys.readouterr().out)
+    assert sorted(requested) == ["2015-03-01", "2015-04-01"]
+    assert messages[-1]["value"]["bookmarks"]["profit_and_loss_detail"]["123456"]["backfill"] == {
+        "start_date": "2015-01-01", "end_date": "2015-04-30", "completed_through": "2015-04-30"
+    }
+    assert not any(message["type"] == "ACTIVATE_VERSION" for message in messages)
+    assert not any("version" in message for message in messages if message["type"] == "RECORD")
+    assert all(message["record"]["RowId"] for message in messages if message["type"] == "RECORD")
+
+
+@pytest.mark.parametrize("options", [{}, {"output_format": "parquet", "output_dir": "out"}])
+def test_full_table_backfill_is_rejected(config, args, options):
+    config.update(options)
+    args.backfill = (date(2015, 1, 1), date(2015, 4, 30))
+    with pytest.raises(ValueError):
+        ProfitAndLossDetailStream(config=config, args=args)
+    if options:
+        with pytest.raises(ValueError):
+            ProfitAndLossStream(config=config, args=args)
+    else:
+        ProfitAndLossStream(config=config, args=args)
+
+
+def test_get_report_streams(config):
+    assert get_report_streams(config) == [ProfitAndLossStream, ProfitAndLossDetailStream]
+
+    config["reports"] = ["balance_sheet", "general_ledger"]
+    assert get_report_streams(config) == [BalanceSheetStream, GeneralLedgerStream]
+
+    config["reports"] = ["balance_sheet", "trial_balance"]
+    with pytest.raises(ValueError):
+        get_report_streams(config)
+
+
+def test_general_ledger_skips_label_rows(config, args):
+    stream = GeneralLedgerStream(config=config, args=args)
+    columns = ["Date", "TransactionType", "Num", "Name", "Memo", "Split", "Amount", "Balance", "Categories"]
+    rows = [
+        ["Beginning Balance", "", "", "", "", "", "", "100.00", ["Checking"]],
+        ["2020-01-03", "Deposit", "", "Acme Grocers", "", "Sales", "20.00", "120.00", ["Checking"]]
+    ]
+
+    assert list(stream._get_records(columns, rows)) == [{
+        "Date": "2020-01-03", "TransactionType": "Deposit", "Name": "Acme Grocers", "Split": "Sales",
+        "Amount": 20.0, "Balance": 120.0, "Categories": ["Checking"]
+    }]
+
+
+def test_detail_rows_are_compact(config, args, profit_and_loss_detail_report):
+    stream = ProfitAndLossDetailStream(config=config, args=args)
+    columns = stream._get_column_metadata(profit_and_loss_detail_report)
+    rows = list(stream._get_detail_rows(columns, stream._get_rows(profit_and_loss_detail_report)))
+    # A second copy of the report has its own category lists.
+    rows += stream._get_detail_rows(columns, stream._get_rows(copy.deepcopy(profit_and_loss_detail_report)))
+
+    assert all(isinstance(row, tuple) for row in rows)
+    assert rows[0]._fields == tuple(column for column in columns if column in stream.schema["properties"])
+    assert isinstance(rows[0][rows[0]._fields.index("Amount")], float)
+    assert rows[0].to_dict() == list(stream._get_records(columns, stream._get_rows(profit_and_loss_detail_report)))[0]
+
+    categories = rows[0][rows[0]._fields.index("Categories")]
+    assert rows[len(rows) // 2][rows[0]._fields.index("Categories")] is categories
@@ -0,0 +1,68 @@
+import json
+from datetime import date, datetime, timezone
+
+import pyarrow.parquet
+import pytest
+
+from tap_quickbooks_report.streams import (ProfitAndLossDetailStream,
+                                           ProfitAndLossStream)
+
+
+def test_profit_and_loss_detail_parquet_files(config, args, profit_and_loss_detail_report, sync, tmp_path):
+    config.update({"output_format": "parquet", "output_dir": str(tmp_path), "date_window_months": 1, "parquet_batch_size": 2})
+    stream = ProfitAndLossDetailStream(config=config, args=args)
+
+    assert sync(stream, profit_and_loss_detail_report, period=(date(2019, 12, 1), date(2020, 1, 31))) == []
+    directory = tmp_path / "profit_and_loss_detail" / "123456"
+    assert sorted(path.name for path in directory.iterdir()) == ["2019-12-01.parquet", "2020-01-01.parquet"]
+
+    parquet_file = pyarrow.parquet.ParquetFile(directory / "2020-01-01.parquet")
+    assert parquet_file.metadata.num_rows == 3
+    assert parquet_file.metadata.num_row_groups == 2
+    columns = {parquet_file.metadata.schema.column(i).path: i for i in range(parquet_file.metadata.num_columns)}
+    assert "RLE_DICTIONARY" in parquet_file.metadata.row_group(0).column(columns["Categories.list.element"]).encodings
+    assert "RLE_DICTIONARY" not in parquet_file.metadata.row_group(0).column(columns["Memo"]).encodings
+
+    table = parquet_file.read()
+    assert str(table.schema.field("Date").type) == "timestamp[us, tz=UTC]"
+    assert str(table.schema.field("Amount").type) == "double"
+    record = table.to_pylist()[0]
+    assert record["Date"] == datetime(2020, 1, 3, tzinfo=timezone.utc)
+    assert record["Amount"] == 120.5
+    assert record["Categories"] == ["Ordinary Income/Expenses", "Income"]
+
+
+def test_profit_and_loss_parquet_report_data(config, args, profit_and_loss_report, sync, tmp_path):
+    config.update({"output_format": "parquet", "output_dir": str(tmp_path)})
+    stream = ProfitAndLossStream(config=config, args=args)
+    sync(stream, profit_and_loss_report, period=(date(2019, 1, 1), date(2019, 12, 31)))
+
+    table = pyarrow.parquet.read_table(tmp_path / "profit_and_loss" / "123456" / "2019-01-01.parquet")
+    records = table.to_pylist()
+    assert len(records) == len(stream._get_records(profit_and_loss_report))
+    assert isinstance(json.loads(records[0]["ReportData"]), dict)
+
+
+@pytest.mark.parametrize("replication_method", ["FULL_TABLE", "INCREMENTAL"])
+def test_parquet_reruns_replace_files(config, args, profit_and_loss_detail_report, sync, tmp_path, replication_method):
+    config.update({"output_format": "parquet", "output_dir": str(tmp_path), "replication_method": replication_method})
+    state = {}
+    for period in [(date(2019, 1, 1), date(2020, 1, 15)), (date(2019, 1, 1), date(2020, 1, 16)),
+                   (date(2019, 2, 1), date(2020, 2, 1))]:
+        stream = ProfitAndLossDetailStream(config=config, args=args)
+        stream.state.value = state
+        sync(stream, profit_and_loss_detail_report, period=period)
+        state = stream.state.value
+
+    file_names = sorted(path.name for path in (tmp_path / "profit_and_loss_detail" / "123456").iterdir())
+    if replication_method == "FULL_TABLE":
+        assert file_names == ["2019-02-01.parquet"]
+    else:
+        # Incremental runs rewrite the months they fetch again, one file per month.
+        assert file_names == [f"{year}-{month:02}-01.parquet" for year, month in [(2019, m) for m in range(1, 13)] + [(2020, 1), (2020, 2)]]
+
+
+def test_parquet_requires_output_dir(config, args):
+    config["output_format"] = "parquet"
+    with pytest.raises(ValueError):
+        ProfitAndLossDetailStream(config=config, args=args)
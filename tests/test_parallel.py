@@ -0,0 +1,40 @@
+import pytest
+
+from tap_quickbooks_report.parallel import TransformPool, split_sections
+from tap_quickbooks_report.streams import ProfitAndLossDetailStream
+
+
+@pytest.mark.parametrize("section_rows", [1, 2, 100])
+def test_split_sections_keeps_row_order(config, args, profit_and_loss_detail_report, section_rows):
+    stream = ProfitAndLossDetailStream(config=config, args=args)
+    row_array = profit_and_loss_detail_report["Rows"]["Row"]
+
+    batches = list(split_sections(row_array, section_rows))
+    rows = [row for batch in batches for row_slice, categories in batch
+            for row in stream._iter_rows(row_slice, 1, categories)]
+    assert rows == list(stream._iter_rows(row_array, 1))
+    assert all(sum(len(row_slice) for row_slice, _ in batch) <= section_rows for batch in batches)
+
+
+def test_sync_with_transform_processes(config, args, profit_and_loss_detail_report, sync):
+    config["realms"] = [{"realm_id": "123456", "refresh_token": "foobar"}]
+    serial_stream = ProfitAndLossDetailStream(config=config, args=args)
+    expected = sync(serial_stream, profit_and_loss_detail_report)
+
+    transform_pool = TransformPool(2, section_rows=1)
+    try:
+        stream = ProfitAndLossDetailStream(config=config, args=args, transform_pool=transform_pool,
+                                           version=serial_stream.version)
+        stream.sync_started_at = serial_stream.sync_started_at
+        messages = sync(stream, profit_and_loss_detail_report)
+    finally:
+        transform_pool.close()
+
+    assert len([message for message in messages if message["type"] == "RECORD"]) == 3
+    assert messages == expected
+
+
+def test_transform_processes_rejects_stream_responses(config, args):
+    config.update({"transform_processes": 2, "stream_responses": True})
+    with pytest.raises(ValueError):
+        ProfitAndLossDetailStream(config=config, args=args)
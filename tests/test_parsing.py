@@ -0,0 +1,25 @@
+import io
+import json
+
+import pytest
+
+from tap_quickbooks_report.parsing import parse_report
+from tap_quickbooks_report.streams import ProfitAndLossDetailStream
+
+pytest.importorskip("ijson")
+
+
+def test_parse_report_matches_decoded_rows(config, args, profit_and_loss_detail_report):
+    stream = ProfitAndLossDetailStream(config=config, args=args)
+    body = io.BytesIO(json.dumps(profit_and_loss_detail_report).encode())
+
+    columns, rows = parse_report(body, stream.id_column)
+
+    assert columns == profit_and_loss_detail_report["Columns"]
+    assert list(rows) == list(stream._get_rows(profit_and_loss_detail_report))
+
+
+def test_parse_report_requires_columns():
+    body = io.BytesIO(json.dumps({"Rows": {"Row": []}}).encode())
+    with pytest.raises(ValueError):
+        parse_report(body)
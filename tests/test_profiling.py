@@ -0,0 +1,66 @@
+import json
+
+import responses
+
+from tap_quickbooks_report import sync
+from tap_quickbooks_report.auth import CachedAuthClient
+from tap_quickbooks_report.profiling import Profiler
+from tap_quickbooks_report.streams import (ProfitAndLossDetailStream,
+                                           QuickbooksStream, record_backoff)
+
+
+def test_disabled_profiler_records_nothing():
+    profiler = Profiler()
+    with profiler.stage("profit_and_loss", "http"):
+        pass
+    assert list(profiler.iter_stage("profit_and_loss", "flatten", [1, 2])) == [1, 2]
+    profiler.increment("profit_and_loss", "retries")
+
+    assert profiler.get_profile()["streams"] == {}
+
+
+def test_profiler_stages_and_counters(tmp_path):
+    profiler = Profiler(enabled=True)
+    with profiler.stage("profit_and_loss", "http"):
+        pass
+    assert list(profiler.iter_stage("profit_and_loss", "flatten", [1, 2, 3])) == [1, 2, 3]
+    profiler.increment("profit_and_loss", "bytes_downloaded", 1024)
+    profiler.write_profile(str(tmp_path / "profile.json"))
+
+    with open(tmp_path / "profile.json") as f:
+        profile = json.load(f)
+    stats = profile["streams"]["profit_and_loss"]
+    assert stats["stages"]["http"]["calls"] == 1
+    assert stats["stages"]["flatten"]["calls"] == 3
+    assert stats["counters"] == {"bytes_downloaded": 1024}
+    assert profile["peak_rss_mb"] > 0
+
+
+def test_record_backoff(config, args):
+    stream = ProfitAndLossDetailStream(config=config, args=args, profiler=Profiler(enabled=True))
+    record_backoff({"args": (stream,), "wait": 1.5, "tries": 1})
+    record_backoff({"args": (stream,), "wait": 2.5, "tries": 2})
+
+    assert stream.profiler.get_profile()["streams"]["profit_and_loss_detail"]["counters"] == {
+        "retries": 2, "backoff_seconds": 4.0
+    }
+
+
+@responses.activate
+def test_sync_writes_profile(config, args, profit_and_loss_report, profit_and_loss_detail_report, monkeypatch, capsys, tmp_path):
+    config["profile_path"] = str(tmp_path / "profile.json")
+    for entity, report in (("ProfitAndLoss", profit_and_loss_report), ("ProfitAndLossDetail", profit_and_loss_detail_report)):
+        responses.add(responses.GET, f"{QuickbooksStream.base_url}/v3/company/123456/reports/{entity}", json=report)
+    monkeypatch.setattr(QuickbooksStream, "_get_auth_client",
+                        lambda self: CachedAuthClient(realm_id=self.config["realm_id"], access_token="token"))
+
+    sync(config, args)
+
+    with open(tmp_path / "profile.json") as f:
+        profile = json.load(f)
+    for stream in ("profit_and_loss", "profit_and_loss_detail"):
+        stats = profile["streams"][stream]
+        assert set(stats["stages"]) == {"auth", "http", "decode", "flatten", "transform", "write"}
+        assert stats["counters"]["bytes_downloaded"] > 0
+    assert profile["streams"]["profit_and_loss_detail"]["stages"]["write"]["calls"] == 3
+    assert "stage_duration" in capsys.readouterr().err
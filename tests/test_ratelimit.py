@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+import requests
+
+from tap_quickbooks_report.ratelimit import (ConcurrencyLimiter, RateLimiter,
+                                             get_realm_throttle,
+                                             get_retry_after,
+                                             get_throttle_stats)
+
+
+def make_response(status_code, headers=None):
+    response = requests.models.Response()
+    response.status_code = status_code
+    response.headers.update(headers or {})
+    return response
+
+
+def test_rate_limiter_allows_burst_then_waits():
+    limiter = RateLimiter(rate=20, capacity=2)
+    assert limiter.acquire() == 0
+    assert limiter.acquire() == 0
+    assert limiter.acquire() == pytest.approx(0.05, abs=0.02)
+    assert limiter.waits == 1
+
+
+def test_rate_limiter_pause():
+    limiter = RateLimiter(rate=1000)
+    limiter.pause(0.05)
+    assert limiter.acquire() == pytest.approx(0.05, abs=0.02)
+
+
+def test_concurrency_limiter_aimd():
+    limiter = ConcurrencyLimiter(max_limit=8)
+    limiter.acquire()
+    limiter.release(throttled=True)
+    limiter.acquire()
+    limiter.release(throttled=True)
+    assert int(limiter.limit) == 2
+    for _ in range(5):
+        limiter.acquire()
+        limiter.release()
+    assert int(limiter.limit) == 3
+    assert limiter.in_flight == 0
+
+
+def test_limiters_can_be_awaited():
+    limiter = ConcurrencyLimiter(max_limit=1)
+    rate_limiter = RateLimiter(rate=20, capacity=1)
+
+    async def run():
+        await limiter.acquire_async()
+        waiter = asyncio.ensure_future(limiter.acquire_async())
+        await asyncio.sleep(0.02)
+        assert not waiter.done()
+        limiter.release()
+        assert await waiter == pytest.approx(0.02, abs=0.02)
+        assert await rate_limiter.acquire_async() == 0
+        assert await rate_limiter.acquire_async() == pytest.approx(0.05, abs=0.02)
+
+    asyncio.run(run())
+    assert limiter.in_flight == 1
+    assert limiter.waits == 1
+
+
+@pytest.mark.parametrize('headers,expected', [
+    ({}, None),
+    ({"Retry-After": "7"}, 7.0),
+    ({"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"}, 0.0),
+    ({"Retry-After": "soon"}, None)
+])
+def test_get_retry_after(headers, expected):
+    assert get_retry_after(make_response(429, headers)) == expected
+
+
+def test_realm_throttle_backs_off_on_429():
+    throttle = get_realm_throttle("111", {"realm_max_concurrency": 4})
+    assert get_realm_throttle("111", {}) is throttle
+    assert get_realm_throttle("222", {}) is not throttle
+
+    throttle.acquire()
+    throttle.release(make_response(429, {"Retry-After": "0.05"}))
+    assert throttle.acquire() == pytest.approx(0.05, abs=0.02)
+    throttle.release(make_response(200))
+
+    stats = get_throttle_stats()["111"]
+    assert stats["throttled_responses"] == 1
+    assert stats["throttled_waits"] == 1
+    assert stats["concurrency_limit"] == 2
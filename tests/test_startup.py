@@ -0,0 +1,32 @@
+import json
+import subprocess
+import sys
+
+# Generous enough for a loaded CI machine; importing the tap takes
+# roughly a third of this on a developer laptop.
+COLD_START_BUDGET_SECONDS = 1.5
+
+LAZY_MODULES = ["rollbar", "intuitlib.client", "intuitlib.enums", "jose", "webbrowser", "pyarrow", "aiohttp", "multiprocessing"]
+
+PROBE = f'''
+import json, sys, time
+started_at = time.perf_counter()
+import tap_quickbooks_report
+seconds = time.perf_counter() - started_at
+print(json.dumps({{"seconds": seconds, "loaded": [m for m in {LAZY_MODULES!r} if m in sys.modules]}}))
+'''
+
+
+def _cold_start():
+    output = subprocess.run([sys.executable, "-c", PROBE], check=True, stdout=subprocess.PIPE).stdout
+    return json.loads(output)
+
+
+def test_import_skips_auth_and_rollbar_modules():
+    assert _cold_start()["loaded"] == []
+
+
+def test_cold_start_within_budget():
+    # The fastest of a few runs, to discount a cold disk cache.
+    seconds = min(_cold_start()["seconds"] for _ in range(3))
+    assert seconds < COLD_START_BUDGET_SECONDS
@@ -0,0 +1,91 @@
+import argparse
+import threading
+
+from conftest import read_messages
+
+from tap_quickbooks_report import sync
+from tap_quickbooks_report.streams import QuickbooksStream
+
+
+def test_sync_multiple_realms(config, args, profit_and_loss_report, profit_and_loss_detail_report, monkeypatch, capsys):
+    config["realms"] = [
+        {"realm_id": "111", "refresh_token": "foo", "refresh_token_expires_at": "2020-01-31 23:41:44 UTC"},
+        {"realm_id": "222", "refresh_token": "bar", "refresh_token_expires_at": "2020-01-31 23:41:44 UTC"}
+    ]
+    reports = {"ProfitAndLoss": profit_and_loss_report, "ProfitAndLossDetail": profit_and_loss_detail_report}
+    monkeypatch.setattr(QuickbooksStream, "_get_auth_client",
+                        lambda self: argparse.Namespace(realm_id=self.config["realm_id"], access_token="token"))
+    monkeypatch.setattr(QuickbooksStream, "_get", lambda self, auth_client, report_entity, params: reports[report_entity])
+
+    sync(config, args)
+
+    messages = read_messages(capsys.readouterr().out)
+    schemas = {message["stream"]: message for message in messages if message["type"] == "SCHEMA"}
+    records = [message for message in messages if message["type"] == "RECORD"]
+    versions = [message for message in messages if message["type"] == "ACTIVATE_VERSION"]
+
+    assert [message["type"] for message in messages[:2]] == ["SCHEMA", "SCHEMA"]
+    assert schemas["profit_and_loss"]["key_properties"] == ["RealmId", "StartDate"]
+    assert schemas["profit_and_loss_detail"]["key_properties"] == []
+    assert {(record["stream"], record["record"]["RealmId"]) for record in records} == {
+        ("profit_and_loss", "111"), ("profit_and_loss", "222"),
+        ("profit_and_loss_detail", "111"), ("profit_and_loss_detail", "222")
+    }
+    assert len(records) == 10
+    assert len(versions) == 1
+    assert messages[-1] == versions[0]
+    assert {record["version"] for record in records if record["stream"] == "profit_and_loss_detail"} == {versions[0]["version"]}
+
+
+def test_sync_single_realm_omits_realm_id(config, args, profit_and_loss_report, profit_and_loss_detail_report, monkeypatch, capsys):
+    reports = {"ProfitAndLoss": profit_and_loss_report, "ProfitAndLossDetail": profit_and_loss_detail_report}
+    monkeypatch.setattr(QuickbooksStream, "_get_auth_client",
+                        lambda self: argparse.Namespace(realm_id=self.config["realm_id"], access_token="token"))
+    monkeypatch.setattr(QuickbooksStream, "_get", lambda self, auth_client, report_entity, params: reports[report_entity])
+
+    sync(config, args)
+
+    messages = read_messages(capsys.readouterr().out)
+    assert [message["key_properties"] for message in messages if message["type"] == "SCHEMA"] == [["StartDate"], []]
+    assert not any("RealmId" in message["record"] for message in messages if message["type"] == "RECORD")
+
+
+def test_sync_configured_reports(config, args, profit_and_loss_report, monkeypatch, capsys):
+    config["reports"] = ["balance_sheet", "cash_flow"]
+    requested = []
+
+    def fake_get(self, auth_client, report_entity, params):
+        requested.append(report_entity)
+        return profit_and_loss_report
+
+    monkeypatch.setattr(QuickbooksStream, "_get_auth_client",
+                        lambda self: argparse.Namespace(realm_id=self.config["realm_id"], access_token="token"))
+    monkeypatch.setattr(QuickbooksStream, "_get", fake_get)
+
+    sync(config, args)
+
+    messages = read_messages(capsys.readouterr().out)
+    assert sorted(requested) == ["BalanceSheet", "CashFlow"]
+    assert [message["stream"] for message in messages if message["type"] == "SCHEMA"] == ["balance_sheet", "cash_flow"]
+    assert {message["stream"] for message in messages if message["type"] == "RECORD"} == {"balance_sheet", "cash_flow"}
+
+
+def test_sync_streams_concurrently(config, args, profit_and_loss_report, profit_and_loss_detail_report, monkeypatch, capsys):
+    config["output_buffer_size"] = 100
+    reports = {"ProfitAndLoss": profit_and_loss_report, "ProfitAndLossDetail": profit_and_loss_detail_report}
+    # Each fetch waits for the other, so the sync only finishes if both streams run at once.
+    barrier = threading.Barrier(2, timeout=5)
+
+    def fake_get(self, auth_client, report_entity, params):
+        barrier.wait()
+        return reports[report_entity]
+
+    monkeypatch.setattr(QuickbooksStream, "_get_auth_client",
+                        lambda self: argparse.Namespace(realm_id=self.config["realm_id"], access_token="token"))
+    monkeypatch.setattr(QuickbooksStream, "_get", fake_get)
+
+    sync(config, args)
+
+    messages = read_messages(capsys.readouterr().out)
+    assert [message["type"] for message in messages[:2]] == ["SCHEMA", "SCHEMA"]
+    assert len([message for message in messages if message["type"] == "RECORD"]) == 5
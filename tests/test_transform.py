@@ -0,0 +1,21 @@
+import singer
+
+from tap_quickbooks_report.streams import ProfitAndLossDetailStream
+from tap_quickbooks_report.transform import Transformer
+
+
+def test_transformer_matches_singer_transformer(config, args, profit_and_loss_detail_report):
+    stream = ProfitAndLossDetailStream(config=config, args=args)
+    columns = stream._get_column_metadata(profit_and_loss_detail_report)
+    records = list(stream._get_records(columns, stream._get_rows(profit_and_loss_detail_report)))
+    for record in records:
+        record["SyncTimestampUtc"] = "2020-02-01T00:00:00Z"
+
+    with singer.Transformer() as transformer:
+        expected = [transformer.transform(data=record, schema=stream.schema) for record in records]
+    with Transformer() as transformer:
+        actual = [transformer.transform(data=record, schema=stream.schema) for record in records]
+        assert len(transformer._datetime_cache) == 4
+
+    assert actual == expected
+    assert actual[0]["Date"] == "2020-01-03T00:00:00.000000Z"
@@ -0,0 +1,77 @@
+from datetime import date
+
+import pytest
+from conftest import read_messages
+
+import tap_quickbooks_report.transport
+from benchmarks.server import DISCOVERY_PATH, ReportServer
+from tap_quickbooks_report import sync
+from tap_quickbooks_report.profiling import Profiler
+from tap_quickbooks_report.streams import (ProfitAndLossDetailStream,
+                                           QuickbooksStream)
+
+aiohttp = pytest.importorskip("aiohttp")
+
+
+@pytest.fixture
+def server(profit_and_loss_detail_report, monkeypatch):
+    with ReportServer({"ProfitAndLossDetail": profit_and_loss_detail_report}, delay=0.05,
+                      token={"access_token": "access-token", "refresh_token": "foobar",
+                             "expires_in": 3600, "x_refresh_token_expires_in": 8726400}) as server:
+        monkeypatch.setattr(QuickbooksStream, "base_url", server.base_url)
+        monkeypatch.setattr(tap_quickbooks_report.transport, "DISCOVERY_URL", {"production": server.base_url + DISCOVERY_PATH})
+        yield server
+
+
+def test_sync_with_asyncio_engine(config, args, server, monkeypatch, capsys):
+    config.update({"http_engine": "asyncio", "async_max_concurrency": 2, "max_workers": 4,
+                   "date_window_months": 1, "reports": ["profit_and_loss_detail"]})
+    monkeypatch.setattr(QuickbooksStream, "_get_report_period", lambda self: (date(2019, 10, 1), date(2020, 1, 31)))
+
+    sync(config, args)
+
+    messages = read_messages(capsys.readouterr().out)
+    assert len([message for message in messages if message["type"] == "RECORD"]) == 12
+    assert server.request_count == 4
+    assert server.max_in_flight == 2
+    assert server.token_requests == ["grant_type=refresh_token&refresh_token=foobar"]
+
+
+def test_asyncio_engine_fetches_beyond_thread_limits(config, args, server, monkeypatch, capsys):
+    config.update({"http_engine": "asyncio", "async_max_concurrency": 8, "max_workers": 1,
+                   "max_concurrent_realms": 1, "date_window_months": 1, "reports": ["profit_and_loss_detail"],
+                   "realms": [{"realm_id": realm_id, "refresh_token": "foobar", "refresh_token_expires_at": "2020-01-31 23:41:44 UTC"}
+                              for realm_id in ["111", "222"]]})
+    monkeypatch.setattr(QuickbooksStream, "_get_report_period", lambda self: (date(2019, 10, 1), date(2020, 1, 31)))
+
+    sync(config, args)
+
+    messages = read_messages(capsys.readouterr().out)
+    assert len([message for message in messages if message["type"] == "RECORD"]) == 24
+    assert server.request_count == 8
+    # The first realm's four windows, plus the prefetched first window of the second realm.
+    assert server.max_in_flight == 5
+
+
+@pytest.mark.parametrize("option", ["stream_responses", "cache_path"])
+def test_asyncio_engine_rejects_requests_only_options(config, args, option, tmp_path):
+    config.update({"http_engine": "asyncio", option: True if option == "stream_responses" else str(tmp_path)})
+    with pytest.raises(ValueError):
+        ProfitAndLossDetailStream(config=config, args=args, transport=None)
+
+
+def test_asyncio_engine_retries(config, args, server, profit_and_loss_detail_report):
+    config["http_engine"] = "asyncio"
+    stream = ProfitAndLossDetailStream(config=config, args=args, profiler=Profiler(enabled=True))
+    auth_client = stream._get_auth_client()
+    try:
+        server.failures["ProfitAndLossDetail"] = [503]
+        assert stream._get(auth_client, "ProfitAndLossDetail", {"start_date": "2020-01-01"}) == profit_and_loss_detail_report
+        assert stream.profiler.get_profile()["streams"]["profit_and_loss_detail"]["counters"]["retries"] == 1
+
+        server.failures["ProfitAndLossDetail"] = [400]
+        with pytest.raises(aiohttp.ClientResponseError):
+            stream._get(auth_client, "ProfitAndLossDetail", {"start_date": "2020-01-01"})
+        assert server.request_count == 3
+    finally:
+        stream.transport.close()
@@ -0,0 +1,68 @@
+import json
+import sys
+from datetime import date
+
+import pytest
+
+from tap_quickbooks_report.utils import (generate_date_windows,
+                                         get_realm_configs, parse_args,
+                                         update_config)
+
+
+def test_generate_date_windows_single_window():
+    assert generate_date_windows(date(2019, 2, 1), date(2020, 1, 15)) == [(date(2019, 2, 1), date(2020, 1, 15))]
+
+
+@pytest.mark.parametrize('months,expected', [
+    (1, [(date(2019, 11, 15), date(2019, 11, 30)),
+         (date(2019, 12, 1), date(2019, 12, 31)),
+         (date(2020, 1, 1), date(2020, 1, 15))]),
+    (2, [(date(2019, 11, 15), date(2019, 12, 31)),
+         (date(2020, 1, 1), date(2020, 1, 15))])
+])
+def test_generate_date_windows_by_month(months, expected):
+    assert generate_date_windows(date(2019, 11, 15), date(2020, 1, 15), months=months) == expected
+
+
+def test_generate_date_windows_empty_range():
+    assert generate_date_windows(date(2020, 1, 2), date(2020, 1, 1), months=1) == []
+
+
+def test_get_realm_configs(config):
+    assert get_realm_configs(config) == [config]
+
+    config["realms"] = [{"realm_id": "111", "refresh_token": "foo", "refresh_token_expires_at": "2020-01-31 23:41:44 UTC"}]
+    realm_configs = get_realm_configs(config)
+    assert len(realm_configs) == 1
+    assert realm_configs[0]["realm_id"] == "111"
+    assert realm_configs[0]["client_id"] == config["client_id"]
+
+    config["realms"].append({"realm_id": "222"})
+    with pytest.raises(Exception):
+        get_realm_configs(config)
+
+
+def test_update_config_realm(config, tmp_path):
+    path = tmp_path / "config.json"
+    config["realms"] = [{"realm_id": "111", "refresh_token": "foo"}, {"realm_id": "222", "refresh_token": "bar"}]
+    path.write_text(json.dumps(config))
+
+    update_config(path, "222", {"refresh_token": "baz"})
+    update_config(path, "123456", {"refresh_token": "qux"})
+
+    updated = json.loads(path.read_text())
+    assert [realm["refresh_token"] for realm in updated["realms"]] == ["foo", "baz"]
+    assert updated["refresh_token"] == "qux"
+
+
+def test_parse_args_backfill(shared_datadir, monkeypatch):
+    config_path = str(shared_datadir / "test.config.json")
+    monkeypatch.setattr(sys, "argv", ["tap-quickbooks-report", "-c", config_path, "--backfill", "2015-01-01", "2019-12-31"])
+    assert parse_args([]).backfill == [date(2015, 1, 1), date(2019, 12, 31)]
+
+    monkeypatch.setattr(sys, "argv", ["tap-quickbooks-report", "-c", config_path])
+    assert parse_args([]).backfill is None
+
+    monkeypatch.setattr(sys, "argv", ["tap-quickbooks-report", "-c", config_path, "--backfill", "2019-12-31", "2015-01-01"])
+    with pytest.raises(SystemExit):
+        parse_args([])
@@ -0,0 +1,59 @@
+import io
+import json
+from datetime import datetime, timezone
+
+import singer
+
+from tap_quickbooks_report.writer import MessageWriter
+
+TIME_EXTRACTED = datetime(2020, 2, 1, tzinfo=timezone.utc)
+
+
+def write_messages(writer):
+    writer.write_schema(stream="report", schema={"type": "object"}, key_properties="Id")
+    for i in range(3):
+        writer.write_record(stream="report", record={"Id": i, "Amount": 1.5}, version=1, time_extracted=TIME_EXTRACTED)
+    writer.write_state({"bookmarks": {"report": {"end_date": "2020-01-31"}}})
+    writer.write_record(stream="report", record={"Id": 3, "Amount": 2.5}, version=1, time_extracted=TIME_EXTRACTED)
+    writer.write_version(stream="report", version=1)
+
+
+def test_unbuffered_writer_matches_singer():
+    output = io.StringIO()
+    write_messages(MessageWriter(output=output))
+    lines = output.getvalue().splitlines()
+
+    assert lines[1] == singer.format_message(singer.RecordMessage(stream="report",
+                                                                  record={"Id": 0, "Amount": 1.5},
+                                                                  version=1,
+                                                                  time_extracted=TIME_EXTRACTED))
+    assert [json.loads(line)["type"] for line in lines] == ["SCHEMA", "RECORD", "RECORD", "RECORD", "STATE", "RECORD", "ACTIVATE_VERSION"]
+
+
+def test_buffered_writer_flushes_before_other_messages():
+    unbuffered = io.StringIO()
+    write_messages(MessageWriter(output=unbuffered))
+    output = io.StringIO()
+    writer = MessageWriter(buffer_size=1024 * 1024, flush_interval=3600, output=output)
+
+    writer.write_record(stream="report", record={"Id": 0}, time_extracted=TIME_EXTRACTED)
+    assert output.getvalue() == ""
+    writer.write_state({})
+    assert len(output.getvalue().splitlines()) == 2
+
+    output.seek(0)
+    output.truncate()
+    write_messages(writer)
+    writer.close()
+    assert [json.loads(line) for line in output.getvalue().splitlines()] == \
+        [json.loads(line) for line in unbuffered.getvalue().splitlines()]
+    assert writer.record_count == 5
+
+
+def test_buffered_writer_flushes_at_size():
+    output = io.StringIO()
+    writer = MessageWriter(buffer_size=150, flush_interval=3600, output=output)
+    writer.write_record(stream="report", record={"Memo": "x" * 50})
+    assert output.getvalue() == ""
+    writer.write_record(stream="report", record={"Memo": "x" * 50})
+    assert len(output.getvalue().splitlines()) == 2